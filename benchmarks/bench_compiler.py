@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+# Offline micro-benchmark of the SQL compiler. No database is required; queries are compiled
+# against a synthetic schema snapshot.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import shapely.geometry
+
+from publicamundi.data.api import *
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples')
+
+RESOURCE_1 = '97569331-a2fb-45eb-92c9-064ef4f70d38'
+RESOURCE_2 = 'ad815665-ec88-4e81-a27a-8d72cffa7dd2'
+
+def create_resource(name, fields, srid=CRS_DEFAULT_DATABASE):
+    return Resource(
+        id = name,
+        table = name,
+        resource_name = name,
+        package_title = None,
+        package_notes = None,
+        wms = None,
+        wms_server = None,
+        wms_layer = None,
+        geometry_type = None,
+        srid = srid,
+        geometry_column = 'the_geom',
+        fields = dict([(f, Field(f, t)) for f, t in fields + [('the_geom', 'geometry')]]),
+        projections = None
+    )
+
+def create_snapshot(width):
+    resource_1_fields = [('name_eng', 'varchar'), ('city_eng', 'varchar'), ('nisos_eng', 'varchar'), ('dimos_eng', 'varchar'), ('pop', 'int4')]
+    resource_2_fields = [('NOMOS', 'varchar'), ('DESCRIPT', 'varchar'), ('REGION', 'varchar')]
+
+    snapshot = {
+        RESOURCE_1 : create_resource(RESOURCE_1, resource_1_fields),
+        RESOURCE_2 : create_resource(RESOURCE_2, resource_2_fields, 4326)
+    }
+
+    # Wide resources with prefixed field names so that every field is unambiguous
+    for index in range(1, 5):
+        name = 'wide{index}'.format(index = index)
+        fields = [('{name}_attr{field}'.format(name = name, field = f), 'varchar' if f % 2 else 'int4') for f in range(0, width)]
+        snapshot[name] = create_resource(name, fields)
+
+    return snapshot
+
+def load_example(filename):
+    with open(os.path.join(EXAMPLES, filename)) as query_file:
+        return json.load(query_file, cls=ShapelyJsonDecoder, encoding='utf-8')
+
+def create_wide_query(resources, width, filter_count):
+    polygon = shapely.geometry.box(2687295.03, 4368610.00, 2914771.63, 4520261.07)
+
+    fields = []
+    for resource in resources:
+        fields += ['{name}_attr{field}'.format(name = resource, field = f) for f in range(0, width)]
+    fields.append({ 'resource' : resources[0], 'name' : 'the_geom' })
+
+    filters = []
+    for index in range(0, filter_count):
+        resource = resources[index % len(resources)]
+        filters.append({
+            'operator' : OP_GT,
+            'arguments' : [{ 'name' : '{name}_attr{field}'.format(name = resource, field = (index * 2) % width) }, index]
+        })
+        if index % 4 == 0:
+            filters.append({
+                'operator' : OP_INTERSECTS,
+                'arguments' : [{ 'resource' : resource, 'name' : 'the_geom' }, polygon]
+            })
+
+    return {
+        'queue' : [{
+            'resources' : resources,
+            'fields' : fields,
+            'filters' : filters,
+            'sort' : [fields[0]],
+            'limit' : 100
+        }]
+    }
+
+def benchmark(name, query, snapshot, iterations):
+    compiler = QueryCompiler()
+    output_format = query['format'] if 'format' in query else QUERY_FORMAT_GEOJSON
+
+    item = query['queue'][0]
+
+    start_time = time.time()
+    for i in range(0, iterations):
+        compiled = compiler.compile(item, snapshot, CRS_DEFAULT_OUTPUT, output_format)
+    elapsed_time = time.time() - start_time
+
+    print '{name:<32} {rate:>12.1f} {latency:>12.1f} {length:>10}'.format(
+        name = name,
+        rate = iterations / elapsed_time,
+        latency = elapsed_time * 1000000.0 / iterations,
+        length = len(compiled['sql'])
+    )
+
+parser = argparse.ArgumentParser(description='Measures the throughput of the Data API SQL compiler')
+
+parser.add_argument('-iterations', '-n', metavar='N', type=int, help='Number of compilations per query shape', required=False, default=1000)
+parser.add_argument('-width', '-w', metavar='N', type=int, help='Number of fields of synthetic wide resources', required=False, default=100)
+parser.add_argument('-filters', metavar='N', type=int, help='Number of filters of synthetic queries', required=False, default=50)
+
+args = parser.parse_args()
+
+snapshot = create_snapshot(args.width)
+
+shapes = [
+    ('example query1', load_example('query1.json')),
+    ('example query2', load_example('query2.json')),
+    ('wide fields, 1 resource', create_wide_query(['wide1'], args.width, 0)),
+    ('wide fields, 4 resources', create_wide_query(['wide1', 'wide2', 'wide3', 'wide4'], args.width, 0)),
+    ('many filters, 1 resource', create_wide_query(['wide1'], 10, args.filters)),
+    ('many filters, 4 resources', create_wide_query(['wide1', 'wide2', 'wide3', 'wide4'], 10, args.filters)),
+]
+
+print '{name:<32} {rate:>12} {latency:>12} {length:>10}'.format(name = 'shape', rate = 'queries/s', latency = 'us/query', length = 'sql bytes')
+
+for name, query in shapes:
+    benchmark(name, query, snapshot, args.iterations)
+
+sys.exit(0)
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+
+# Offline benchmark of result row decoding. No database is required; synthetic rows shaped like the
+# rows returned by psycopg2 for a compiled query are decoded using the previous dictionary based
+# implementation and the positional implementation of QueryExecutor.
+
+import argparse
+import collections
+import random
+import sys
+import time
+
+import shapely.geometry
+import shapely.wkb
+
+from publicamundi.data.api import *
+
+FIELD_COUNT = 8
+
+def create_fields(count):
+    fields = collections.OrderedDict()
+
+    for index in range(0, count):
+        alias = 'attr{index}'.format(index = index)
+        fields[alias] = {
+            'fullname' : 't1."' + alias + '"',
+            'name' : alias,
+            'alias' : alias,
+            'type' : 'varchar' if index % 2 else 'int4',
+            'is_geom' : False,
+            'srid' : None
+        }
+
+    fields['the_geom'] = {
+        'fullname' : 't1."the_geom"',
+        'name' : 'the_geom',
+        'alias' : 'the_geom',
+        'type' : 'geometry',
+        'is_geom' : True,
+        'srid' : CRS_DEFAULT_OUTPUT
+    }
+
+    return fields
+
+def create_rows(fields, count, vertices):
+    random.seed(0)
+
+    rows = []
+    for index in range(0, count):
+        x = random.uniform(2250000.0, 3250000.0)
+        y = random.uniform(4150000.0, 5050000.0)
+
+        geometry = shapely.geometry.Point(x, y).buffer(100.0, max(vertices / 4, 1))
+
+        row = []
+        for alias in fields:
+            if fields[alias]['is_geom']:
+                row.append(shapely.wkb.dumps(geometry, hex = True))
+            elif fields[alias]['type'] == 'varchar':
+                row.append(u'value {index}'.format(index = index))
+            else:
+                row.append(index)
+
+        rows.append(tuple(row))
+
+    return rows
+
+# Decoding loop used before rows were read positionally. Rows were accessed by column name. Rows
+# are plain dictionaries here, which are faster to access by name than SQLAlchemy rows, hence the
+# measured throughput is an upper bound for the previous implementation
+def decode_rows_by_name(rows, fields, output_format):
+    result = []
+
+    if output_format == QUERY_FORMAT_GEOJSON:
+        feature_id = 0
+        for r in rows:
+            feature_id += 1
+            feature = {
+                'id' : feature_id,
+                'properties': {},
+                'geometry': None,
+                'type': 'Feature'
+            }
+            for field in fields.keys():
+                if fields[field]['is_geom']:
+                    feature['geometry'] = shapely.wkb.loads(r[field].decode("hex"))
+                else:
+                    feature['properties'][field] = r[field]
+            result.append(feature)
+    else:
+        for r in rows:
+            record = {}
+            for field in fields.keys():
+                if fields[field]['is_geom']:
+                    record[field] = shapely.wkb.loads(r[field].decode("hex"))
+                else:
+                    record[field] = r[field]
+            result.append(record)
+
+    return result
+
+# Approximate size of the decoded result excluding geometries, which are identical for both
+# implementations. Shared objects are counted once
+def get_size(obj, seen=None):
+    if seen is None:
+        seen = set()
+
+    if id(obj) in seen or isinstance(obj, shapely.geometry.base.BaseGeometry):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum([get_size(k, seen) + get_size(v, seen) for k, v in obj.items()])
+    elif isinstance(obj, (list, tuple)):
+        size += sum([get_size(v, seen) for v in obj])
+    elif hasattr(obj, '__slots__'):
+        size += sum([get_size(getattr(obj, name), seen) for name in obj.__slots__])
+
+    return size
+
+def benchmark(name, decode, rows, output_format, iterations):
+    start_time = time.time()
+    for i in range(0, iterations):
+        result = decode(rows)
+    decode_time = (time.time() - start_time) / iterations
+
+    start_time = time.time()
+    encoded = ''.join(ShapelyGeoJsonEncoder(encoding='utf-8').iterencode(result))
+    encode_time = time.time() - start_time
+
+    print '{name:<36}{decode:>14.1f}{encode:>14.1f}{size:>14.1f}{encoded:>14}'.format(
+        name = name,
+        decode = len(rows) / decode_time,
+        encode = len(rows) / encode_time,
+        size = get_size(result) / float(len(rows)),
+        encoded = len(encoded)
+    )
+
+parser = argparse.ArgumentParser(description='Measures the throughput and memory usage of result row decoding')
+
+parser.add_argument('-rows', '-n', metavar='N', type=int, help='Number of rows', required=False, default=10000)
+parser.add_argument('-fields', '-f', metavar='N', type=int, help='Number of non geometry fields', required=False, default=FIELD_COUNT)
+parser.add_argument('-vertices', '-v', metavar='N', type=int, help='Approximate number of vertices per geometry', required=False, default=32)
+parser.add_argument('-iterations', '-i', metavar='N', type=int, help='Number of decoding iterations', required=False, default=5)
+
+args = parser.parse_args()
+
+fields = create_fields(args.fields)
+columns = list(fields.keys())
+rows = create_rows(fields, args.rows, args.vertices)
+named_rows = [dict(zip(columns, r)) for r in rows]
+
+executor = QueryExecutor()
+
+print '{name:<36}{decode:>14}{encode:>14}{size:>14}{encoded:>14}'.format(
+    name = 'implementation',
+    decode = 'decoded/s',
+    encode = 'encoded/s',
+    size = 'bytes/row',
+    encoded = 'json bytes'
+)
+
+for output_format in [QUERY_FORMAT_GEOJSON, QUERY_FORMAT_JSON]:
+    benchmark('{format}, by name'.format(format = output_format), lambda r: decode_rows_by_name(named_rows, fields, output_format), rows, output_format, args.iterations)
+    benchmark('{format}, positional'.format(format = output_format), lambda r: executor.decode_rows(r, columns, fields, output_format), rows, output_format, args.iterations)
+
+sys.exit(0)
@@ -0,0 +1,376 @@
+#!/usr/bin/python
+
+# End-to-end throughput benchmark of QueryExecutor. The benchmark either provisions a throwaway
+# PostgreSQL/PostGIS cluster using initdb and pg_ctl, or uses an existing server given by -server.
+# A synthetic CKAN catalog and vector storer tables are seeded and representative queries are
+# executed concurrently. With -replicas, additional clusters are provisioned and the vector storer
+# database is copied to them, so that queries are routed to several local servers.
+
+import argparse
+import copy
+import math
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import shapely.geometry
+
+from sqlalchemy import create_engine
+
+from publicamundi.data.api import *
+
+DATABASE_CATALOG = 'pm_bench_catalog'
+DATABASE_VECTORSTORE = 'pm_bench_vectorstore'
+
+# Extent of the synthetic features in EPSG:3857. Tables store them in EPSG:2100
+EXTENT = (2250000.0, 4150000.0, 3250000.0, 5050000.0)
+
+CATALOG_SCHEMA = """
+    create table package_revision (
+        id text not null,
+        title text,
+        notes text,
+        state text,
+        current boolean,
+        revision_id text,
+        revision_timestamp timestamp default now()
+    );
+    create table resource_group_revision (
+        id text not null,
+        package_id text,
+        state text,
+        current boolean,
+        revision_id text,
+        revision_timestamp timestamp default now()
+    );
+    create table resource_revision (
+        id text not null,
+        name text,
+        format text,
+        extras text,
+        resource_group_id text,
+        state text,
+        current boolean,
+        revision_id text,
+        revision_timestamp timestamp default now()
+    );
+"""
+
+def provision(pgbin, port):
+    directory = tempfile.mkdtemp(prefix='pm-bench-')
+
+    subprocess.check_call([os.path.join(pgbin, 'initdb'), '-D', directory, '-U', 'postgres', '-A', 'trust'], stdout=open(os.devnull, 'w'))
+    subprocess.check_call([os.path.join(pgbin, 'pg_ctl'), '-D', directory, '-w', '-l', os.path.join(directory, 'server.log'),
+                           '-o', '-p {port} -c listen_addresses=localhost -k {directory}'.format(port = port, directory = directory), 'start'],
+                          stdout=open(os.devnull, 'w'))
+
+    return directory, 'postgresql://postgres@localhost:{port}'.format(port = port)
+
+def teardown(pgbin, directory):
+    subprocess.call([os.path.join(pgbin, 'pg_ctl'), '-D', directory, '-w', '-m', 'fast', 'stop'], stdout=open(os.devnull, 'w'))
+    shutil.rmtree(directory, ignore_errors=True)
+
+# Copies the vector storer database of the primary server to a replica server
+def replicate(pgbin, primary, replica):
+    execute_autocommit(replica, 'postgres', [
+        'drop database if exists {name};'.format(name = DATABASE_VECTORSTORE),
+        'create database {name};'.format(name = DATABASE_VECTORSTORE)
+    ])
+
+    dump = subprocess.Popen([os.path.join(pgbin, 'pg_dump'), '-d', '{server}/{database}'.format(server = primary, database = DATABASE_VECTORSTORE)],
+                            stdout=subprocess.PIPE)
+    subprocess.check_call([os.path.join(pgbin, 'psql'), '-q', '-d', '{server}/{database}'.format(server = replica, database = DATABASE_VECTORSTORE)],
+                          stdin=dump.stdout, stdout=open(os.devnull, 'w'))
+    dump.stdout.close()
+    if dump.wait() != 0:
+        raise Exception('Failed to copy the vector storer database to {server}'.format(server = replica))
+
+def execute_autocommit(server, database, statements):
+    engine = create_engine('{server}/{database}'.format(server = server, database = database))
+    connection = engine.raw_connection()
+    try:
+        connection.connection.set_isolation_level(0)
+        cursor = connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+    finally:
+        connection.close()
+        engine.dispose()
+
+def seed(server, resource_count, rows, vertices):
+    execute_autocommit(server, 'postgres', [
+        'drop database if exists {name};'.format(name = DATABASE_CATALOG),
+        'drop database if exists {name};'.format(name = DATABASE_VECTORSTORE),
+        'create database {name};'.format(name = DATABASE_CATALOG),
+        'create database {name};'.format(name = DATABASE_VECTORSTORE)
+    ])
+    execute_autocommit(server, DATABASE_VECTORSTORE, ['create extension postgis;'])
+
+    catalog = create_engine('{server}/{database}'.format(server = server, database = DATABASE_CATALOG))
+    vectorstore = create_engine('{server}/{database}'.format(server = server, database = DATABASE_VECTORSTORE))
+
+    resources = []
+
+    connection = catalog.connect()
+    trans = connection.begin()
+    connection.execute(CATALOG_SCHEMA)
+
+    # Catalog revision history. Every resource has a few non current revisions as in a live catalog
+    for index in range(0, resource_count):
+        package_id = str(uuid.uuid4())
+        group_id = str(uuid.uuid4())
+        table_id = str(uuid.uuid4())
+        wms_id = str(uuid.uuid4())
+
+        connection.execute('insert into package_revision (id, title, notes, state, current) values (%s, %s, %s, %s, %s)',
+                           (package_id, 'Package {index}'.format(index = index), 'Synthetic package', 'active', True))
+        connection.execute('insert into resource_group_revision (id, package_id, state, current) values (%s, %s, %s, %s)',
+                           (group_id, package_id, 'active', True))
+
+        for current in [False, False, True]:
+            connection.execute('insert into resource_revision (id, name, format, extras, resource_group_id, state, current) values (%s, %s, %s, %s, %s, %s, %s)',
+                               (table_id, 'layer{index}'.format(index = index), 'data_table',
+                                '{"vectorstorer_resource": "True", "geometry": "Polygon"}', group_id, 'active', current))
+            connection.execute('insert into resource_revision (id, name, format, extras, resource_group_id, state, current) values (%s, %s, %s, %s, %s, %s, %s)',
+                               (wms_id, 'layer{index}'.format(index = index), 'wms',
+                                '{{"vectorstorer_resource": "True", "geometry": "Polygon", "parent_resource_id": "{parent}", "wms_server": "/geoserver/wms", "wms_layer": "layer{index}"}}'.format(parent = table_id, index = index),
+                                group_id, 'active', current))
+
+        resources.append(table_id)
+
+    trans.commit()
+    connection.close()
+
+    # Vector storer tables. Polygons are buffered points with 4 * quad_segs vertices
+    quad_segs = max(int(vertices / 4), 1)
+
+    connection = vectorstore.connect()
+    trans = connection.begin()
+    for table_id in resources:
+        connection.execute("""
+            create table "{table}" (
+                id serial primary key,
+                name varchar,
+                category varchar,
+                pop int4,
+                the_geom geometry(Polygon, 2100)
+            );
+            insert into "{table}" (name, category, pop, the_geom)
+            select  'feature ' || s,
+                    'category ' || (s % 10),
+                    (random() * 100000)::int4,
+                    ST_Transform(ST_Buffer(ST_SetSRID(ST_MakePoint({xmin} + random() * {width}, {ymin} + random() * {height}), 3857), 500 + random() * 2000, {quad_segs}), 2100)
+            from    generate_series(1, {rows}) as s;
+            create index "{table}_the_geom_idx" on "{table}" using gist (the_geom);
+            create index "{table}_pop_idx" on "{table}" (pop);
+            analyze "{table}";
+        """.format(
+            table = table_id,
+            rows = rows,
+            xmin = EXTENT[0],
+            ymin = EXTENT[1],
+            width = EXTENT[2] - EXTENT[0],
+            height = EXTENT[3] - EXTENT[1],
+            quad_segs = quad_segs
+        ))
+    trans.commit()
+    connection.close()
+
+    catalog.dispose()
+    vectorstore.dispose()
+
+    return resources
+
+def create_queries(resources):
+    viewport = shapely.geometry.box(2700000.0, 4500000.0, 2800000.0, 4600000.0)
+
+    return [
+        ('attribute page', {
+            'queue' : [{
+                'resources' : [resources[0]],
+                'filters' : [{ 'operator' : OP_GT, 'arguments' : [{ 'name' : 'pop' }, 50000] }],
+                'sort' : [{ 'name' : 'pop', 'desc' : True }],
+                'offset' : 20,
+                'limit' : 50
+            }]
+        }),
+        ('bbox intersects', {
+            'queue' : [{
+                'resources' : [resources[0]],
+                'fields' : ['name', 'pop', 'the_geom'],
+                'filters' : [
+                    { 'operator' : OP_INTERSECTS, 'arguments' : [{ 'name' : 'the_geom' }, viewport] },
+                    { 'operator' : OP_EQ, 'arguments' : [{ 'name' : 'category' }, 'category 1'] }
+                ]
+            }]
+        }),
+        ('paged with exact count', {
+            'queue' : [{
+                'resources' : [resources[0]],
+                'fields' : ['name', 'pop', 'the_geom'],
+                'filters' : [{ 'operator' : OP_INTERSECTS, 'arguments' : [{ 'name' : 'the_geom' }, viewport] }],
+                'sort' : ['name'],
+                'limit' : 100,
+                'count' : QUERY_COUNT_EXACT
+            }]
+        }),
+        ('distance join', {
+            'queue' : [{
+                'resources' : [{ 'name' : resources[0], 'alias' : 'a' }, { 'name' : resources[1 % len(resources)], 'alias' : 'b' }],
+                'fields' : [{ 'resource' : 'a', 'name' : 'name' }, { 'resource' : 'a', 'name' : 'the_geom' }],
+                'filters' : [
+                    { 'operator' : OP_INTERSECTS, 'arguments' : [{ 'resource' : 'a', 'name' : 'the_geom' }, viewport] },
+                    { 'operator' : OP_DISTANCE, 'arguments' : [{ 'resource' : 'a', 'name' : 'the_geom' }, { 'resource' : 'b', 'name' : 'the_geom' }, OP_LT, 1000] }
+                ],
+                'limit' : 500
+            }]
+        })
+    ]
+
+def percentile(values, p):
+    if len(values) == 0:
+        return 0.0
+
+    ordered = sorted(values)
+    # Nearest rank
+    index = int(math.ceil(p / 100.0 * len(ordered))) - 1
+
+    return ordered[min(max(index, 0), len(ordered) - 1)]
+
+def count_rows(result):
+    rows = 0
+    for data in result['data']:
+        rows += len(data['features']) if type(data) is dict else len(data)
+
+    return rows
+
+def run(config, name, query, concurrency, requests):
+    latencies = []
+    rows = [0]
+    errors = [0]
+    lock = threading.Lock()
+    pending = [requests]
+
+    def worker():
+        executor = QueryExecutor()
+        while True:
+            with lock:
+                if pending[0] == 0:
+                    return
+                pending[0] -= 1
+
+            start_time = time.time()
+            try:
+                result = executor.execute(config, copy.deepcopy(query), {})
+                result_rows = count_rows(result)
+            except DataException:
+                result_rows = None
+            elapsed_time = time.time() - start_time
+
+            with lock:
+                if result_rows is None:
+                    errors[0] += 1
+                else:
+                    latencies.append(elapsed_time * 1000.0)
+                    rows[0] += result_rows
+
+    threads = [threading.Thread(target=worker) for i in range(0, concurrency)]
+
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed_time = time.time() - start_time
+
+    print '{name:<24} {requests:>8} {errors:>6} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {qps:>9.1f} {rps:>11.1f} {rss:>10}'.format(
+        name = name,
+        requests = requests,
+        errors = errors[0],
+        p50 = percentile(latencies, 50),
+        p95 = percentile(latencies, 95),
+        p99 = percentile(latencies, 99),
+        qps = len(latencies) / elapsed_time,
+        rps = rows[0] / elapsed_time,
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    )
+
+parser = argparse.ArgumentParser(description='Measures QueryExecutor latency and throughput against a local PostgreSQL/PostGIS server')
+
+parser.add_argument('-server', '-s', metavar='database connection string', type=str, help='''Connection string of an existing server without a database name,\
+                                                                                           e.g. postgresql://postgres@localhost:5432. If not set, a temporary cluster is provisioned''', required=False)
+parser.add_argument('-pgbin', metavar='path', type=str, help='Directory of the initdb and pg_ctl binaries', required=False, default='')
+parser.add_argument('-port', metavar='N', type=int, help='Port of the provisioned cluster', required=False, default=55432)
+parser.add_argument('-resources', '-r', metavar='N', type=int, help='Number of synthetic resources', required=False, default=4)
+parser.add_argument('-rows', metavar='N', type=int, help='Number of features per resource', required=False, default=100000)
+parser.add_argument('-vertices', metavar='N', type=int, help='Approximate number of vertices per feature', required=False, default=32)
+parser.add_argument('-concurrency', '-c', metavar='N', type=int, help='Number of concurrent clients', required=False, default=8)
+parser.add_argument('-requests', '-n', metavar='N', type=int, help='Number of requests per query shape', required=False, default=200)
+parser.add_argument('-replicas', metavar='N', type=int, help='Number of provisioned vector storer replicas, including the primary cluster', required=False, default=1)
+parser.add_argument('-policy', metavar='policy', type=str, help='Replica routing policy', required=False, default=DEFAULT_ROUTING_POLICY, choices=ROUTING_POLICIES)
+parser.add_argument('-tiles', metavar='N', type=int, help='Number of tiles of parallel scans of single resource queries', required=False, default=0)
+parser.add_argument('-fail', action='store_true', help='Stop the last replica before the queries are executed to measure retries and ejection')
+parser.add_argument('-keep', '-k', action='store_true', help='Keep the provisioned clusters running')
+
+args = parser.parse_args()
+
+if not args.server is None and args.replicas > 1:
+    parser.error('Replicas can only be used with a provisioned cluster.')
+
+directories = []
+server = args.server
+
+if server is None:
+    directory, server = provision(args.pgbin, args.port)
+    directories.append(directory)
+    print 'Provisioned cluster at {directory}'.format(directory = directory)
+
+try:
+    print 'Seeding {resources} resources of {rows} features...'.format(resources = args.resources, rows = args.rows)
+    resources = seed(server, args.resources, args.rows, args.vertices)
+
+    replicas = [server]
+    for index in range(1, args.replicas):
+        directory, replica = provision(args.pgbin, args.port + index)
+        directories.append(directory)
+        print 'Provisioned replica at {directory}'.format(directory = directory)
+
+        replicate(args.pgbin, server, replica)
+        replicas.append(replica)
+
+    config = {
+        CONFIG_SQL_CATALOG : '{server}/{database}'.format(server = server, database = DATABASE_CATALOG),
+        CONFIG_SQL_DATA : ['{server}/{database}'.format(server = replica, database = DATABASE_VECTORSTORE) for replica in replicas],
+        CONFIG_SQL_TIMEOUT : 30000,
+        CONFIG_ROUTING_POLICY : args.policy,
+        CONFIG_PARALLEL_TILES : args.tiles,
+        CONFIG_PARALLEL_MIN_ROWS : 0
+    }
+
+    if args.fail and len(directories) > 1:
+        subprocess.call([os.path.join(args.pgbin, 'pg_ctl'), '-D', directories[-1], '-w', '-m', 'immediate', 'stop'], stdout=open(os.devnull, 'w'))
+        print 'Stopped replica at {directory}'.format(directory = directories[-1])
+
+    print '{name:<24} {requests:>8} {errors:>6} {p50:>9} {p95:>9} {p99:>9} {qps:>9} {rps:>11} {rss:>10}'.format(
+        name = 'shape', requests = 'requests', errors = 'errors', p50 = 'p50 ms', p95 = 'p95 ms', p99 = 'p99 ms',
+        qps = 'queries/s', rps = 'rows/s', rss = 'peak KB'
+    )
+
+    for name, query in create_queries(resources):
+        run(config, name, query, args.concurrency, args.requests)
+
+    for replica in get_replica_health(config):
+        print '{url:<60} outstanding {outstanding:>3} failures {failures:>3} ejected {ejected}'.format(**replica)
+finally:
+    if not args.keep:
+        for directory in directories:
+            teardown(args.pgbin, directory)
+
+sys.exit(0)
@@ -60,5 +60,5 @@ setup(
         "CKAN", "API", "Vector Storer",
     ],
     install_requires=required,
-    scripts=['src/bin/pm-run-query'],
+    scripts=['src/bin/pm-run-query', 'src/bin/pm-catalog-index', 'src/bin/pm-geometry-projection'],
 )
@@ -1,3 +1,16 @@
+from .features import *
 from .encoder import *
 from .decoder import *
+from .exceptions import *
+from .metadata import *
+from .compiler import *
+from .scheduler import *
+from .cache import *
+from .index import *
+from .slowlog import *
+from .routing import *
+from .projection import *
+from .deadline import *
 from .base import *
+from .daemon import *
+from .wsgi import *
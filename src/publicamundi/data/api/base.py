@@ -3,65 +3,109 @@ import logging
 from sqlalchemy import create_engine
 from sqlalchemy.sql import text
 from sqlalchemy.engine import ResultProxy
-from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import DBAPIError, OperationalError
 
 import json
 import geojson
 
-import shapely.wkb
-import shapely.wkt
+import shapely.geometry
 import shapely.geometry.base
+import shapely.prepared
+import shapely.wkb
 
+import collections
+import contextlib
+import datetime
+import math
 import numbers
+import operator
 import os
+import re
 import string
+import threading
 import time
+import uuid
+
+from .exceptions import DataException, QueryTimeoutException, ServiceUnavailableException, ResultTooLargeException, InternalException
+from .compiler import *
+from .catalog import ResourceCatalog
+from .index import *
+from .slowlog import *
+from .cache import *
+from .encoder import ShapelyGeoJsonEncoder
+from .metadata import Field, Resource
+from .features import Feature, Record
+from .routing import *
+from .projection import get_projection_column
+from .deadline import Deadline
 
 log = logging.getLogger(__name__)
 
-# Available formats
-QUERY_FORMAT_JSON = 'JSON'
-QUERY_FORMAT_GEOJSON = 'GeoJSON'
-
-# Supported formats
-FORMAT_SUPPORT_QUERY = [QUERY_FORMAT_JSON , QUERY_FORMAT_GEOJSON]
-
-CRS_SUPPORTED = ['EPSG:900913', 'EPSG:3857', 'EPSG:4326', 'EPSG:2100', 'EPSG:4258']
-CRS_DEFAULT_DATABASE = 2100
-CRS_DEFAULT_OUTPUT = 3857
-
-OP_LIKE = 'LIKE'
-OP_EQ = 'EQUAL'
-OP_NOT_EQ = 'NOT_EQUAL'
-OP_GT = 'GREATER'
-OP_GET = 'GREATER_OR_EQUAL'
-OP_LT = 'LESS'
-OP_LET = 'LESS_OR_EQUAL'
-
-OP_AREA = 'AREA'
-OP_DISTANCE = 'DISTANCE'
-OP_CONTAINS = 'CONTAINS'
-OP_INTERSECTS = 'INTERSECTS'
-
-COMPARE_OPERATORS = [OP_EQ, OP_NOT_EQ, OP_GT, OP_GET, OP_LT, OP_LET, OP_LIKE]
-COMPARE_EXPRESSIONS = ['=', '<>', '>', '>=', '<', '<=', 'like']
-
-FIELD_OPERATORS = [OP_AREA, OP_DISTANCE]
-
-SPATIAL_COMPARE_OPERATORS = [OP_EQ, OP_GT, OP_GET, OP_LT, OP_LET]
-SPATIAL_OPERATORS = [OP_AREA, OP_DISTANCE, OP_CONTAINS, OP_INTERSECTS]
-
-ALL_OPERATORS = [OP_EQ, OP_NOT_EQ, OP_GT, OP_GET, OP_LT, OP_LET, OP_LIKE, OP_AREA, OP_DISTANCE, OP_CONTAINS, OP_INTERSECTS]
-
-MAX_RESULT_ROWS = 10000
-
 CONFIG_SQL_CATALOG = 'sqlalchemy.catalog'
 CONFIG_SQL_DATA = 'sqlalchemy.vectorstore'
 CONFIG_SQL_TIMEOUT = 'timeout'
-CONFIG_MAX_RESOURCE = 'resource.max.count'
+CONFIG_SQL_PREPARE_THRESHOLD = 'prepare.threshold'
+CONFIG_SQL_PREPARE_CACHE_SIZE = 'prepare.cache.size'
+CONFIG_CATALOG_CACHE_TTL = 'catalog.cache.ttl'
+CONFIG_CATALOG_SYNC = 'catalog.sync'
+CONFIG_CATALOG_SYNC_OVERLAP = 'catalog.sync.overlap'
+CONFIG_BUDGET_REQUEST = 'budget.request.bytes'
+CONFIG_BUDGET_PROCESS = 'budget.process.bytes'
+CONFIG_BUDGET_MODE = 'budget.mode'
+CONFIG_PARALLEL_TILES = 'parallel.tiles'
+CONFIG_PARALLEL_WORKERS = 'parallel.workers'
+CONFIG_PARALLEL_MIN_ROWS = 'parallel.min.rows'
+CONFIG_PARALLEL_CONNECTIONS = 'parallel.connections'
 
 DEFAULT_SQL_TIMEOUT = 30000
-DEFAULT_MAX_RESOURCE = 4
+# A query shape is prepared the second time it is executed on the same connection
+DEFAULT_SQL_PREPARE_THRESHOLD = 2
+DEFAULT_SQL_PREPARE_CACHE_SIZE = 32
+# Catalog resources and resource descriptions are cached for the lifetime of an executor only if a
+# positive time to live in seconds is set
+DEFAULT_CATALOG_CACHE_TTL = 0
+# Expired catalog resources are loaded again, unless they are synchronized incrementally. Revisions
+# are expected to be committed within the overlap in seconds after their revision timestamp
+DEFAULT_CATALOG_SYNC = False
+DEFAULT_CATALOG_SYNC_OVERLAP = 60
+
+# Result size budgets in bytes. A budget is enforced only if it is positive. Rows are counted by an
+# estimate of their size once encoded to JSON, which does not account for escaped characters, e.g.
+# non ASCII text that is encoded as \uXXXX escapes of six bytes per character. Rows of queries with
+# a budget are read from a server side cursor, as are rows streamed by the WSGI application, hence
+# queries with a budget are neither served by the tile cache nor split in partitions
+DEFAULT_BUDGET_REQUEST = 0
+DEFAULT_BUDGET_PROCESS = 0
+
+# Results exceeding a budget are either truncated or rejected
+BUDGET_MODE_TRUNCATE = 'truncate'
+BUDGET_MODE_ERROR = 'error'
+
+DEFAULT_BUDGET_MODE = BUDGET_MODE_TRUNCATE
+
+# Queries of a single resource are split in spatial tiles that are executed concurrently only if a
+# tile count greater than one is set and the resource has at least the minimum number of rows
+DEFAULT_PARALLEL_TILES = 0
+DEFAULT_PARALLEL_WORKERS = 4
+DEFAULT_PARALLEL_MIN_ROWS = 1000000
+# Maximum number of connections per replica shared by the workers of every parallel scan of the
+# process. Workers use a dedicated pool, hence they never exhaust the pool of the queries
+DEFAULT_PARALLEL_CONNECTIONS = 8
+
+# Bound of the outer sides of the tiles of a parallel scan. Every feature belongs to a tile even if
+# the estimated extent of its table is not accurate
+_TILE_UNBOUNDED = 1e15
+
+# Number of decoded rows between deadline checks
+_DEADLINE_CHECK_ROWS = 1000
+
+# Bytes added by the JSON encoding of result rows. Values are counted by _limit_rows
+_ENCODED_NAME_SIZE = 6
+_ENCODED_FEATURE_SIZE = 72
+_ENCODED_GEOMETRY_SIZE = 32
+_ENCODED_STRING_SIZE = 2
+_ENCODED_NULL_SIZE = 4
+_ENCODED_VALUE_SIZE = 24
 
 # See http://www.postgresql.org/docs/9.3/static/errcodes-appendix.html
 _PG_ERR_CODE = {
@@ -70,24 +114,231 @@ _PG_ERR_CODE = {
     'syntax_error': '42601',
     'permission_denied': '42501'
 }
-class DataException(Exception):
-    def __init__(self, message, innerException=None):
-        self.message = message
-        self.innerException = innerException
 
-    def __str__(self):
-        return repr(self.message)
+# Engines are shared by all executors so that connection pools, and the prepared statements
+# of their connections, outlive a single request
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _get_engine(url):
+    with _engines_lock:
+        if not url in _engines:
+            _engines[url] = create_engine(url, echo=False)
+
+        return _engines[url]
+
+# Pools of the workers of parallel scans, keyed by url and size. Every pool is an engine without
+# overflow connections and a semaphore with a slot per connection
+_parallel_pools = {}
+
+def _get_parallel_pool(url, size):
+    with _engines_lock:
+        key = (url, size)
+        if not key in _parallel_pools:
+            _parallel_pools[key] = (create_engine(url, echo=False, pool_size=size, max_overflow=0), threading.BoundedSemaphore(size))
+
+        return _parallel_pools[key]
+
+# Routers are shared like engines so that outstanding requests and failures of every replica are
+# tracked across executors
+_routers = {}
+_routers_lock = threading.Lock()
+
+def _get_router(config):
+    replicas = parse_replicas(config[CONFIG_SQL_DATA])
+
+    key = (replicas, ) + tuple([config.get(name) for name in [
+        CONFIG_ROUTING_POLICY,
+        CONFIG_ROUTING_EJECT_FAILURES,
+        CONFIG_ROUTING_EJECT_TIME,
+        CONFIG_ROUTING_HEALTH_INTERVAL
+    ]])
+
+    with _routers_lock:
+        if not key in _routers:
+            _routers[key] = ReplicaRouter(replicas, _get_engine, config)
+
+        return _routers[key]
+
+# Returns the state of the replicas of the data source of a configuration
+def get_replica_health(config):
+    return _get_router(config).health()
+
+# Errors raised by the database server have an error code. Errors without one, e.g. a refused or
+# broken connection, are caused by the replica and not by the query
+def _is_replica_error(ex):
+    return ex.connection_invalidated or (isinstance(ex, OperationalError) and getattr(ex.orig, 'pgcode', None) is None)
+
+# Watches the DBAPI connection of a connection until the block exits, so that its commands are
+# cancelled once the deadline, if any, expires
+@contextlib.contextmanager
+def _watch(deadline, connection):
+    if deadline is None:
+        yield
+        return
+
+    with deadline.watch(connection.connection.connection):
+        yield
+
+# Bytes of the result of a request, optionally bounded by the bytes of the results of all the requests
+# of the process that are executing. The size of a row is estimated by QueryExecutor._limit_rows
+class _ByteBudget(object):
+
+    def __init__(self, limit, parent=None):
+        self.limit = limit
+        self.parent = parent
+        self.lock = threading.Lock()
+        self.used = 0
+        self.exceeded = False
+        # Set if the budget of the parent was exceeded, i.e. by the requests of other clients
+        self.parent_exceeded = False
+
+    def is_enforced(self):
+        return self.limit > 0 or (not self.parent is None and self.parent.is_enforced())
+
+    # Returns False if the size exceeds the budget, in which case the size is not consumed
+    def consume(self, size):
+        with self.lock:
+            if self.limit > 0 and self.used + size > self.limit:
+                self.exceeded = True
+                return False
+
+            if not self.parent is None and not self.parent.consume(size):
+                self.exceeded = True
+                self.parent_exceeded = True
+                return False
+
+            self.used += size
+
+        return True
+
+    def release(self):
+        with self.lock:
+            if not self.parent is None:
+                self.parent.free(self.used)
+            self.used = 0
+
+    def free(self, size):
+        with self.lock:
+            self.used -= size
+
+# The process budget is shared by every executor, hence it is set once, either explicitly or by the
+# first configuration that sets it, and never by every request
+_process_budget = _ByteBudget(DEFAULT_BUDGET_PROCESS)
+_process_budget_configured = [False]
+
+# Sets the result size budget in bytes of all the requests of the process. Configurations of
+# queries executed afterwards do not change it
+def configure_process_budget(limit):
+    with _process_budget.lock:
+        _process_budget.limit = limit
+        _process_budget_configured[0] = True
+
+def _init_process_budget(config):
+    if _process_budget_configured[0] or not CONFIG_BUDGET_PROCESS in config:
+        return
+
+    with _process_budget.lock:
+        if not _process_budget_configured[0]:
+            _process_budget.limit = config[CONFIG_BUDGET_PROCESS]
+            _process_budget_configured[0] = True
+
+# LRU of the statements prepared on a single DBAPI connection
+class _PreparedStatementCache(object):
+
+    def __init__(self, connection, capacity):
+        # DBAPI connection that owns the prepared statements
+        self.connection = connection
+        self.capacity = capacity
+        # Normalized SQL to prepared statement name
+        self.statements = collections.OrderedDict()
+        # Normalized SQL to execution count for shapes not prepared yet
+        self.usage = collections.OrderedDict()
+        # Shapes that PostgreSQL failed to prepare, e.g. because of parameters of unknown type
+        self.rejected = set()
+        self.sequence = 0
+
+    def hit(self, sql):
+        count = self.usage.pop(sql, 0) + 1
+        self.usage[sql] = count
+
+        while len(self.usage) > self.capacity * 4:
+            self.usage.popitem(last=False)
+
+        return count
+
+    def get(self, sql):
+        name = self.statements.pop(sql, None)
+        if not name is None:
+            self.statements[sql] = name
+
+        return name
+
+    # Registers a new statement and returns its name along with the names of evicted statements
+    def add(self, sql):
+        self.sequence += 1
+        name = 'pm_stmt_{sequence}'.format(sequence = self.sequence)
+
+        self.usage.pop(sql, None)
+        self.statements[sql] = name
+
+        evicted = []
+        while len(self.statements) > self.capacity:
+            evicted.append(self.statements.popitem(last=False)[1])
+
+        return name, evicted
+
+# Merged rows of several commands, exposed like the result of a command
+class _MergedResult(object):
+
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+
+    def keys(self):
+        return self.columns
+
+    def close(self):
+        pass
 
 class QueryExecutor:
 
-    def execute(self, config, query, metadata={}):
+    def __init__(self, scheduler=None):
+        self.catalog = ResourceCatalog()
+        self.tiles = TileCache()
+        self.catalog_index = CatalogIndex()
+        # Catalog engine to whether the catalog index exists
+        self.catalog_index_exists = {}
+        self.scheduler = scheduler
+
+    # Executes a query. Rows of the result are dictionaries. If a scheduler is set, the query first
+    # waits for a slot granted to the client that submitted it. If a writer is set, the rows of every
+    # queue item are read from a server side cursor and passed to the writer as soon as they are
+    # decoded, hence the result is never held in memory. The writer is notified by
+    # begin(output_format, crs) before the rows of a queue item, write(row) for every row and end()
+    # after the last one. Rows passed to the writer are Feature or Record objects that are converted
+    # by to_dict(). The data of the returned result is empty
+    def execute(self, config, query, metadata=None, client=None, writer=None):
+        if self.scheduler is None:
+            return self._execute(config, query, metadata, writer)
+
+        ticket = self.scheduler.acquire(client, query)
+        try:
+            return self._execute(config, query, metadata, writer)
+        finally:
+            self.scheduler.release(ticket)
+
+    def _execute(self, config, query, metadata=None, writer=None):
+        if metadata is None:
+            metadata = {}
+        # Table aliases reported in the metadata of the response, assigned in the order resources are
+        # described. Resources described by a failed attempt keep their alias
+        aliases = {}
+
         try:
             engine_ckan = None
             connection_ckan = None
 
-            engine_data = None
-            connection_data = None
-
             output_format = QUERY_FORMAT_GEOJSON
             crs = CRS_DEFAULT_OUTPUT
 
@@ -112,75 +363,214 @@ class QueryExecutor:
             if not type(query['queue']) is list or len(query['queue']) == 0:
                 raise DataException('Parameter queue should be a list with at least one item.')
 
+            # Initialize result size budget
+            budget_mode = config[CONFIG_BUDGET_MODE] if CONFIG_BUDGET_MODE in config else DEFAULT_BUDGET_MODE
+            if not budget_mode in [BUDGET_MODE_TRUNCATE, BUDGET_MODE_ERROR]:
+                raise InternalException(u'Budget mode {mode} is not supported.'.format(mode = budget_mode))
+
+            _init_process_budget(config)
+
+            # The timeout is a wall clock deadline for the whole request, including loading the
+            # catalog, describing resources and every attempt on a replica
+            deadline = Deadline(config[CONFIG_SQL_TIMEOUT] if CONFIG_SQL_TIMEOUT in config else DEFAULT_SQL_TIMEOUT)
+
             # Initialize database
-            engine_ckan = create_engine(config[CONFIG_SQL_CATALOG], echo=False)
-            engine_data = create_engine(config[CONFIG_SQL_DATA], echo=False)
+            engine_ckan = _get_engine(config[CONFIG_SQL_CATALOG])
             connection_ckan = engine_ckan.connect()
-            connection_data = engine_data.connect()
-
-            # Initialize execution context
-            context = {
-                'query' : None,
-                'output_format' : output_format,
-                'crs' : crs,
-                'engine_ckan' : engine_ckan,
-                'engine_data' : engine_data,
-                'connection_ckan' : connection_ckan,
-                'connection_data' : connection_data,
-                'resources' : self.get_resources(config, connection_ckan),
-                'metadata' : metadata,
-                'elapsed_time' : 0
-            }
 
-            # Execute queries
-            query_result = []
+            with _watch(deadline, connection_ckan):
+                resources = self._get_cached_resources(config, connection_ckan)
+
+            deadline.check()
+
+            # Queries only read data. A query that fails because of its replica is executed again
+            # from the start on another replica, as long as the deadline has not expired
+            router = _get_router(config)
+            replicas = []
+
+            while True:
+                replica, connection_data = self._connect_replica(router, replicas)
+
+                # Initialize execution context
+                context = {
+                    'query' : None,
+                    'output_format' : output_format,
+                    'crs' : crs,
+                    'engine_ckan' : engine_ckan,
+                    'engine_data' : replica.engine,
+                    'router' : router,
+                    'replica' : replica,
+                    'connection_ckan' : connection_ckan,
+                    'connection_data' : connection_data,
+                    'resources' : resources,
+                    'metadata' : metadata,
+                    'aliases' : aliases,
+                    # Metadata of the current queue item along with the named results
+                    'described' : metadata,
+                    'deadline' : deadline,
+                    # Named results of the queue, keyed by name
+                    'results' : {},
+                    'budget' : _ByteBudget(config[CONFIG_BUDGET_REQUEST] if CONFIG_BUDGET_REQUEST in config else DEFAULT_BUDGET_REQUEST, _process_budget),
+                    'writer' : writer,
+                    # Set once the writer is notified, since notifications can not be taken back
+                    'written' : False
+                }
 
-            for q in query['queue']:
-                context['query'] = q
+                failed = False
+                transaction = None
 
-                partial_result = self._execute_query(config, context)
+                try:
+                    # Every attempt is a single transaction, hence SET LOCAL applies to all its
+                    # commands and temporary tables of named results are discarded on rollback
+                    transaction = connection_data.begin()
 
-                if output_format == QUERY_FORMAT_GEOJSON:
-                    partial_result = {
-                        'features': partial_result,
-                        'type': 'FeatureCollection',
-                        'crs': {
-                            'type': 'name',
-                            'properties': {
-                                'name': 'urn:ogc:def:crs:EPSG::' + str(crs)
-                            }
-                        }
-                    }
+                    with _watch(deadline, connection_data):
+                        return self._execute_queue(config, query, context, budget_mode)
+                except DBAPIError as ex:
+                    failed = _is_replica_error(ex)
 
-                query_result.append(partial_result)
+                    if not failed or len(replicas) == len(router.replicas) or deadline.expired() or context['written']:
+                        raise
 
-            return {
-                'data' : query_result,
-                'crs' : crs,
-                'metadata' : context['metadata'],
-                'format' : output_format
-            }
+                    log.warning(u'Query failed on replica {url} and is retried on another replica: {error}'.format(
+                        url = replica.url,
+                        error = ex
+                    ))
+
+                finally:
+                    router.release(replica, failed)
+
+                    context['budget'].release()
+                    try:
+                        if not transaction is None:
+                            transaction.rollback()
+                    except DBAPIError as ex:
+                        log.warning(u'Failed to roll back transaction on replica {url}: {error}'.format(url = replica.url, error = ex))
+                    finally:
+                        try:
+                            connection_data.close()
+                        except DBAPIError as ex:
+                            log.warning(u'Failed to close connection to replica {url}: {error}'.format(url = replica.url, error = ex))
         except DBAPIError as dbEx:
             message = 'Database exception has occured: '
-            if dbEx.orig.pgcode == _PG_ERR_CODE['query_canceled']:
+            if getattr(dbEx.orig, 'pgcode', None) == _PG_ERR_CODE['query_canceled']:
                 message = message + 'Execution exceeded timeout.'
+                exception_type = QueryTimeoutException
+            elif _is_replica_error(dbEx):
+                message = message + 'Data source is not available.'
+                exception_type = ServiceUnavailableException
             else:
                 message = message + 'Unhandled exception has occured.'
+                exception_type = InternalException
 
             log.exception(message)
 
-            raise DataException(message, dbEx)
+            raise exception_type(message, dbEx)
+        except DataException:
+            raise
         except Exception as ex:
             message = 'Unhandled exception has occured.'
 
             log.exception(message)
 
-            raise DataException(message, ex)
+            raise InternalException(message, ex)
         finally:
             if not connection_ckan is None:
                 connection_ckan.close()
-            if not connection_data is None:
-                connection_data.close()
+
+    # Executes the items of the queue of a query on the data connection of the context
+    def _execute_queue(self, config, query, context, budget_mode):
+        output_format = context['output_format']
+        crs = context['crs']
+        budget = context['budget']
+        writer = context['writer']
+
+        query_result = []
+        query_count = []
+        query_continuation = []
+
+        for q in query['queue']:
+            context['query'] = q
+            context['count'] = None
+            context['continuation'] = None
+
+            if not writer is None:
+                context['written'] = True
+                writer.begin(output_format, crs)
+
+            if budget.exceeded:
+                # Once the budget is exhausted, the remaining queue items are not executed and
+                # must be resubmitted from their original offset
+                partial_result = []
+                context['continuation'] = {
+                    'offset' : q['offset'] if type(q) is dict and isinstance(q.get('offset'), numbers.Number) and q['offset'] >= 0 else 0
+                }
+            else:
+                partial_result = self._execute_query(config, context)
+
+            if budget.exceeded and budget_mode == BUDGET_MODE_ERROR:
+                if budget.parent_exceeded:
+                    raise ServiceUnavailableException(u'Result size budget of the service is exhausted.')
+                raise ResultTooLargeException(u'Query result exceeds the size budget of the request.')
+
+            query_count.append(context['count'])
+            query_continuation.append(context['continuation'])
+
+            if not writer is None:
+                writer.end()
+                continue
+
+            if output_format == QUERY_FORMAT_GEOJSON:
+                partial_result = {
+                    'features': partial_result,
+                    'type': 'FeatureCollection',
+                    'crs': {
+                        'type': 'name',
+                        'properties': {
+                            'name': 'urn:ogc:def:crs:EPSG::' + str(crs)
+                        }
+                    }
+                }
+
+            query_result.append(partial_result)
+
+        return {
+            'data' : query_result,
+            'count' : query_count,
+            'continuation' : query_continuation,
+            'crs' : crs,
+            'metadata' : dict([(name, self._metadata_to_dict(context, name)) for name in context['metadata']]),
+            'format' : output_format
+        }
+
+    # Returns the metadata of a resource as a dictionary along with the table alias assigned to it
+    def _metadata_to_dict(self, context, name):
+        result = context['metadata'][name].to_dict()
+        result['alias'] = context['aliases'].get(name)
+
+        return result
+
+    # Connects to a replica selected by the router, excluding the replicas already tried. Replicas
+    # that refuse the connection are released as failed and the next one is tried. Tried replicas
+    # are appended to tried
+    def _connect_replica(self, router, tried):
+        while True:
+            replica = router.acquire(tried)
+            if replica is None:
+                raise ServiceUnavailableException('No data source replica is available.')
+
+            tried.append(replica)
+
+            try:
+                return replica, replica.engine.connect()
+            except DBAPIError as ex:
+                failed = _is_replica_error(ex)
+                router.release(replica, failed)
+
+                if not failed or len(tried) == len(router.replicas):
+                    raise
+
+                log.warning(u'Failed to connect to replica {url}: {error}'.format(url = replica.url, error = ex))
 
     def _execute_query(self, config, context):
         query = context['query']
@@ -192,988 +582,808 @@ class QueryExecutor:
         engine_data = context['engine_data']
         connection_data = context['connection_data']
 
-        srid = context['crs']
-        timeout = config[CONFIG_SQL_TIMEOUT] if CONFIG_SQL_TIMEOUT in config else DEFAULT_SQL_TIMEOUT
-        offset = 0
-        limit = MAX_RESULT_ROWS
+        deadline = context['deadline']
 
         result = []
 
-        count_geom_columns = 0;
+        compiler = QueryCompiler(config)
 
-        parsed_query = {
-            'resources' : {},
-            'fields': {},
-            'filters' : [],
-            'sort' : []
-        }
+        # Completion time of every stage of the query
+        stages = [('start', time.time())]
 
-        # Get limit
-        if 'limit' in query:
-            if not isinstance(query['limit'], numbers.Number):
-                raise DataException('Parameter limit must be a number.')
-            if query['limit'] < limit and query['limit'] > 0 :
-                limit = query['limit']
+        # Catalog resources are shared and never modified. Named results of previous queue items are
+        # only visible to the current request
+        resources = context['resources']
+        if len(context['results']) > 0:
+            resources = dict(resources)
+            resources.update(context['results'])
 
-        # Get offset
-        if 'offset' in query:
-            if not isinstance(query['offset'], numbers.Number):
-                raise DataException('Parameter offset must be a number.')
-            if query['offset'] >= 0:
-                offset = query['offset']
+        # Get result name
+        result_name = None
+        if 'name' in query and not query['name'] is None:
+            if not isinstance(query['name'], basestring):
+                raise DataException('Parameter name must be a string.')
+            if query['name'] in resources:
+                raise DataException(u'Name {name} is already used by a resource or a previous result.'.format(name = query['name']))
 
-        # Get resources
-        if not 'resources' in query:
-            raise DataException('No resource selected.')
+            result_name = query['name']
 
-        if not type(query['resources']) is list:
-            raise DataException('Parameter resource should be a list with at least one item.')
+        # Describe resources that are accessed for the first time. Named results are already described
+        # and are never added to the metadata of the response, since their tables are internal
+        for resource_name, resource_alias in compiler.parse_resources(query, resources):
+            if not resource_name in context['metadata'] and not resource_name in context['results']:
+                context['aliases'][resource_name] = 't{index}'.format(index = len(context['metadata']) + 1)
+                context['metadata'][resource_name] = resources[resource_name].describe(self._describe_cached_resource(config, resource_name, deadline))
 
-        if len(query['resources']) == 0:
-            raise DataException('At least one resource must be selected.')
+        context['described'] = context['metadata']
+        if len(context['results']) > 0:
+            context['described'] = dict(context['metadata'])
+            context['described'].update(context['results'])
 
-        max_resource_count = config[CONFIG_MAX_RESOURCE] if CONFIG_MAX_RESOURCE in config else DEFAULT_MAX_RESOURCE
+        stages.append(('describe', time.time()))
 
-        if len(query['resources']) > max_resource_count:
-            raise DataException('Only up to {count} resources are allowed per query.'.format(
-                count = max_resource_count
-            ))
+        # Build SQL command
+        compiled_query = compiler.compile(query, context['described'], context['crs'], output_format)
+
+        stages.append(('compile', time.time()))
+
+        sql = compiled_query['sql']
+        values = compiled_query['values']
+        fields = compiled_query['fields']
+
+        # Commands of the queue item may run for the time remaining until the deadline. The data
+        # connection is watched, hence commands still running at the deadline are cancelled
+        deadline.check()
+
+        # Rows of queries with a size budget are fetched in batches using a server side cursor so that
+        # the query can be aborted as soon as the budget is exceeded. Rows passed to a writer are
+        # fetched the same way so that the result is never held in memory
+        budget = context['budget']
+        writer = context['writer']
+        stream = budget.is_enforced() or not writer is None
+
+        connection_data.execute(u'SET LOCAL statement_timeout TO {0};'.format(max(deadline.remaining(), 1)))
+
+        # Bounding box queries are assembled from cached tiles. Other queries of large resources are
+        # scanned in parallel
+        records = None
+        if result_name is None and not stream and not compiled_query['partition'] is None:
+            mode = 'cached'
+            records = self._execute_cached(config, context, compiler, compiled_query)
+
+            if records is None:
+                tiles = self._get_partition_tiles(config, connection_data, context, compiled_query['partition'])
+
+                if not tiles is None:
+                    partitioned_query = compiler.compile(query, context['described'], context['crs'], output_format, partition = True)
+
+                    mode = 'partitioned'
+                    records = self._execute_partitioned(config, context, partitioned_query, tiles)
+
+        if records is None:
+            if not result_name is None:
+                mode = 'materialized'
+                records = self._materialize_result(connection_data, context, result_name, compiled_query, stream)
+            elif stream:
+                mode = 'streamed'
+                records = connection_data.execution_options(stream_results = True).execute(sql, values)
+            else:
+                mode = 'statement'
+                records = self._execute_statement(config, connection_data, sql, values)
 
+        stages.append(('execute', time.time()))
 
-        # Same as metadata but contains only the resources that are being accessed by the specific query
-        query_metadata = {}
-        # Used for managing resource name to alias mappings
-        resource_mapping = {}
+        deadline.check()
 
-        for query_resource in query['resources']:
-            db_resource = None
+        # Rows are read from the DBAPI cursor as plain tuples. Streamed rows are read through the
+        # result since it buffers the rows fetched from the server side cursor. Closing the cursor
+        # aborts a query whose result exceeds the budget
+        try:
+            columns = records.keys()
+            if stream:
+                rows = records
+            elif isinstance(records, _MergedResult):
+                rows = records.rows
+            else:
+                rows = records.cursor
 
-            resource_name = None
-            resource_alias = None
+            # Exact counts computed by the command are read from the first row
+            counted = not compiled_query['count_column'] is None and compiled_query['count_column'] in columns
+            if counted:
+                rows = self._read_count(rows, columns.index(compiled_query['count_column']), context)
 
-            if type(query_resource) is dict:
-                if 'name' in query_resource:
-                    resource_name = query_resource['name']
-                else:
-                    raise DataException('Resource name is missing.')
-                if 'alias' in query_resource:
-                    resource_alias = query_resource['alias']
-                else:
-                    # If no alias is set, the name of the resources becomes an alias by default
-                    resource_alias = resource_name
-            elif isinstance(query_resource, basestring):
-                resource_name = query_resource
-                resource_alias = query_resource
+            items = self._decode_rows(rows, columns, fields, output_format, budget if budget.is_enforced() else None, deadline)
+
+            # Rows of the response are plain dictionaries. Rows passed to a writer are encoded as they
+            # are written, hence they keep their compact representation
+            if writer is None:
+                result = [item.to_dict() for item in items]
+                count = len(result)
             else:
-                raise DataException('Resource parameter is malformed. Instance of string or dictionary is expected.')
-
-            # Allow users to use a wms unique id as a table resource since the id values are unique and there is
-            # an 1:1 relation
-            if not resource_name is None and not resource_name in context['resources']:
-                for r in context['resources']:
-                    if context['resources'][r]['wms'] == resource_name:
-                        resource_name = r
-                        break
-
-            # Mappings for handling aliases
-            resource_mapping[resource_name] = resource_name
-            resource_mapping[resource_alias] = resource_name
-
-            if resource_name in context['resources']:
-                db_resource = context['resources'][resource_name]
-
-                if not resource_name in context['metadata']:
-                    # Update alias. Alias is reseted for every query execution
-                    db_resource['alias'] = 't{index}'.format(index = (len(context['metadata'].keys()) + 1))
-
-                    # Add fields
-                    db_fields = self.describe_resource(config, resource_name)
-                    db_resource['srid'] = db_fields['srid']
-                    db_resource['geometry_column'] = db_fields['geometry_column']
-                    db_resource['fields'] = db_fields['fields']
-
-                    # Add resource to global metadata
-                    context['metadata'][resource_name] = db_resource
-                else:
-                    db_resource = context['metadata'][resource_name]
+                result = []
+                count = 0
+                for item in items:
+                    writer.write(item)
+                    count += 1
+        finally:
+            records.close()
 
-                parsed_query['resources'][resource_name] = {
-                    'table' : db_resource['table'],
-                    'alias' : db_resource['alias']
-                }
+        stages.append(('decode', time.time()))
 
-                # Add resource to local metadata
-                query_metadata[resource_name] = db_resource
-            else:
-                raise DataException('Resource {resource} does not exist.'.format(
-                    resource = resource_name
-                ))
-
-        # If no fields are selected, all fields are added to the response.
-        # This may result in some fields names being ambiguous.
-        addAllFields = False
-        if not 'fields' in query:
-            addAllFields = True
-        elif not type(query['fields']) is list:
-            raise DataException('Parameter fields should be a list.')
-        elif len(query['fields']) == 0:
-            addAllFields = True
-
-        if addAllFields:
-            query['fields'] = []
-            for resource in query_metadata:
-                for field in query_metadata[resource]['fields']:
-                    query['fields'].append({
-                        'resource' : resource,
-                        'name' :  query_metadata[resource]['fields'][field]['name']
-                    })
-
-        # Get fields
-        for i in range(0, len(query['fields'])):
-            field_resource = None
-            field_name = None
-            field_alias = None
-
-            is_computed = False
-
-            if type(query['fields'][i]) is dict:
-                if 'operator' in query['fields'][i]:
-                    computed_field = self._create_computed_field(query_metadata, resource_mapping, query['fields'][i])
-
-                    if computed_field['alias'] in parsed_query['fields']:
-                       raise DataException(u'Computed field {field} is ambiguous.'.format(
-                            field = computed_field['alias']
-                        ))
-
-                    parsed_query['fields'][computed_field['alias']] = {
-                        'fullname' : computed_field['alias'],
-                        'name' : computed_field['alias'],
-                        'alias' : computed_field['alias'],
-                        'type' : None,
-                        'is_geom' : computed_field['is_geom'],
-                        'srid' : None,
-                        'expression' : computed_field['expression']
-                    }
+        # Count rows matching the query ignoring limit and offset, unless the command has counted
+        # them. A command without rows has counted them only if it was neither paged nor truncated
+        if counted and context['count'] is None and count == 0 and compiled_query['offset'] == 0 and not budget.exceeded:
+            context['count'] = 0
 
-                    continue
+        if not compiled_query['count'] is None and context['count'] is None:
+            context['count'] = self._count_query(connection_data, compiled_query['count'], compiled_query['select_sql'], compiled_query['select_values'])
 
-                if 'name' in query['fields'][i]:
-                    field_name = query['fields'][i]['name']
-                else:
-                    raise DataException('Field name is missing.')
-                if 'alias' in query['fields'][i]:
-                    field_alias = query['fields'][i]['alias']
-                else:
-                    # If no alias is set, the name of the field becomes an alias by default
-                    field_alias = field_name
-                if 'resource' in query['fields'][i]:
-                    field_resource = query['fields'][i]['resource']
-            elif isinstance(query['fields'][i], basestring):
-                field_name = query['fields'][i]
-                field_alias = query['fields'][i]
-            else:
-                raise DataException('Field is malformed. Instance of string or dictionary is expected.')
+            stages.append(('count', time.time()))
 
-            # Set resource if not set
-            if field_resource is None:
-                resources = self._get_resources_by_field_name(query_metadata, field_name)
+        if budget.exceeded:
+            context['continuation'] = {
+                'offset' : compiled_query['offset'] + count
+            }
 
-                if len(resources) == 0:
-                    raise DataException(u'Field {field} does not exist.'.format(
-                        field = field_name
-                    ))
-                elif len(resources) == 1:
-                    field_resource = resources[0]
-                else:
-                    raise DataException(u'Field {field} is ambiguous for resources {resources}.'.format(
-                        field = field_name,
-                        resources = u','.join(resources)
-                    ))
+        slow_log = SlowQueryLog(config)
+        if slow_log.is_slow(stages[-1][1] - stages[0][1]):
+            self._record_slow_query(slow_log, context, compiled_query, mode, stages, count)
 
-            if not field_resource in resource_mapping or not resource_mapping[field_resource] in query_metadata:
-                raise DataException(u'Resource {resource} for field {field} does not exist.'.format(
-                    resource = field_resource,
-                    field = field_name
-                ))
+        return result
 
-            db_resource = query_metadata[resource_mapping[field_resource]]
+    # Records a slow queue item along with its SQL command, a summary of its parameter values and
+    # the time spent on every stage. The plan of a sample of the commands that were executed by a
+    # single statement is captured by executing them again
+    def _record_slow_query(self, slow_log, context, compiled_query, mode, stages, rows):
+        record = collections.OrderedDict([
+            ('resources', [r['name'] if type(r) is dict else r for r in context['query']['resources']]),
+            ('mode', mode),
+            ('elapsed', round((stages[-1][1] - stages[0][1]) * 1000, 3)),
+            ('timings', collections.OrderedDict([(stages[index][0], round((stages[index][1] - stages[index - 1][1]) * 1000, 3)) for index in range(1, len(stages))])),
+            ('rows', rows),
+            ('count', context['count']),
+            ('sql', compiled_query['sql']),
+            ('values', summarize_values(compiled_query['values'])),
+            ('plan', None)
+        ])
+
+        if mode in ['statement', 'streamed'] and slow_log.should_explain():
+            connection = context['connection_data']
+
+            explain_sql = u'explain (analyze, buffers, format json) {sql};'.format(sql = compiled_query['sql'].rstrip(u'; '))
+
+            connection.execute(u'SAVEPOINT pm_explain;')
+            try:
+                plan = connection.execute(explain_sql, compiled_query['values']).scalar()
+                record['plan'] = json.loads(plan) if isinstance(plan, basestring) else plan
+
+                connection.execute(u'RELEASE SAVEPOINT pm_explain;')
+            except DBAPIError as ex:
+                if _is_replica_error(ex):
+                    raise
+
+                record['plan'] = u'Failed to capture the plan: {error}'.format(error = ex)
+
+                connection.execute(u'ROLLBACK TO SAVEPOINT pm_explain;')
+
+        slow_log.record(record)
+
+    # Returns the tiles of a parallel scan of a partitioned query or None if the query should be
+    # executed by a single command. The extent of the table, estimated from its statistics, is
+    # restricted to the envelope of the query and split in a grid of tiles
+    def _get_partition_tiles(self, config, connection, context, partition):
+        count = config[CONFIG_PARALLEL_TILES] if CONFIG_PARALLEL_TILES in config else DEFAULT_PARALLEL_TILES
+        min_rows = config[CONFIG_PARALLEL_MIN_ROWS] if CONFIG_PARALLEL_MIN_ROWS in config else DEFAULT_PARALLEL_MIN_ROWS
+
+        if count < 2:
+            return None
 
-            if field_name in db_resource['fields']:
-                db_field = db_resource['fields'][field_name]
+        resource = context['described'][partition['resource']]
+        if resource['table'] in [r.table for r in context['results'].values()]:
+            return None
 
-                if field_alias in parsed_query['fields']:
-                   raise DataException(u'Field {field} in resource {resource} is ambiguous.'.format(
-                        field = db_field['name'],
-                        resource = field_resource
-                    ))
+        extent = u'ST_SetSRID(ST_EstimatedExtent(%s, %s)::geometry, {srid})'.format(srid = resource['srid'])
+        values = (resource['table'], resource['geometry_column'])
 
-                parsed_query['fields'][field_alias] = {
-                    'fullname' : '{table}."{field}"'.format(
-                        table = db_resource['alias'],
-                        field = db_field['name']
-                    ),
-                    'name' : db_field['name'],
-                    'alias' : field_alias,
-                    'type' : db_field['type'],
-                    'is_geom' : True if db_field['name'] == db_resource['geometry_column'] else False,
-                    'srid' :  db_resource['srid'] if db_field['name'] == db_resource['geometry_column'] else None
-                }
-            else:
-                raise DataException(u'Field {field} does not exist in resource {resource}.'.format(
-                    field = field_name,
-                    resource = field_resource
-                ))
+        if not partition['envelope'] is None:
+            extent = u'ST_Intersection({extent}, ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, 3857), {srid}))'.format(extent = extent, srid = resource['srid'])
+            values += tuple(partition['envelope'])
 
-        # Check the number of geometry columns
-        if output_format == QUERY_FORMAT_GEOJSON:
-            count_geom_columns = reduce(lambda x, y: x+y, [1 if parsed_query['fields'][field]['is_geom'] else 0 for field in parsed_query['fields'].keys()])
-            if count_geom_columns != 1:
-                raise DataException(u'Format {format} requires exactly one geometry column'.format(
-                    format = output_format
-                ))
-
-        # Get constraints
-        if 'filters' in query and not type(query['filters']) is list:
-            raise DataException(u'Parameter filters should be a list with at least one item.')
-
-        if 'filters' in query and len(query['filters']) > 0:
-            for f in query['filters']:
-                parsed_query['filters'].append(self._create_filter(query_metadata, resource_mapping, f))
-
-        # Get order by
-        if 'sort' in query:
-            if not type(query['sort']) is list:
-                raise DataException('Parameter sort should be a list.')
-            elif len(query['sort']) > 0:
-                for i in range(0, len(query['sort'])):
-                    # Get sort field properties
-                    sort_resource = None
-                    sort_name = None
-                    sort_desc = False
-                    is_computed = False
-
-                    if type(query['sort'][i]) is dict:
-                        if 'name' in query['sort'][i]:
-                            sort_name = query['sort'][i]['name']
-                        else:
-                            raise DataException('Sorting field name is missing.')
-                        if 'resource' in query['sort'][i]:
-                            sort_resource = query['sort'][i]['resource']
-                        if 'desc' in query['sort'][i] and isinstance(query['sort'][i]['desc'], bool):
-                            sort_desc = query['sort'][i]['desc']
-                    elif isinstance(query['sort'][i], basestring):
-                        sort_name = query['sort'][i]
-                    else:
-                        raise DataException('Sorting field is malformed. Instance of string or dictionary is expected.')
-
-                    # If this is not a computed field, check if a field name or an alias is specified.
-                    # In the latter case, set the database field name
-                    if sort_name in parsed_query['fields']:
-                        if 'expression' in parsed_query['fields'][sort_name]:
-                            is_computed = True
-                        elif parsed_query['fields'][sort_name]['name'] != sort_name:
-                           sort_name = parsed_query['fields'][sort_name]['name']
-
-                    # Set resource if missing
-                    if not is_computed and sort_resource is None:
-                        resources = self._get_resources_by_field_name(query_metadata, sort_name)
-
-                        if len(resources) == 0:
-                            raise DataException(u'Sorting field {field} does not exist.'.format(
-                                field = sort_name
-                            ))
-                        elif len(resources) == 1:
-                            sort_resource = resources[0]
-                        else:
-                            raise DataException(u'Sorting field {field} is ambiguous for resources {resources}.'.format(
-                                field = sort_name,
-                                resources = u','.join(resources)
-                            ))
-
-                    # Check if resource exists in metadata
-                    if (not is_computed) and (not sort_resource in resource_mapping or not resource_mapping[sort_resource] in query_metadata):
-                        raise DataException(u'Resource {resource} for sorting field {field} does not exist.'.format(
-                            resource = sort_resource,
-                            field = sort_name
-                        ))
-
-                    if is_computed:
-                        sort_params = ('{expr} {desc}'.format(
-                            expr = parsed_query['fields'][sort_name]['expression'][0],
-                            desc = 'desc' if sort_desc else ''
-                        ), )
-                        sort_params += parsed_query['fields'][sort_name]['expression'][1:]
-
-                        parsed_query['sort'].append(sort_params)
-                    else:
-                        parsed_query['sort'].append(('{table}."{field}" {desc}'.format(
-                            table = query_metadata[resource_mapping[sort_resource]]['alias'],
-                            field = sort_name,
-                            desc = 'desc' if sort_desc else ''
-                        ), ))
+        sql = u"""select (select reltuples from pg_class where relname = %s) as "rows", ST_XMin(e) as xmin, ST_YMin(e) as ymin, ST_XMax(e) as xmax, ST_YMax(e) as ymax
+                  from (select box2d({extent}) as e) as q;""".format(extent = extent)
 
-        # Build SQL command
-        fields = []
-        tables = []
-        wheres = []
-        values = ()
-        where_clause = ''
-        orderby_clause = ''
-
-        # Select clause fields
-        for alias in parsed_query['fields']:
-            field = parsed_query['fields'][alias]
-
-            if 'expression' in field:
-                fields.append('{field} as "{alias}"'.format(
-                    field = field['expression'][0],
-                    alias = field['alias']
-                ))
-                values += field['expression'][1:]
-            elif field['is_geom'] and field['srid'] != srid:
-                fields.append('ST_Transform({geom}, {srid}) as "{alias}"'.format(
-                    geom = field['fullname'],
-                    srid = srid,
-                    alias = field['alias']
-                ))
-            else:
-                fields.append('{field} as "{alias}"'.format(
-                    field = field['fullname'],
-                    alias = field['alias']
-                ))
-
-        # From clause tables
-        tables = [ '"' + parsed_query['resources'][r]['table'] + '" as ' + parsed_query['resources'][r]['alias'] for r in parsed_query['resources']]
-
-        # Where clause
-        if len(parsed_query['filters']) > 0:
-            for filter_tuple in parsed_query['filters']:
-                wheres.append(filter_tuple[0])
-                values += filter_tuple[1:]
-
-        if len(wheres) > 0:
-            where_clause = u'where ' + u' AND '.join(wheres)
-
-        # Order by clause
-        if len(parsed_query['sort']) > 0:
-            orderby_clause = u'order by ' + u', '.join([f[0] for f in parsed_query['sort']])
-            for order_values in [f[1:] for f in parsed_query['sort']]:
-                values += order_values
-
-        # Build SQL
-        sql = "select distinct {fields} from {tables} {where} {orderby} limit {limit} offset {offset};".format(
-            fields = u','.join(fields),
-            tables = u','.join(tables),
-            where = where_clause,
-            orderby = orderby_clause,
-            limit = limit,
-            offset = offset
+        # Tables without statistics have no estimated extent
+        connection.execute(u'SAVEPOINT pm_extent;')
+        try:
+            row = connection.execute(sql, (resource['table'], ) + values).first()
+            connection.execute(u'RELEASE SAVEPOINT pm_extent;')
+        except DBAPIError as ex:
+            if _is_replica_error(ex):
+                raise
+
+            log.debug(u'Failed to estimate the extent of resource {id}: {error}'.format(id = resource['id'], error = ex))
+
+            connection.execute(u'ROLLBACK TO SAVEPOINT pm_extent;')
+            return None
+
+        if row is None or row['rows'] is None or row['rows'] < min_rows or row['xmin'] is None:
+            return None
+
+        columns = int(math.ceil(math.sqrt(count)))
+        rows = int(math.ceil(float(count) / columns))
+
+        xs = [row['xmin'] + (row['xmax'] - row['xmin']) * i / columns for i in range(0, columns + 1)]
+        ys = [row['ymin'] + (row['ymax'] - row['ymin']) * i / rows for i in range(0, rows + 1)]
+
+        xs[0] = ys[0] = -_TILE_UNBOUNDED
+        xs[-1] = ys[-1] = _TILE_UNBOUNDED
+
+        tiles = []
+        for j in range(0, rows):
+            for i in range(0, columns):
+                tiles.append((xs[i], ys[j], xs[i + 1], ys[j + 1]))
+
+        return tiles
+
+    # Executes the tiles of a partitioned query concurrently and merges their rows. The thread of the
+    # query executes tiles on the connection of the query, and workers on connections of a dedicated
+    # pool of the replica of the query. Workers only start while the pool has free connections, hence
+    # they never wait for one and a query progresses even if the pool is exhausted. Every worker is
+    # accounted by the router as an outstanding request of the replica. Every tile returns up to
+    # offset plus limit rows, sorted if the query is sorted. The merged rows are sorted and paged like
+    # the rows of the query
+    def _execute_partitioned(self, config, context, compiled_query, tiles):
+        workers = config[CONFIG_PARALLEL_WORKERS] if CONFIG_PARALLEL_WORKERS in config else DEFAULT_PARALLEL_WORKERS
+        connections = config[CONFIG_PARALLEL_CONNECTIONS] if CONFIG_PARALLEL_CONNECTIONS in config else DEFAULT_PARALLEL_CONNECTIONS
+
+        index = compiled_query['partition']['index']
+        limit = compiled_query['limit']
+        offset = compiled_query['offset']
+
+        values = compiled_query['values'][:-2] + (limit + offset, 0)
+
+        pending = range(0, len(tiles))
+        results = [None] * len(tiles)
+        columns = []
+        errors = []
+        lock = threading.Lock()
+
+        deadline = context['deadline']
+        router = context['router']
+        replica = context['replica']
+
+        engine, slots = _get_parallel_pool(replica.url, connections)
+
+        def execute_tiles(connection):
+            while True:
+                with lock:
+                    if len(pending) == 0 or len(errors) > 0:
+                        return
+                    tile = pending.pop(0)
+
+                xmin, ymin, xmax, ymax = tiles[tile]
+                tile_values = values[:index] + (xmin, ymin, xmax, ymax, xmin, xmax, ymin, ymax, tile == 0) + values[index + 9:]
+
+                deadline.check()
+
+                records = connection.execute(compiled_query['sql'], tile_values)
+                try:
+                    if len(columns) == 0:
+                        columns.extend(records.keys())
+                    results[tile] = records.cursor.fetchall()
+                finally:
+                    records.close()
+
+        def worker():
+            connection = None
+            failed = False
+
+            try:
+                connection = engine.connect()
+
+                transaction = connection.begin()
+                try:
+                    connection.execute(u'SET LOCAL statement_timeout TO {0};'.format(max(deadline.remaining(), 1)))
+
+                    with _watch(deadline, connection):
+                        execute_tiles(connection)
+                finally:
+                    transaction.rollback()
+            except Exception as ex:
+                if isinstance(ex, DBAPIError):
+                    failed = _is_replica_error(ex)
+
+                with lock:
+                    errors.append(ex)
+            finally:
+                try:
+                    if not connection is None:
+                        connection.close()
+                finally:
+                    slots.release()
+                    router.release(replica, failed)
+
+        threads = []
+        for i in range(0, min(workers, len(tiles)) - 1):
+            if not slots.acquire(False):
+                break
+
+            # Named results only exist on the replica of the query, hence every other replica is
+            # excluded
+            router.acquire([r for r in router.replicas if not r is replica])
+
+            thread = threading.Thread(target=worker)
+            thread.start()
+            threads.append(thread)
+
+        # The connection of the query is already watched and its statement timeout is set
+        try:
+            execute_tiles(context['connection_data'])
+        except Exception as ex:
+            with lock:
+                errors.append(ex)
+
+        for thread in threads:
+            thread.join()
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        rows = []
+        for tile_rows in results:
+            rows.extend(tile_rows)
+
+        return self._merge_rows(rows, columns, compiled_query['partition']['sort'], offset, limit)
+
+    # Sorts and pages the rows of several commands
+    def _merge_rows(self, rows, columns, sort, offset, limit):
+        # Sort keys are applied from the last to the first since sorting is stable. Null values are
+        # sorted as if larger than any other value as in PostgreSQL
+        for alias, desc in reversed(sort):
+            position = columns.index(alias)
+            rows.sort(key = lambda r: (r[position] is None, r[position]), reverse = desc)
+
+        return _MergedResult(columns, rows[offset:offset + limit])
+
+    # Executes a bounding box query using a cache of tiles and returns None if the query is not
+    # cached. Queries of a single resource in EPSG:3857 with a single rectangle intersecting the
+    # geometry field are cached. The rectangle is snapped to a grid of tiles whose zoom level
+    # depends on the size of the rectangle. Tiles are cached per resource version, fields and
+    # remaining filters, and only missing tiles are queried. Only resources stored in EPSG:3857 are
+    # cached, hence features of cached tiles are filtered by the rectangle in the CRS the database
+    # compares them in. A resource changes version whenever catalog synchronization applies a
+    # revision to it, otherwise cached tiles expire after the cache time to live
+    def _execute_cached(self, config, context, compiler, compiled_query):
+        capacity = config[CONFIG_CACHE_TILES_SIZE] if CONFIG_CACHE_TILES_SIZE in config else DEFAULT_CACHE_TILES_SIZE
+        ttl = config[CONFIG_CACHE_TILES_TTL] if CONFIG_CACHE_TILES_TTL in config else DEFAULT_CACHE_TILES_TTL
+
+        query = context['query']
+
+        if capacity <= 0 or context['crs'] != CRS_DEFAULT_OUTPUT:
+            return None
+
+        resource = context['described'][compiled_query['partition']['resource']]
+        if resource['table'] in [r.table for r in context['results'].values()] or resource['srid'] != CRS_DEFAULT_OUTPUT:
+            return None
+
+        # Find the rectangle
+        bbox_index = None
+        for index, f in enumerate(query.get('filters') or []):
+            arguments = f.get('arguments') if type(f) is dict else None
+            if not type(arguments) is list:
+                return None
+
+            geometries = [a for a in arguments if isinstance(a, shapely.geometry.base.BaseGeometry)]
+            if len(geometries) == 0:
+                continue
+
+            if not bbox_index is None or f['operator'] != OP_INTERSECTS or len(geometries) != 1 or not compiler._is_rectangle(geometries[0]):
+                return None
+
+            fields = [a for a in arguments if type(a) is dict and a.get('name') == resource['geometry_column']]
+            if len(fields) != 1:
+                return None
+
+            bbox_index = index
+            bbox = geometries[0]
+
+        if bbox_index is None:
+            return None
+
+        geometry_positions = [alias for alias in compiled_query['fields'] if compiled_query['fields'][alias]['is_geom']]
+        if len(geometry_positions) == 0:
+            return None
+
+        filters = [f for index, f in enumerate(query['filters']) if index != bbox_index]
+
+        key = (
+            resource['table'],
+            self.catalog.get_resource_version(resource['id']),
+            json.dumps(compiled_query['fields'], cls=ShapelyGeoJsonEncoder, sort_keys=True),
+            json.dumps(filters, cls=ShapelyGeoJsonEncoder, sort_keys=True)
         )
 
-        # Execute query and aggregate execution time
-        start_time = time.time()
+        zoom = get_tile_zoom(bbox.bounds)
+
+        tile_query = dict(query)
+        for name in ['sort', 'limit', 'offset', 'count', 'name']:
+            tile_query.pop(name, None)
+
+        columns = None
+        entries = []
+
+        for tile, bounds in get_tiles(bbox.bounds, zoom):
+            tile_key = key + (zoom, tile)
+
+            cached = self.tiles.get(ttl, tile_key)
+            if cached is None:
+                bbox_filter = dict(query['filters'][bbox_index])
+                bbox_filter['arguments'] = [shapely.geometry.box(*bounds) if isinstance(a, shapely.geometry.base.BaseGeometry) else a for a in bbox_filter['arguments']]
+                tile_query['filters'] = filters + [bbox_filter]
+
+                compiled_tile = compiler.compile(tile_query, context['described'], context['crs'], context['output_format'], identity = True)
+
+                records = self._execute_statement(config, context['connection_data'], compiled_tile['sql'], compiled_tile['values'])
+                try:
+                    tile_columns = records.keys()
+                    rows = records.cursor.fetchall()
+                finally:
+                    records.close()
+
+                # Tiles with more rows than a query may return are incomplete
+                if len(rows) >= MAX_RESULT_ROWS:
+                    return None
+
+                geometry_position = tile_columns.index(geometry_positions[0])
+                identity_position = tile_columns.index(QUERY_IDENTITY_COLUMN)
+
+                # Entries are (identity, row without identity, bounding box)
+                tile_entries = []
+                for r in rows:
+                    r = tuple(r)
+                    row = r[:identity_position] + r[identity_position + 1:]
+                    try:
+                        hash(row)
+                    except TypeError:
+                        return None
+
+                    geometry = r[geometry_position]
+                    tile_entries.append((r[identity_position], row, None if geometry is None else shapely.wkb.loads(geometry.decode("hex")).bounds))
+
+                tile_columns = tile_columns[:identity_position] + tile_columns[identity_position + 1:]
+                if geometry_position > identity_position:
+                    geometry_position -= 1
+
+                cached = (tile_columns, geometry_position, tile_entries)
+                self.tiles.set(capacity, tile_key, cached)
+
+            columns = cached[0]
+            geometry_position = cached[1]
+            entries.extend(cached[2])
+
+        # Features whose bounding box is within the rectangle are not tested any further
+        xmin, ymin, xmax, ymax = bbox.bounds
+        prepared_bbox = shapely.prepared.prep(bbox)
+
+        # Features that intersect several tiles are returned by each one and are identified by their
+        # row identity. The rows of the query are distinct, hence features with equal rows are
+        # returned once like by the select distinct of an uncached query
+        rows = []
+        identities = set()
+        unique = set()
+        for identity, r, bounds in entries:
+            if identity in identities:
+                continue
+            identities.add(identity)
+
+            if bounds is None or bounds[0] > xmax or bounds[2] < xmin or bounds[1] > ymax or bounds[3] < ymin:
+                continue
+            if not (bounds[0] >= xmin and bounds[2] <= xmax and bounds[1] >= ymin and bounds[3] <= ymax):
+                if not prepared_bbox.intersects(shapely.wkb.loads(r[geometry_position].decode("hex"))):
+                    continue
+
+            if r in unique:
+                continue
+            unique.add(r)
 
-        command_timeout = max(int(timeout - (context['elapsed_time'] * 1000)), 1000)
+            rows.append(r)
 
-        connection_data.execute(u'SET LOCAL statement_timeout TO {0};'.format(command_timeout))
-        records = connection_data.execute(sql, values)
+        return self._merge_rows(rows, columns, compiled_query['partition']['sort'], compiled_query['offset'], compiled_query['limit'])
 
-        elapsed_time = min((time.time() - start_time), 1)
-        context['elapsed_time'] = context['elapsed_time'] + elapsed_time
+    # Decodes result rows to features or records. Column positions are resolved once per query and
+    # every row is read positionally. If a budget is set, decoding stops at the first row that does
+    # not fit in the budget. If a deadline is set, decoding stops with an error once it expires
+    def decode_rows(self, rows, columns, fields, output_format, budget=None, deadline=None):
+        return list(self._decode_rows(rows, columns, fields, output_format, budget, deadline))
 
-        if context['elapsed_time'] >= (config[CONFIG_SQL_TIMEOUT] / 1000):
-            raise DataException(u'Execution timeout has expired. Current timeout value is {timeout} seconds.'.format(
-                timeout = (config[CONFIG_SQL_TIMEOUT] / 1000)
-            ))
+    def _decode_rows(self, rows, columns, fields, output_format, budget=None, deadline=None):
+        if not budget is None:
+            rows = self._limit_rows(rows, budget, columns, fields, output_format)
+        if not deadline is None:
+            rows = self._check_deadline(rows, deadline)
+
+        positions = dict([(column, index) for index, column in enumerate(columns)])
 
         if output_format == QUERY_FORMAT_GEOJSON:
+            names = tuple([alias for alias in fields if not fields[alias]['is_geom']])
+            geometry_index = [positions[alias] for alias in fields if fields[alias]['is_geom']][0]
+
+            get_values = self._create_getter([positions[alias] for alias in names])
+
             # Add GeoJSON records
             feature_id = 0
-            for r in records:
+            for r in rows:
                 feature_id += 1
-                feature = {
-                    'id' : feature_id,
-                    'properties': {},
-                    'geometry': None,
-                    'type': 'Feature'
-                }
-                for field in parsed_query['fields'].keys():
-                    if parsed_query['fields'][field]['is_geom']:
-                        feature['geometry'] = shapely.wkb.loads(r[field].decode("hex"))
-                    else:
-                        feature['properties'][field] = r[field]
-                result.append(feature)
+
+                geometry = r[geometry_index]
+                if not geometry is None:
+                    geometry = shapely.wkb.loads(geometry.decode("hex"))
+
+                yield Feature(feature_id, geometry, names, get_values(r))
         else:
-            # Add flat json records
-            for r in records:
-                record = {}
-                for field in parsed_query['fields'].keys():
-                    if parsed_query['fields'][field]['is_geom']:
-                        record[field] = shapely.wkb.loads(r[field].decode("hex"))
-                    else:
-                        record[field] = r[field]
-                result.append(record)
+            names = tuple(fields.keys())
+            geometry_indexes = [index for index, alias in enumerate(names) if fields[alias]['is_geom']]
 
-        return result
+            get_values = self._create_getter([positions[alias] for alias in names])
 
-    def _create_filter(self, metadata, mapping, f):
-        if not type(f) is dict:
-            raise DataException('Filter must be a dictionary.')
+            # Add flat json records
+            for r in rows:
+                values = get_values(r)
+
+                if len(geometry_indexes) > 0:
+                    values = list(values)
+                    for index in geometry_indexes:
+                        if not values[index] is None:
+                            values[index] = shapely.wkb.loads(values[index].decode("hex"))
+                    values = tuple(values)
+
+                yield Record(names, values)
+
+    def _read_count(self, rows, position, context):
+        for r in rows:
+            if context['count'] is None:
+                context['count'] = r[position]
+
+            yield r
+
+    # Stops at the first row whose estimated size once encoded to JSON does not fit in the budget.
+    # Property names and the feature envelope have the same size for every row. Hex encoded WKB
+    # geometries grow by about a third as GeoJSON coordinates, strings by their quotes and other
+    # values are counted as the longest number
+    def _limit_rows(self, rows, budget, columns, fields, output_format):
+        positions = []
+        geometry_positions = []
+        row_size = 0
+
+        for alias in fields:
+            if output_format == QUERY_FORMAT_GEOJSON and fields[alias]['is_geom']:
+                row_size += _ENCODED_FEATURE_SIZE
+            else:
+                row_size += len(alias) + _ENCODED_NAME_SIZE
 
-        if not 'operator' in f:
-            raise DataException('Parameter operator is missing from filter.')
+            if fields[alias]['is_geom']:
+                geometry_positions.append(columns.index(alias))
+            else:
+                positions.append(columns.index(alias))
 
-        if not f['operator'] in ALL_OPERATORS:
-            raise DataException('Operator {operator} is not supported.'.format(operator = f['operator']))
+        for r in rows:
+            size = row_size
 
-        if not 'arguments' in f:
-            raise DataException('Parameter arguments is missing from filter.')
+            for position in positions:
+                value = r[position]
+                if value is None:
+                    size += _ENCODED_NULL_SIZE
+                elif isinstance(value, basestring):
+                    size += len(value) + _ENCODED_STRING_SIZE
+                else:
+                    size += _ENCODED_VALUE_SIZE
 
-        if not type(f['arguments']) is list or len(f['arguments']) == 0:
-            raise DataException('Parameter arguments must be a list with at least one member.')
+            for position in geometry_positions:
+                value = r[position]
+                if value is None:
+                    size += _ENCODED_NULL_SIZE
+                else:
+                    size += len(value) * 4 // 3 + _ENCODED_GEOMETRY_SIZE
 
-        try:
-            if f['operator'] in COMPARE_OPERATORS:
-                index = COMPARE_OPERATORS.index(f['operator'])
-                return self._create_filter_compare(metadata, mapping, f, f['operator'], COMPARE_EXPRESSIONS[index])
+            if not budget.consume(size):
+                return
 
-            if f['operator'] in SPATIAL_OPERATORS:
-                return self._create_filter_spatial(metadata, mapping, f, f['operator'])
+            yield r
 
-        except ValueError as ex:
-            message = 'Failed to parse argument value for operator {operator}.'.format(operator = f['operator'])
+    def _check_deadline(self, rows, deadline):
+        for index, r in enumerate(rows):
+            if index % _DEADLINE_CHECK_ROWS == 0:
+                deadline.check()
 
-            log.exception(message)
+            yield r
 
-            raise DataException(message)
-
-        return None
-
-    def _create_filter_compare(self, metadata, mapping, f, operator, expression):
-        if len(f['arguments']) != 2:
-            raise DataException('Operator {operator} expects two arguments.'.format(operator = operator))
-
-        arg1 = f['arguments'][0]
-        arg2 = f['arguments'][1]
-
-        arg1_is_field = self._is_field(metadata, mapping, arg1)
-        arg1_type = None
-        if arg1_is_field:
-            arg1_type = self._get_field_type(metadata, mapping, arg1)
-
-        arg2_is_field = self._is_field(metadata, mapping, arg2)
-        arg2_type = None
-        if arg2_is_field:
-            arg2_type = self._get_field_type(metadata, mapping, arg2)
-
-        arg1_is_field_geom = self._is_field_geom(metadata, mapping, arg1)
-        arg2_is_field_geom = self._is_field_geom(metadata, mapping, arg2)
-
-        if arg1_is_field_geom or arg2_is_field_geom:
-            raise DataException('Operator {operator} does not support geometry types.'.format(operator = operator))
-
-        if arg1_is_field and arg2_is_field:
-            if operator == OP_LIKE:
-                raise DataException('Operator {operator} does not support two fields as arguments.'.format(operator = operator))
-
-            aliased_arg1 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg1['resource']]]['alias'],
-                field = arg1['name']
-            )
-            aliased_arg2 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg2['resource']]]['alias'],
-                field = arg2['name']
-            )
-            return ('(' + aliased_arg1 + ' ' + expression + ' ' + aliased_arg2 + ')',)
-        elif arg1_is_field and not arg2_is_field:
-            aliased_arg1 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg1['resource']]]['alias'],
-                field = arg1['name']
-            )
-            convert_to = ''
-
-            if operator == OP_LIKE:
-                if arg1_type != 'varchar':
-                    raise DataException('Operator {operator} only supports text fields.'.format(operator = operator))
-
-                arg2 = u'%' + unicode(arg2) + u'%'
-            else:
-                if arg1_type == 'varchar' and isinstance(arg2, numbers.Number):
-                    if isinstance(arg2, int):
-                        convert_to = '::int'
-                    if isinstance(arg2, float):
-                        convert_to = '::float'
-
-
-            return ('(' +aliased_arg1 + convert_to + ' ' + expression + ' %s)', arg2)
-        elif not arg1_is_field and arg2_is_field:
-            aliased_arg2 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg2['resource']]]['alias'],
-                field = arg2['name']
-            )
-            convert_to = ''
-
-            if operator == OP_LIKE:
-                if arg2_type != 'varchar':
-                    raise DataException('Operator {operator} only supports text fields.'.format(operator = operator))
-
-                arg1 = u'%' + unicode(arg1) + u'%'
-            else:
-                if arg2_type == 'varchar' and isinstance(arg1, numbers.Number):
-                    if isinstance(arg1, int):
-                        convert_to = '::int'
-                    if isinstance(arg1, float):
-                        convert_to = '::float'
+    def _create_getter(self, positions):
+        if len(positions) == 0:
+            return lambda r: ()
+        if len(positions) == 1:
+            position = positions[0]
+            return lambda r: (r[position], )
 
-            return ('(' + aliased_arg2 + convert_to  + ' ' + expression + ' %s)', arg1)
-        else:
-            if operator == OP_LIKE:
-                raise DataException('Operator {operator} does not support two fields as literals.'.format(operator = operator))
-
-            return ('(%s ' + expression + ' %s)', arg1, arg2)
-
-    def _create_filter_spatial(self, metadata, mapping, f, operator):
-        if operator == OP_AREA:
-            if len(f['arguments']) != 3:
-                raise DataException('Operator {operator} expects three arguments.'.format(operator = operator))
-            return self._create_filter_spatial_area(metadata, mapping, f, operator)
-        elif operator == OP_DISTANCE:
-            if len(f['arguments']) != 4:
-                raise DataException('Operator {operator} expects four arguments.'.format(operator = operator))
-            return self._create_filter_spatial_distance(metadata, mapping, f, operator)
-        elif operator == OP_CONTAINS:
-            if len(f['arguments']) != 2:
-                raise DataException('Operator {operator} expects two.'.format(operator = operator))
-            return self._create_filter_spatial_relation(metadata, mapping, f, operator, 'ST_Contains')
-        elif operator == OP_INTERSECTS:
-            if len(f['arguments']) != 2:
-                raise DataException('Operator {operator} expects two arguments.'.format(operator = operator))
-            return self._create_filter_spatial_relation(metadata, mapping, f, operator, 'ST_Intersects')
-
-    def _create_filter_spatial_area(self, metadata, mapping, f, operator):
-        arg1 = f['arguments'][0]
-        arg2 = f['arguments'][1]
-        arg3 = f['arguments'][2]
-
-        if arg2 in SPATIAL_COMPARE_OPERATORS:
-            arg2 = COMPARE_EXPRESSIONS[COMPARE_OPERATORS.index(arg2)]
-        else:
-            raise DataException('Expression {expression} for operator {operator} is not valid.'.format(expression = arg2, operator = operator))
-
-        arg1_is_field = self._is_field(metadata, mapping, arg1)
-        arg1_srid = CRS_DEFAULT_DATABASE
-        arg1_is_field_geom = self._is_field_geom(metadata, mapping, arg1)
-        if arg1_is_field_geom:
-            arg1_srid = self._get_field_srid(metadata, mapping, arg1)
-        arg1_is_geom = self._is_geom(metadata, arg1)
-
-        if not arg1_is_field_geom and not arg1_is_geom:
-            raise DataException('First argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = operator))
-
-        if not isinstance(arg3, numbers.Number):
-            raise DataException('Third argument for operator {operator} must be number.'.format(operator = operator))
-
-        if arg1_is_field_geom:
-            aliased_arg1 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg1['resource']]]['alias'],
-                field = arg1['name']
-            )
-
-            if arg1_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg1 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg1,
-                srid = CRS_DEFAULT_DATABASE
-            )
-
-            return ('(ST_Area(' + aliased_arg1 + ') ' + arg2 + ' %s)', arg3)
-        else:
-            return ('(ST_Area(ST_GeomFromText(%s, 3857)) ' + arg2 + ' %s)', shapely.wkt.dumps(arg1), arg3)
+        return operator.itemgetter(*positions)
 
-    def _create_filter_spatial_distance(self, metadata, mapping, f, operator):
-        arg1 = f['arguments'][0]
-        arg2 = f['arguments'][1]
-        arg3 = f['arguments'][2]
-        arg4 = f['arguments'][3]
+    def _execute_statement(self, config, connection, sql, values):
+        threshold = config[CONFIG_SQL_PREPARE_THRESHOLD] if CONFIG_SQL_PREPARE_THRESHOLD in config else DEFAULT_SQL_PREPARE_THRESHOLD
+        capacity = config[CONFIG_SQL_PREPARE_CACHE_SIZE] if CONFIG_SQL_PREPARE_CACHE_SIZE in config else DEFAULT_SQL_PREPARE_CACHE_SIZE
 
-        if arg3 in SPATIAL_COMPARE_OPERATORS:
-            arg3 = COMPARE_EXPRESSIONS[COMPARE_OPERATORS.index(arg3)]
-        else:
-            raise DataException('Expression {expression} for operator {operator} is not valid.'.format(expression = arg3, operator = operator))
-
-        arg1_is_field = self._is_field(metadata, mapping, arg1)
-        arg2_is_field = self._is_field(metadata, mapping, arg2)
-
-        arg1_srid = CRS_DEFAULT_DATABASE
-        arg2_srid = CRS_DEFAULT_DATABASE
-
-        arg1_is_field_geom = self._is_field_geom(metadata, mapping, arg1)
-        if arg1_is_field_geom:
-            arg1_srid = self._get_field_srid(metadata, mapping, arg1)
-
-        arg2_is_field_geom = self._is_field_geom(metadata, mapping, arg2)
-        if arg2_is_field_geom:
-            arg2_srid = self._get_field_srid(metadata, mapping, arg2)
-
-        arg1_is_geom = self._is_geom(metadata, arg1)
-        arg2_is_geom = self._is_geom(metadata, arg2)
-
-        if not arg1_is_field_geom and not arg1_is_geom:
-            raise DataException('First argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
-
-        if not arg2_is_field_geom and not arg2_is_geom:
-            raise DataException('Second argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
-
-        if not isinstance(arg4, numbers.Number):
-            raise DataException('Third argument for operator {operator} must be number.'.format(operator = OP_DISTANCE))
-
-        if arg1_is_field_geom and arg2_is_field_geom:
-            aliased_arg1 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg1['resource']]]['alias'],
-                field = arg1['name']
-            )
-            if arg1_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg1 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg1,
-                srid = CRS_DEFAULT_DATABASE
-            )
-
-            aliased_arg2 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg2['resource']]]['alias'],
-                field = arg2['name']
-            )
-            if arg2_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg2 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg2,
-                srid = CRS_DEFAULT_DATABASE
-            )
-            return ('(ST_Distance(' + aliased_arg1 + ',' + aliased_arg2 + ') ' + arg3 + ' %s)', arg4)
-        elif arg1_is_field_geom and not arg2_is_field_geom:
-            aliased_arg1 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg1['resource']]]['alias'],
-                field = arg1['name']
-            )
-            if arg1_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg1 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg1,
-                srid = CRS_DEFAULT_DATABASE
-            )
-            return ('(ST_Distance(' + aliased_arg1 + ', ST_Transform(ST_GeomFromText(%s, 3857), ' + str(CRS_DEFAULT_DATABASE) + ')) ' + arg3 + ' %s)', shapely.wkt.dumps(arg2), arg4)
-        elif not arg1_is_field_geom and arg2_is_field_geom:
-            aliased_arg2 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg2['resource']]]['alias'],
-                field = arg2['name']
-            )
-            if arg2_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg2 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg2,
-                srid = CRS_DEFAULT_DATABASE
-            )
-            return ('(ST_Distance(' + aliased_arg2 + ', ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) + ')) ' + arg3 + ' %s)', shapely.wkt.dumps(arg1), arg4)
-        else:
-            return ('(ST_Distance(ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) +
-                    '), ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) + ')) ' + arg3 + ' %s)', shapely.wkt.dumps(arg1), shapely.wkt.dumps(arg2), arg4)
-
-    def _create_filter_spatial_relation(self, metadata, mapping, f, operator, spatial_operator):
-        arg1 = f['arguments'][0]
-        arg2 = f['arguments'][1]
-
-        arg1_is_field = self._is_field(metadata, mapping, arg1)
-        arg2_is_field = self._is_field(metadata, mapping, arg2)
-
-        arg1_srid = CRS_DEFAULT_DATABASE
-        arg2_srid = CRS_DEFAULT_DATABASE
-
-        arg1_is_field_geom = self._is_field_geom(metadata, mapping, arg1)
-        if arg1_is_field_geom:
-            arg1_srid = self._get_field_srid(metadata, mapping, arg1)
-
-        arg2_is_field_geom = self._is_field_geom(metadata, mapping, arg2)
-        if arg2_is_field_geom:
-            arg2_srid = self._get_field_srid(metadata, mapping, arg2)
-
-        arg1_is_geom = self._is_geom(metadata, arg1)
-        arg2_is_geom = self._is_geom(metadata, arg2)
-
-        if not arg1_is_field_geom and not arg1_is_geom:
-            raise DataException('First argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
-
-        if not arg2_is_field_geom and not arg2_is_geom:
-            raise DataException('Second argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
-
-        if arg1_is_field_geom and arg2_is_field_geom:
-            aliased_arg1 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg1['resource']]]['alias'],
-                field = arg1['name']
-            )
-            if arg1_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg1 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg1,
-                srid = CRS_DEFAULT_DATABASE
-            )
-
-            aliased_arg2 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg2['resource']]]['alias'],
-                field = arg2['name']
-            )
-            if arg2_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg2 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg2,
-                srid = CRS_DEFAULT_DATABASE
-            )
-            return ('(' + spatial_operator +'(' + aliased_arg1 + ',' + aliased_arg2 + ') = TRUE)', )
-        elif arg1_is_field_geom and not arg2_is_field_geom:
-            aliased_arg1 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg1['resource']]]['alias'],
-                field = arg1['name']
-            )
-            if arg1_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg1 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg1,
-                srid = CRS_DEFAULT_DATABASE
-            )
-            return ('(' + spatial_operator +'(' + aliased_arg1 + ', ST_Transform(ST_GeomFromText(%s, 3857), ' + str(CRS_DEFAULT_DATABASE) + ')) = TRUE)', shapely.wkt.dumps(arg2))
-        elif not arg1_is_field_geom and arg2_is_field_geom:
-            aliased_arg2 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg2['resource']]]['alias'],
-                field = arg2['name']
-            )
-            if arg2_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg2 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg2,
-                srid = CRS_DEFAULT_DATABASE
-            )
-            return ('(' + spatial_operator +'(ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) +
-                    '), ' + aliased_arg2 + ') = TRUE)', shapely.wkt.dumps(arg1))
-        else:
-            return ('(' + spatial_operator +'(ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) +
-                    '), ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) + '))  = TRUE)', shapely.wkt.dumps(arg1), shapely.wkt.dumps(arg2))
+        if threshold <= 0 or capacity <= 0:
+            return connection.execute(sql, values)
 
-    def _create_computed_field(self, metadata, mapping, f):
-        if not type(f) is dict:
-            raise DataException('Field must be a dictionary.')
+        # Prepared statements live as long as the DBAPI connection. The cache is attached to the
+        # pooled connection record and discarded if the record has reconnected in the meantime
+        pooled_connection = connection.connection
+        cache = pooled_connection.info.get('prepared_statements')
+        if cache is None or not cache.connection is pooled_connection.connection:
+            cache = _PreparedStatementCache(pooled_connection.connection, capacity)
+            pooled_connection.info['prepared_statements'] = cache
 
-        if not 'operator' in f:
-            raise DataException('Parameter operator is missing for computed field.')
+        name = cache.get(sql)
 
-        if not f['operator'] in FIELD_OPERATORS:
-            raise DataException('Operator {operator} is not supported for computed fields.'.format(operator = f['operator']))
+        if name is None:
+            if sql in cache.rejected or cache.hit(sql) < threshold:
+                return connection.execute(sql, values)
 
-        if not 'arguments' in f:
-            raise DataException('Parameter arguments is missing for computed field.')
+            name, evicted = cache.add(sql)
 
-        if not type(f['arguments']) is list or len(f['arguments']) == 0:
-            raise DataException('Parameter arguments must be a list with at least one member.')
+            for evicted_name in evicted:
+                connection.execute(u'DEALLOCATE {name};'.format(name = evicted_name))
 
-        if not 'alias' in f:
-            raise DataException('Parameter alias is missing for computed field.')
+            # Parameter types are inferred by PostgreSQL. A failed PREPARE must not abort the
+            # surrounding transaction, hence the savepoint
+            index = [0]
+            def placeholder(match):
+                index[0] += 1
+                return '$' + str(index[0])
 
-        operator = f['operator']
+            prepare_sql = u'PREPARE {name} AS {sql}'.format(name = name, sql = re.sub('%s', placeholder, sql.rstrip(u'; ')))
 
-        if operator == OP_AREA:
-            if len(f['arguments']) !=1:
-                raise DataException('Operator {operator} expects one argument for computed fields.'.format(operator = operator))
-            return {
-                'alias' : f['alias'],
-                'expression' : self._create_computed_field_spatial_area(metadata, mapping, f, operator),
-                'is_geom': False
-            }
-        elif operator == OP_DISTANCE:
-            if len(f['arguments']) != 2:
-                raise DataException('Operator {operator} expects two arguments for computed fields.'.format(operator = operator))
-            return {
-                'alias' : f['alias'],
-                'expression' : self._create_computed_field_spatial_distance(metadata, mapping, f, operator),
-                'is_geom': False
-            }
+            connection.execute(u'SAVEPOINT pm_prepare;')
+            try:
+                connection.execute(prepare_sql)
+                connection.execute(u'RELEASE SAVEPOINT pm_prepare;')
+            except DBAPIError as ex:
+                log.debug(u'Failed to prepare statement {name}: {error}'.format(name = name, error = ex))
 
-    def _create_computed_field_spatial_area(self, metadata, mapping, f, operator):
-        arg = f['arguments'][0]
+                connection.execute(u'ROLLBACK TO SAVEPOINT pm_prepare;')
+                cache.statements.pop(sql, None)
+                cache.rejected.add(sql)
 
-        arg_is_field = self._is_field(metadata, mapping, arg)
-        arg_srid = CRS_DEFAULT_DATABASE
-        arg_is_field_geom = self._is_field_geom(metadata, mapping, arg)
-        if arg_is_field_geom:
-            arg_srid = self._get_field_srid(metadata, mapping, arg)
-        arg_is_geom = self._is_geom(metadata, arg)
+                return connection.execute(sql, values)
 
-        if not arg_is_field_geom and not arg_is_geom:
-            raise DataException('First argument for computed field {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = operator))
+        execute_sql = u'EXECUTE {name}({parameters});'.format(
+            name = name,
+            parameters = u','.join(['%s'] * len(values))
+        )
 
-        if arg_is_field_geom:
-            aliased_arg = '{table}."{field}"'.format(
-                table = metadata[mapping[arg['resource']]]['alias'],
-                field = arg['name']
-            )
+        return connection.execute(execute_sql, values)
 
-            if arg_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg,
-                srid = CRS_DEFAULT_DATABASE
-            )
+    # Stores the result of a queue item in a temporary table of the data connection and returns its
+    # rows. Subsequent queue items may access the table as a resource using the result name. Fields
+    # become columns named after their aliases and geometries are expressed in the output CRS
+    def _materialize_result(self, connection, context, name, compiled_query, stream=False):
+        table = 'pm_result_' + uuid.uuid4().hex
 
-            return ('(ST_Area(' + aliased_arg + '))', )
-        else:
-            return ('(ST_Area(ST_GeomFromText(%s, 3857)))', shapely.wkt.dumps(arg), )
-
-    def _create_computed_field_spatial_distance(self, metadata, mapping, f, operator):
-        arg1 = f['arguments'][0]
-        arg2 = f['arguments'][1]
-
-        arg1_is_field = self._is_field(metadata, mapping, arg1)
-        arg2_is_field = self._is_field(metadata, mapping, arg2)
-
-        arg1_srid = CRS_DEFAULT_DATABASE
-        arg2_srid = CRS_DEFAULT_DATABASE
-
-        arg1_is_field_geom = self._is_field_geom(metadata, mapping, arg1)
-        if arg1_is_field_geom:
-            arg1_srid = self._get_field_srid(metadata, mapping, arg1)
-
-        arg2_is_field_geom = self._is_field_geom(metadata, mapping, arg2)
-        if arg2_is_field_geom:
-            arg2_srid = self._get_field_srid(metadata, mapping, arg2)
-
-        arg1_is_geom = self._is_geom(metadata, arg1)
-        arg2_is_geom = self._is_geom(metadata, arg2)
-
-        if not arg1_is_field_geom and not arg1_is_geom:
-            raise DataException('First argument for computed field {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
-
-        if not arg2_is_field_geom and not arg2_is_geom:
-            raise DataException('Second argument for computed field {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
-
-        if arg1_is_field_geom and arg2_is_field_geom:
-            aliased_arg1 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg1['resource']]]['alias'],
-                field = arg1['name']
-            )
-            if arg1_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg1 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg1,
-                srid = CRS_DEFAULT_DATABASE
-            )
-
-            aliased_arg2 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg2['resource']]]['alias'],
-                field = arg2['name']
-            )
-            if arg2_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg2 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg2,
-                srid = CRS_DEFAULT_DATABASE
-            )
-            return ('(ST_Distance(' + aliased_arg1 + ',' + aliased_arg2 + '))', )
-        elif arg1_is_field_geom and not arg2_is_field_geom:
-            aliased_arg1 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg1['resource']]]['alias'],
-                field = arg1['name']
-            )
-            if arg1_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg1 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg1,
-                srid = CRS_DEFAULT_DATABASE
-            )
-            return ('(ST_Distance(' + aliased_arg1 + ', ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) + ')))', shapely.wkt.dumps(arg2), )
-        elif not arg1_is_field_geom and arg2_is_field_geom:
-            aliased_arg2 = '{table}."{field}"'.format(
-                table = metadata[mapping[arg2['resource']]]['alias'],
-                field = arg2['name']
-            )
-            if arg2_srid != CRS_DEFAULT_DATABASE:
-                aliased_arg2 = 'ST_Transform({field}, {srid})'.format(
-                field = aliased_arg2,
-                srid = CRS_DEFAULT_DATABASE
-            )
-            return ('(ST_Distance(' + aliased_arg2 + ', ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) + ')))', shapely.wkt.dumps(arg1), )
-        else:
-            return ('(ST_Distance(ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) +
-                    '), ST_Transform(ST_GeomFromText(%s, 3857), ' +
-                    str(CRS_DEFAULT_DATABASE) + ')))', shapely.wkt.dumps(arg1), shapely.wkt.dumps(arg2), )
+        fields = {}
+        geometry_column = None
 
-    def _is_field(self, metadata, mapping, f):
-        if f is None:
-            return False
+        for alias, field in compiled_query['fields'].items():
+            if alias.startswith('_'):
+                continue
+
+            if field['is_geom']:
+                if not geometry_column is None:
+                    raise DataException(u'Result {name} must have at most one geometry column.'.format(name = name))
+                geometry_column = alias
+
+            fields[alias] = Field(alias, 'geometry' if field['is_geom'] else (field['type'] or 'float8'))
+
+        # Rows are numbered in the order of the query so that they can be returned in the same order.
+        # The order of a subquery is not preserved, hence the window repeats it. Sort fields of
+        # distinct rows are always output fields
+        order = []
+        for alias, desc in compiled_query['sort']:
+            if alias is None:
+                raise DataException(u'Sorting fields of result {name} must be output fields.'.format(name = name))
+            order.append(u'q."{alias}"{desc}'.format(alias = alias, desc = u' desc' if desc else u''))
+
+        create_sql = u'create temporary table "{table}" as select row_number() over ({order}) as "_pm_row", q.* from ({sql}) as q;'.format(
+            table = table,
+            order = u'order by ' + u', '.join(order) if len(order) > 0 else u'',
+            sql = compiled_query['sql'].rstrip(u'; ')
+        )
 
-        if not type(f) is dict:
-            return False
+        connection.execute(create_sql, compiled_query['values'])
+
+        context['results'][name] = Resource(
+            id = name,
+            table = table,
+            resource_name = name,
+            package_title = None,
+            package_notes = None,
+            wms = None,
+            wms_server = None,
+            wms_layer = None,
+            geometry_type = None,
+            srid = context['crs'],
+            geometry_column = geometry_column,
+            fields = fields,
+            projections = None
+        )
 
-        if not 'name' in f:
-            return False
+        # Spatial filters compare geometries in the default database CRS, hence the index is built
+        # on the transformed geometry. Temporary tables are never analyzed automatically
+        if not geometry_column is None:
+            index_expression = u'"{column}"'.format(column = geometry_column)
+            if context['crs'] != CRS_DEFAULT_DATABASE:
+                index_expression = u'(ST_Transform({expression}, {srid}))'.format(expression = index_expression, srid = CRS_DEFAULT_DATABASE)
 
-        if 'resource' in f and (not f['resource'] in mapping or not mapping[f['resource']] in metadata):
-            raise DataException('Resource {resource} does not exist.'.format(resource = f['resource']))
-
-        # Set default resource of arguments if not already set
-        if not 'resource' in f:
-            resources = self._get_resources_by_field_name(metadata, f['name'])
-            if len(resources) == 0:
-                raise DataException(u'Field {field} does not exist.'.format(
-                    field = f['name']
-                ))
-            elif len(resources) == 1:
-                f['resource'] = resources[0]
-            else:
-                raise DataException(u'Field {field} is ambiguous for resources {resources}.'.format(
-                    field = f['name'],
-                    resources = u','.join(resources)
-                ))
+            connection.execute(u'create index on "{table}" using gist ({expression});'.format(table = table, expression = index_expression))
+        connection.execute(u'analyze "{table}";'.format(table = table))
 
-        if not f['name'] in metadata[mapping[f['resource']]]['fields']:
-            raise DataException('Field {field} does not belong to resource {resource}.'.format(field = f['name'], resource = f['resource']))
+        if stream:
+            connection = connection.execution_options(stream_results = True)
 
-        return True
+        return connection.execute(u'select * from "{table}" order by "_pm_row";'.format(table = table))
 
-    def _get_field_type(self, metadata, mapping, f):
-        if not self._is_field(metadata, mapping, f):
-            return None
+    def _count_query(self, connection, mode, sql, values):
+        if mode == QUERY_COUNT_EXACT:
+            count_sql = u'select count(*) as "count" from ({sql}) as q;'.format(sql = sql)
 
-        return metadata[mapping[f['resource']]]['fields'][f['name']]['type']
+            return connection.execute(count_sql, values).scalar()
 
-    def _is_field_geom(self, metadata, mapping, f):
-        if not self._is_field(metadata, mapping, f):
-            return False
+        # The estimate is read from the root node of the plan. It is never executed and costs
+        # as much as planning the query
+        explain_sql = u'explain (format json) {sql};'.format(sql = sql)
 
-        if f['name'] == metadata[mapping[f['resource']]]['geometry_column']:
-            return True
+        plan = connection.execute(explain_sql, values).scalar()
+        if isinstance(plan, basestring):
+            plan = json.loads(plan)
 
-        return False
+        return int(plan[0]['Plan']['Plan Rows'])
 
-    def _get_field_srid(self, metadata, mapping, f):
-        if not self._is_field_geom(metadata, mapping, f):
-            return None
+    # Loads the catalog and, optionally, the descriptions of all resources into the cache
+    def warm(self, config, describe=False):
+        resources = self._get_cached_resources(config)
+
+        if describe:
+            for id in resources:
+                self._describe_cached_resource(config, id)
 
-        return metadata[mapping[f['resource']]]['srid']
+        return resources
 
-    def _is_geom(self, metadata, f):
-        return isinstance(f, shapely.geometry.base.BaseGeometry)
+    def _get_catalog_cache_ttl(self, config):
+        return config[CONFIG_CATALOG_CACHE_TTL] if CONFIG_CATALOG_CACHE_TTL in config else DEFAULT_CATALOG_CACHE_TTL
 
-    def _get_resources_by_field_name(self, metadata, field):
-        resources = []
+    def _get_cached_resources(self, config, connection=None):
+        sync = None
+        if config[CONFIG_CATALOG_SYNC] if CONFIG_CATALOG_SYNC in config else DEFAULT_CATALOG_SYNC:
+            sync = lambda resources, revision, revisions: self.sync_resources(config, resources, revision, connection, revisions)
 
-        for resource in metadata:
-            if field in metadata[resource]['fields']:
-                resources.append(resource)
+        return self.catalog.get_resources(self._get_catalog_cache_ttl(config), lambda: self.get_resources(config, connection), sync)
 
-        return resources
+    def _describe_cached_resource(self, config, id, deadline=None):
+        return self.catalog.describe_resource(self._get_catalog_cache_ttl(config), id, lambda id: self.describe_resource(config, id, deadline))
 
-    def _get_table_resource_from_wms_resource(self, config, id):
+    def _get_table_resource_from_wms_resource(self, config, id, deadline=None):
         engine = None
+        connection = None
 
         resources = None
 
         try:
-            engine = create_engine(config[CONFIG_SQL_CATALOG], echo=False)
+            engine = _get_engine(config[CONFIG_SQL_CATALOG])
             connection = engine.connect()
 
+            if self._use_catalog_index(config, connection):
+                with _watch(deadline, connection):
+                    db_resource_id = self.catalog_index.get_table_resource(connection, id)
+
+                return id if db_resource_id is None else db_resource_id
+
             sql = text(u"""
                     select  resource_db.resource_id as db_resource_id,
                             resource_wms.resource_id as wms_resource_id
@@ -1212,10 +1422,11 @@ class QueryExecutor:
                         where resource_db.resource_id = :resource1 or resource_wms.resource_id = :resource2 limit 1;
             """)
 
-            resources = connection.execute(sql, resource1 = id, resource2 = id)
+            with _watch(deadline, connection):
+                resources = connection.execute(sql, resource1 = id, resource2 = id)
 
-            for resource in resources:
-                return resource['db_resource_id']
+                for resource in resources:
+                    return resource['db_resource_id']
 
         finally:
             if not resources is None:
@@ -1225,6 +1436,18 @@ class QueryExecutor:
 
         return id
 
+    # Catalog resources are read from the catalog index if it exists. Existence is checked once per
+    # catalog engine, hence executors detect an index created or dropped later only after a restart
+    def _use_catalog_index(self, config, connection):
+        if not (config[CONFIG_CATALOG_INDEX] if CONFIG_CATALOG_INDEX in config else DEFAULT_CATALOG_INDEX):
+            return False
+
+        engine = connection.engine
+        if not engine in self.catalog_index_exists:
+            self.catalog_index_exists[engine] = self.catalog_index.exists(connection)
+
+        return self.catalog_index_exists[engine]
+
     def get_resources(self, config, connection=None):
         engine = None
         auto_close = False
@@ -1235,73 +1458,17 @@ class QueryExecutor:
         try:
             if connection is None:
                 auto_close = True
-                engine = create_engine(config[CONFIG_SQL_CATALOG], echo=False)
+                engine = _get_engine(config[CONFIG_SQL_CATALOG])
                 connection = engine.connect()
 
-            sql = u"""
-                    select  resource_db.resource_id as db_resource_id,
-                            package_revision.title as package_title,
-                            package_revision.notes as package_notes,
-                            resource_db.resource_name as resource_name,
-                            resource_wms.resource_id as wms_resource_id,
-                            resource_db.geometry_type as geometry_type,
-                            resource_wms.wms_server as wms_server,
-                            resource_wms.wms_layer as wms_layer
-                    from
-                        (
-                        select  id as resource_id,
-                                json_extract_path_text((extras::json),'vectorstorer_resource') as vector_storer,
-                                json_extract_path_text((extras::json),'geometry') as geometry_type,
-                                json_extract_path_text((extras::json),'parent_resource_id') as resource_parent_id,
-                                resource_group_id as group_id,
-                                name as resource_name
-                        from	resource_revision
-                        where	format = 'data_table'
-                                and current = True
-                                and state = 'active'
-                                and json_extract_path_text((extras::json),'vectorstorer_resource')  = 'True'
-                        ) as resource_db
-                        left outer join
-                            (
-                            select	id as resource_id,
-                                    json_extract_path_text((extras::json),'vectorstorer_resource') as vector_storer,
-                                    json_extract_path_text((extras::json),'geometry') as geometry_type,
-                                    json_extract_path_text((extras::json),'parent_resource_id') as resource_parent_id,
-                                    resource_group_id as group_id,
-                                    json_extract_path_text((extras::json),'wms_server') as wms_server,
-                                    json_extract_path_text((extras::json),'wms_layer') as wms_layer
-                            from	resource_revision
-                            where	format = 'wms'
-                                    and current = True
-                                    and state = 'active'
-                                    and json_extract_path_text((extras::json),'vectorstorer_resource')  = 'True'
-                            ) as resource_wms
-                                on	resource_db.group_id = resource_wms.group_id
-                                    and resource_db.resource_id = resource_wms.resource_parent_id
-                        left outer join resource_group_revision
-                                on	resource_group_revision.id = resource_db.group_id
-                                    and resource_group_revision.state = 'active'
-                                    and resource_group_revision.current = True
-                        left outer join	package_revision
-                                on	resource_group_revision.package_id = package_revision.id
-                                    and package_revision.state = 'active'
-                                    and package_revision.current = True;
-            """
+            if self._use_catalog_index(config, connection):
+                sql = self.catalog_index.get_resources_sql()
+            else:
+                sql = CATALOG_RESOURCES_SQL + u';'
 
             resources = connection.execute(sql)
             for resource in resources:
-                resource_properties = {
-                    'table': resource['db_resource_id'],
-                    'resource_name' : resource['resource_name'],
-                    'package_title' : resource['package_title'],
-                    'package_notes' : resource['package_notes'],
-                    'wms': None if resource['wms_resource_id'] is None else resource['wms_resource_id'],
-                    'wms_server': None if resource['wms_server'] is None else resource['wms_server'],
-                    'wms_layer': None if resource['wms_layer'] is None else resource['wms_layer'],
-                    'geometry_type': resource['geometry_type']
-                }
-
-                result[resource['db_resource_id']] = resource_properties
+                result[resource['db_resource_id']] = self._create_resource(resource)
         finally:
             if not resources is None:
                 resources.close()
@@ -1310,19 +1477,132 @@ class QueryExecutor:
 
         return result
 
-    def describe_resource(self, config, id=None):
+    # Synchronizes catalog resources with the revisions of the catalog committed after a revision
+    # timestamp. Resources are loaded if none are given. Returns a new dictionary of resources, the
+    # latest revision timestamp, the latest revision timestamp applied to every resource and the ids
+    # of the resources that have changed. Revisions within the overlap before the timestamp are read
+    # again, since revision timestamps are set before revisions are committed, but a resource only
+    # changes if it has a revision later than the latest one applied to it. If the catalog index is
+    # used, resources are loaded from the index and the revisions committed since its oldest row are
+    # applied at once, hence loading and synchronizing agree. The index is never written, since it is
+    # maintained by pm-catalog-index
+    def sync_resources(self, config, resources=None, revision=None, connection=None, revisions=None):
         engine = None
+        auto_close = False
+
+        records = None
+
+        overlap = config[CONFIG_CATALOG_SYNC_OVERLAP] if CONFIG_CATALOG_SYNC_OVERLAP in config else DEFAULT_CATALOG_SYNC_OVERLAP
+
+        try:
+            if connection is None:
+                auto_close = True
+                engine = _get_engine(config[CONFIG_SQL_CATALOG])
+                connection = engine.connect()
+
+            use_index = self._use_catalog_index(config, connection)
+
+            if resources is None or revision is None:
+                # The revision is read first so that revisions committed while loading are applied
+                # by the next synchronization
+                revision = connection.execute(CATALOG_REVISION_SQL).scalar()
+
+                resources = self.get_resources(config, connection)
+                if not use_index:
+                    return resources, revision, {}, []
+
+                # The index may be older than the catalog. Revisions committed since its oldest row
+                # are applied at once
+                since = self.catalog_index.get_revision(connection)
+                if since is None:
+                    return resources, revision, {}, []
+
+                resources, since, revisions, changed = self.sync_resources(config, resources, since, connection)
+
+                return resources, since if revision is None else max(revision, since), revisions, changed
+
+            since = revision - datetime.timedelta(seconds = overlap)
+
+            # Revisions before the overlap are never read again
+            applied = dict([(id, timestamp) for id, timestamp in (revisions or {}).items() if timestamp > since])
+
+            changed = set()
+            records = connection.execute(CATALOG_CHANGES_SQL, (since, since, since))
+            for record in records:
+                id = record['resource_id']
+                timestamp = record['revision_timestamp']
+
+                if timestamp > revision:
+                    revision = timestamp
+
+                if id in applied and timestamp <= applied[id]:
+                    continue
+                applied[id] = timestamp
+
+                changed.add(id)
+                if not record['resource_parent_id'] is None:
+                    changed.add(record['resource_parent_id'])
+            records.close()
+            records = None
+
+            if len(changed) == 0:
+                return resources, revision, applied, []
+
+            # Changed resources are replaced by their current state, if they still exist
+            result = dict([(id, resource) for id, resource in resources.items() if not id in changed and not resource['wms'] in changed])
+
+            ids = tuple(changed)
+
+            records = connection.execute(CATALOG_RESOURCES_BY_ID_SQL, (ids, ids))
+            for record in records:
+                result[record['db_resource_id']] = self._create_resource(record)
+
+            log.info(u'Synchronized {count} changed catalog resources.'.format(count = len(changed)))
+
+            return result, revision, applied, list(changed)
+        finally:
+            if not records is None:
+                records.close()
+            if not connection is None and auto_close:
+                connection.close()
+
+    def _create_resource(self, record):
+        return Resource(
+            id = record['db_resource_id'],
+            table = record['db_resource_id'],
+            resource_name = record['resource_name'],
+            package_title = record['package_title'],
+            package_notes = record['package_notes'],
+            wms = None if record['wms_resource_id'] is None else record['wms_resource_id'],
+            wms_server = None if record['wms_server'] is None else record['wms_server'],
+            wms_layer = None if record['wms_layer'] is None else record['wms_layer'],
+            geometry_type = record['geometry_type'],
+            srid = None,
+            geometry_column = None,
+            fields = None,
+            projections = None
+        )
+
+    # Describes the fields of a resource. If a deadline is set, the commands are cancelled once it
+    # expires
+    def describe_resource(self, config, id=None, deadline=None):
+        router = None
+        replica = None
+        failed = False
+
+        connection = None
 
         result = {}
         srid = None
         geometry_column = None
+        projections = {}
 
         try:
             # Map wms resource id to table resource id
-            id = self._get_table_resource_from_wms_resource(config, id)
+            id = self._get_table_resource_from_wms_resource(config, id, deadline)
 
-            engine = create_engine(config[CONFIG_SQL_DATA], echo=False)
-            connection = engine.connect()
+            router = _get_router(config)
+            replica, connection = self._connect_replica(router, [])
 
             sql = text(u"""
                 SELECT	attname::varchar as "name",
@@ -1336,35 +1616,49 @@ class QueryExecutor:
 	    		                on pg_attribute.atttypid = pg_type.oid
 	    	                left outer join geometry_columns
 	    		                on geometry_columns.f_table_name = pg_class.relname and
+	    		                   geometry_columns.f_geometry_column = pg_attribute.attname and
 	    		                   pg_type.typname = 'geometry'
                 WHERE	pg_attribute.attisdropped = False and
     	                pg_class.relname = :resource and
     	                pg_attribute.attnum > 0
             """)
 
-            fields = connection.execute(sql, resource = id).fetchall()
+            with _watch(deadline, connection):
+                fields = connection.execute(sql, resource = id).fetchall()
+
+            # Geometry columns starting with an underscore may be projections of the geometry column
+            candidates = {}
+
             for field in fields:
                 if field['name'].startswith('_'):
+                    if not field['srid'] is None:
+                        candidates[field['name']] = field['srid']
                     continue
 
-                result[field['name']] = {
-                    'name': field['name'],
-                    'type': field['type']
-                }
+                result[field['name']] = Field(field['name'], field['type'])
 
                 if not field['srid'] is None:
                     if not srid is None:
-                        raise DataException('More than 1 geometry columns found in resource {id}'.format(id = id))
+                        raise InternalException('More than 1 geometry columns found in resource {id}'.format(id = id))
 
                     geometry_column = field['name']
                     srid = field['srid']
+
+            if not geometry_column is None:
+                projections = dict([(s, name) for name, s in candidates.items() if name == get_projection_column(geometry_column, s) and s != srid])
+        except DBAPIError as ex:
+            failed = _is_replica_error(ex)
+            raise
         finally:
             if not connection is None:
                 connection.close()
+            if not replica is None:
+                router.release(replica, failed)
 
         return {
             "id": id,
             "fields" : result,
             "srid": srid,
-            "geometry_column" : geometry_column
+            "geometry_column" : geometry_column,
+            "projections" : projections
         }
@@ -0,0 +1,92 @@
+import logging
+
+import collections
+import math
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+CONFIG_CACHE_TILES_SIZE = 'cache.tiles.size'
+CONFIG_CACHE_TILES_TTL = 'cache.tiles.ttl'
+
+# Maximum number of cached tiles. Tiles are cached only if a positive size is set
+DEFAULT_CACHE_TILES_SIZE = 0
+# Time to live of a cached tile in seconds
+DEFAULT_CACHE_TILES_TTL = 60
+
+# Half the width of the EPSG:3857 world
+TILE_ORIGIN = 20037508.342789244
+
+TILE_MAX_ZOOM = 24
+
+# Returns the zoom level of the tile grid for a bounding box in EPSG:3857. Tiles are at most as
+# large as the bounding box, which overlaps at most three tiles per axis
+def get_tile_zoom(bounds):
+    size = max(bounds[2] - bounds[0], bounds[3] - bounds[1])
+    if size <= 0:
+        return TILE_MAX_ZOOM
+
+    zoom = int(math.ceil(math.log(2 * TILE_ORIGIN / size, 2)))
+
+    return min(max(zoom, 0), TILE_MAX_ZOOM)
+
+# Returns the (x, y) indexes and bounds of the tiles of a zoom level that overlap a bounding box
+def get_tiles(bounds, zoom):
+    size = 2 * TILE_ORIGIN / (2 ** zoom)
+    count = 2 ** zoom
+
+    def index(value):
+        return min(max(int(math.floor((value + TILE_ORIGIN) / size)), 0), count - 1)
+
+    tiles = []
+    for y in range(index(bounds[1]), index(bounds[3]) + 1):
+        for x in range(index(bounds[0]), index(bounds[2]) + 1):
+            tiles.append(((x, y), (
+                x * size - TILE_ORIGIN,
+                y * size - TILE_ORIGIN,
+                (x + 1) * size - TILE_ORIGIN,
+                (y + 1) * size - TILE_ORIGIN
+            )))
+
+    return tiles
+
+# Least recently used cache of the rows of tiles. Entries expire after a time to live. Cached values
+# are shared between threads and must not be modified by callers
+class TileCache(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        # Key to (timestamp, value)
+        self.entries = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ttl, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+
+            if entry is None or time.time() - entry[0] >= ttl:
+                self.misses += 1
+                return None
+
+            self.entries[key] = entry
+            self.hits += 1
+
+            return entry[1]
+
+    def set(self, capacity, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time(), value)
+
+            while len(self.entries) > capacity:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
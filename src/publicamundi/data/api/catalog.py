@@ -0,0 +1,92 @@
+import logging
+
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Caches the catalog resources and the resource descriptions of a QueryExecutor. Cached values are
+# shared between threads and must not be modified by callers
+class ResourceCatalog(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        self.resources = None
+        self.resources_timestamp = 0
+        self.resources_revision = None
+        # Resource id to the latest revision timestamp applied to the resource
+        self.resources_revisions = {}
+        # Resource id to the number of synchronizations that changed the resource. Versions are
+        # never reset, hence values derived from a resource can be keyed by its version
+        self.resources_versions = {}
+
+        # Resource id to (timestamp, description)
+        self.descriptions = {}
+
+    # Returns the cached resources, loading them if the cache has expired. If sync is set, expired
+    # resources are synchronized instead of being loaded. Sync is called with the cached resources,
+    # the revision they were loaded at, both None if nothing is cached, and the latest revision
+    # applied to every resource. It returns the new resources, their revision, the latest revision
+    # applied to every resource and the ids of the resources that have changed
+    def get_resources(self, ttl, load, sync=None):
+        if ttl <= 0:
+            return load()
+
+        with self.lock:
+            if not self.resources is None and time.time() - self.resources_timestamp < ttl:
+                return self.resources
+
+            resources = self.resources
+            revision = self.resources_revision
+            revisions = self.resources_revisions
+
+        # Loading happens outside the lock so that a slow catalog does not block readers of a valid
+        # cache. Concurrent refreshes are harmless since the last one wins
+        changed = []
+        if sync is None:
+            resources = load()
+            revision = None
+            revisions = {}
+        else:
+            resources, revision, revisions, changed = sync(resources, revision, revisions)
+
+        with self.lock:
+            self.resources = resources
+            self.resources_timestamp = time.time()
+            self.resources_revision = revision
+            self.resources_revisions = revisions
+
+            # Tables of changed resources may have changed as well
+            for id in changed:
+                self.descriptions.pop(id, None)
+                self.resources_versions[id] = self.resources_versions.get(id, 0) + 1
+
+        return resources
+
+    def get_resource_version(self, id):
+        with self.lock:
+            return self.resources_versions.get(id, 0)
+
+    def describe_resource(self, ttl, id, load):
+        if ttl <= 0:
+            return load(id)
+
+        with self.lock:
+            if id in self.descriptions and time.time() - self.descriptions[id][0] < ttl:
+                return self.descriptions[id][1]
+
+        description = load(id)
+
+        with self.lock:
+            self.descriptions[id] = (time.time(), description)
+
+        return description
+
+    def clear(self):
+        with self.lock:
+            self.resources = None
+            self.resources_timestamp = 0
+            self.resources_revision = None
+            self.resources_revisions = {}
+            self.descriptions = {}
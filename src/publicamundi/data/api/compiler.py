@@ -0,0 +1,1307 @@
+import logging
+
+import collections
+import numbers
+
+import psycopg2
+
+import shapely.geometry
+import shapely.geometry.base
+import shapely.validation
+
+from .exceptions import DataException
+
+log = logging.getLogger(__name__)
+
+# Copies the dictionaries and lists of a query. Every other value, e.g. a literal geometry, is shared
+def _copy_query(value):
+    if isinstance(value, dict):
+        return dict([(k, _copy_query(v)) for k, v in value.items()])
+    if isinstance(value, list):
+        return [_copy_query(v) for v in value]
+
+    return value
+
+# Available formats
+QUERY_FORMAT_JSON = 'JSON'
+QUERY_FORMAT_GEOJSON = 'GeoJSON'
+
+# Supported formats
+FORMAT_SUPPORT_QUERY = [QUERY_FORMAT_JSON , QUERY_FORMAT_GEOJSON]
+
+CRS_SUPPORTED = ['EPSG:900913', 'EPSG:3857', 'EPSG:4326', 'EPSG:2100', 'EPSG:4258']
+CRS_DEFAULT_DATABASE = 2100
+CRS_DEFAULT_OUTPUT = 3857
+
+OP_LIKE = 'LIKE'
+OP_EQ = 'EQUAL'
+OP_NOT_EQ = 'NOT_EQUAL'
+OP_GT = 'GREATER'
+OP_GET = 'GREATER_OR_EQUAL'
+OP_LT = 'LESS'
+OP_LET = 'LESS_OR_EQUAL'
+
+OP_AREA = 'AREA'
+OP_DISTANCE = 'DISTANCE'
+OP_CONTAINS = 'CONTAINS'
+OP_INTERSECTS = 'INTERSECTS'
+
+COMPARE_OPERATORS = [OP_EQ, OP_NOT_EQ, OP_GT, OP_GET, OP_LT, OP_LET, OP_LIKE]
+COMPARE_EXPRESSIONS = ['=', '<>', '>', '>=', '<', '<=', 'like']
+
+FIELD_OPERATORS = [OP_AREA, OP_DISTANCE]
+
+SPATIAL_COMPARE_OPERATORS = [OP_EQ, OP_GT, OP_GET, OP_LT, OP_LET]
+SPATIAL_OPERATORS = [OP_AREA, OP_DISTANCE, OP_CONTAINS, OP_INTERSECTS]
+
+ALL_OPERATORS = [OP_EQ, OP_NOT_EQ, OP_GT, OP_GET, OP_LT, OP_LET, OP_LIKE, OP_AREA, OP_DISTANCE, OP_CONTAINS, OP_INTERSECTS]
+
+MAX_RESULT_ROWS = 10000
+
+# Total row count modes
+QUERY_COUNT_EXACT = 'exact'
+QUERY_COUNT_ESTIMATE = 'estimate'
+
+COUNT_SUPPORT_QUERY = [QUERY_COUNT_EXACT, QUERY_COUNT_ESTIMATE]
+
+# Column of the exact count of the rows matching a query
+QUERY_COUNT_COLUMN = '_pm_count'
+# Output column of the physical location of the rows of single resource queries compiled with
+# identity set. It identifies a row in a snapshot of its table
+QUERY_IDENTITY_COLUMN = '_pm_ctid'
+
+# Table sampling methods. SYSTEM samples whole pages and is the cheapest, BERNOULLI samples rows and
+# reads every page of a table. Sampling requires PostgreSQL 9.5 or later
+SAMPLE_METHOD_SYSTEM = 'SYSTEM'
+SAMPLE_METHOD_BERNOULLI = 'BERNOULLI'
+
+SAMPLE_SUPPORT_QUERY = [SAMPLE_METHOD_SYSTEM, SAMPLE_METHOD_BERNOULLI]
+
+CONFIG_MAX_RESOURCE = 'resource.max.count'
+CONFIG_GEOMETRY_MAX_VERTICES = 'geometry.max.vertices'
+CONFIG_GEOMETRY_PROJECTIONS = 'geometry.projections'
+
+DEFAULT_MAX_RESOURCE = 4
+DEFAULT_GEOMETRY_MAX_VERTICES = 20000
+# Pre-projected geometry columns of resources are read instead of transforming geometries per row
+DEFAULT_GEOMETRY_PROJECTIONS = True
+
+# Field types that are sorted using the collation of the database. Rows of partitioned queries can
+# not be sorted by them outside of the database
+COLLATED_TYPES = ['varchar', 'text', 'bpchar', 'char', 'name']
+
+# Compiles a single queue item to SQL without performing any I/O. The resources accessed by a query
+# are resolved against a schema snapshot, i.e. a dictionary of resources keyed by resource name. Every
+# resource requires the keys table, srid, geometry_column and fields as returned by
+# QueryExecutor.describe_resource. The optional key wms is used for resolving WMS resource names.
+# Resources are never modified and table aliases are assigned per query.
+class QueryCompiler:
+
+    def __init__(self, config={}):
+        self.max_resource_count = config[CONFIG_MAX_RESOURCE] if CONFIG_MAX_RESOURCE in config else DEFAULT_MAX_RESOURCE
+        self.max_geometry_vertices = config[CONFIG_GEOMETRY_MAX_VERTICES] if CONFIG_GEOMETRY_MAX_VERTICES in config else DEFAULT_GEOMETRY_MAX_VERTICES
+        self.geometry_projections = config[CONFIG_GEOMETRY_PROJECTIONS] if CONFIG_GEOMETRY_PROJECTIONS in config else DEFAULT_GEOMETRY_PROJECTIONS
+
+    # Returns the (name, alias) pairs of the resources accessed by a query. WMS resource names are
+    # replaced by the names of the table resources they render
+    def parse_resources(self, query, resources):
+        if not 'resources' in query:
+            raise DataException('No resource selected.')
+
+        if not type(query['resources']) is list:
+            raise DataException('Parameter resource should be a list with at least one item.')
+
+        if len(query['resources']) == 0:
+            raise DataException('At least one resource must be selected.')
+
+        if len(query['resources']) > self.max_resource_count:
+            raise DataException('Only up to {count} resources are allowed per query.'.format(
+                count = self.max_resource_count
+            ))
+
+        result = []
+
+        for query_resource in query['resources']:
+            resource_name = None
+            resource_alias = None
+
+            if type(query_resource) is dict:
+                if 'name' in query_resource:
+                    resource_name = query_resource['name']
+                else:
+                    raise DataException('Resource name is missing.')
+                if 'alias' in query_resource:
+                    resource_alias = query_resource['alias']
+                else:
+                    # If no alias is set, the name of the resources becomes an alias by default
+                    resource_alias = resource_name
+            elif isinstance(query_resource, basestring):
+                resource_name = query_resource
+                resource_alias = query_resource
+            else:
+                raise DataException('Resource parameter is malformed. Instance of string or dictionary is expected.')
+
+            # Allow users to use a wms unique id as a table resource since the id values are unique and there is
+            # an 1:1 relation
+            if not resource_name is None and not resource_name in resources:
+                for r in resources:
+                    if resources[r].get('wms') == resource_name:
+                        resource_name = r
+                        break
+
+            if not resource_name in resources:
+                raise DataException('Resource {resource} does not exist.'.format(
+                    resource = resource_name
+                ))
+
+            result.append((resource_name, resource_alias))
+
+        return result
+
+    # Returns the SQL command and its parameter values, along with the resolved output fields
+    # required for decoding the result rows. The query is not modified. If a query may be split in spatial partitions, the
+    # partition key describes its resource, the envelope in EPSG:3857 of the literal geometries that
+    # restrict it and the sort keys for merging partitions. If partition is set, the command selects
+    # the features of a single partition, given by the parameter values starting at index
+    def compile(self, query, resources, crs=CRS_DEFAULT_OUTPUT, output_format=QUERY_FORMAT_GEOJSON, partition=False, identity=False):
+        # Missing fields and field resources are resolved on a copy
+        query = _copy_query(query)
+
+        srid = crs
+        offset = 0
+        limit = MAX_RESULT_ROWS
+        count_mode = None
+
+        parsed_query = {
+            'resources' : collections.OrderedDict(),
+            'fields': collections.OrderedDict(),
+            'filters' : [],
+            'sort' : []
+        }
+
+        # Get limit
+        if 'limit' in query:
+            if not isinstance(query['limit'], numbers.Number):
+                raise DataException('Parameter limit must be a number.')
+            if query['limit'] < limit and query['limit'] > 0 :
+                limit = query['limit']
+
+        # Get offset
+        if 'offset' in query:
+            if not isinstance(query['offset'], numbers.Number):
+                raise DataException('Parameter offset must be a number.')
+            if query['offset'] >= 0:
+                offset = query['offset']
+
+        # Get count mode
+        if 'count' in query and not query['count'] is None:
+            if not query['count'] in COUNT_SUPPORT_QUERY:
+                raise DataException('Count mode {mode} is not supported.'.format(mode = query['count']))
+            count_mode = query['count']
+
+        # Compilation context. Resources contains only the resources that are being accessed by the
+        # specific query and mapping is used for managing resource name to alias mappings. References
+        # collects the (resource, field) pairs referenced outside of single table filters and
+        # geometries the distinct literal geometries keyed by their WKB representation. Aliases maps
+        # resource names to the table aliases of the query. Envelopes collects the bounds of literal
+        # geometries compared to geometry fields and sort keys the output alias, direction and type of
+        # every sort field. Sample is the table sample clause applied to every resource, if any, and
+        # symbols the symbol table of the fields of the accessed resources
+        context = {
+            'resources' : {},
+            'mapping' : {},
+            'aliases' : {},
+            'references' : [],
+            'geometries' : collections.OrderedDict(),
+            'envelopes' : [],
+            'sort_keys' : [],
+            'sample' : self._create_sample(query),
+            'symbols' : None
+        }
+
+        # Get resources
+        for resource_name, resource_alias in self.parse_resources(query, resources):
+            # Mappings for handling aliases
+            context['mapping'][resource_name] = resource_name
+            context['mapping'][resource_alias] = resource_name
+
+            db_resource = resources[resource_name]
+
+            if not resource_name in context['aliases']:
+                context['aliases'][resource_name] = 't{index}'.format(index = len(context['aliases']) + 1)
+
+            parsed_query['resources'][resource_name] = {
+                'table' : db_resource['table'],
+                'alias' : context['aliases'][resource_name]
+            }
+
+            context['resources'][resource_name] = db_resource
+
+        context['symbols'] = self._create_symbols(context, parsed_query['resources'].keys())
+
+        query_metadata = context['resources']
+
+        # If no fields are selected, all fields are added to the response.
+        # This may result in some fields names being ambiguous.
+        addAllFields = False
+        if not 'fields' in query:
+            addAllFields = True
+        elif not type(query['fields']) is list:
+            raise DataException('Parameter fields should be a list.')
+        elif len(query['fields']) == 0:
+            addAllFields = True
+
+        if addAllFields:
+            query['fields'] = []
+            for resource in query_metadata:
+                for field in query_metadata[resource]['fields']:
+                    query['fields'].append({
+                        'resource' : resource,
+                        'name' :  query_metadata[resource]['fields'][field]['name']
+                    })
+
+        # Get fields
+        for i in range(0, len(query['fields'])):
+            field_resource = None
+            field_name = None
+            field_alias = None
+
+            if type(query['fields'][i]) is dict:
+                if 'operator' in query['fields'][i]:
+                    computed_field = self._create_computed_field(context, query['fields'][i])
+
+                    if computed_field['alias'] in parsed_query['fields']:
+                       raise DataException(u'Computed field {field} is ambiguous.'.format(
+                            field = computed_field['alias']
+                        ))
+
+                    parsed_query['fields'][computed_field['alias']] = {
+                        'fullname' : computed_field['alias'],
+                        'name' : computed_field['alias'],
+                        'alias' : computed_field['alias'],
+                        'type' : None,
+                        'is_geom' : computed_field['is_geom'],
+                        'srid' : None,
+                        'expression' : computed_field['expression']
+                    }
+
+                    continue
+
+                if 'name' in query['fields'][i]:
+                    field_name = query['fields'][i]['name']
+                else:
+                    raise DataException('Field name is missing.')
+                if 'alias' in query['fields'][i]:
+                    field_alias = query['fields'][i]['alias']
+                else:
+                    # If no alias is set, the name of the field becomes an alias by default
+                    field_alias = field_name
+                if 'resource' in query['fields'][i]:
+                    field_resource = query['fields'][i]['resource']
+            elif isinstance(query['fields'][i], basestring):
+                field_name = query['fields'][i]
+                field_alias = query['fields'][i]
+            else:
+                raise DataException('Field is malformed. Instance of string or dictionary is expected.')
+
+            # Set resource if not set
+            if field_resource is None:
+                field_resource = self._get_resource_by_field_name(context, field_name)
+
+            if not field_resource in context['mapping'] or not context['mapping'][field_resource] in query_metadata:
+                raise DataException(u'Resource {resource} for field {field} does not exist.'.format(
+                    resource = field_resource,
+                    field = field_name
+                ))
+
+            symbol = context['symbols']['fields'].get((context['mapping'][field_resource], field_name))
+
+            if not symbol is None:
+                if field_alias in parsed_query['fields']:
+                   raise DataException(u'Field {field} in resource {resource} is ambiguous.'.format(
+                        field = symbol['name'],
+                        resource = field_resource
+                    ))
+
+                # Geometries are read from the projection of the geometry column to the output CRS,
+                # if one exists
+                column = symbol['name']
+                field_srid = symbol['srid']
+
+                if symbol['is_geom'] and field_srid != srid and not self._get_projection(context, symbol['resource'], srid) is None:
+                    column = self._get_projection(context, symbol['resource'], srid)
+                    field_srid = srid
+
+                self._add_reference(context, symbol['resource'], column)
+
+                parsed_query['fields'][field_alias] = {
+                    'fullname' : '{table}."{field}"'.format(
+                        table = context['aliases'][symbol['resource']],
+                        field = column
+                    ),
+                    'name' : symbol['name'],
+                    'alias' : field_alias,
+                    'type' : symbol['type'],
+                    'is_geom' : symbol['is_geom'],
+                    'srid' : field_srid
+                }
+            else:
+                raise DataException(u'Field {field} does not exist in resource {resource}.'.format(
+                    field = field_name,
+                    resource = field_resource
+                ))
+
+        # Check the number of geometry columns
+        if output_format == QUERY_FORMAT_GEOJSON:
+            count_geom_columns = sum([1 if parsed_query['fields'][field]['is_geom'] else 0 for field in parsed_query['fields'].keys()])
+            if count_geom_columns != 1:
+                raise DataException(u'Format {format} requires exactly one geometry column'.format(
+                    format = output_format
+                ))
+
+        # Get constraints
+        if 'filters' in query and not type(query['filters']) is list:
+            raise DataException(u'Parameter filters should be a list with at least one item.')
+
+        # Every filter keeps the fields it references so that the join planner can tell single table
+        # filters from join predicates
+        if 'filters' in query and len(query['filters']) > 0:
+            for f in query['filters']:
+                start = len(context['references'])
+
+                filter_tuple = self._create_filter(context, f)
+
+                parsed_query['filters'].append((filter_tuple, context['references'][start:]))
+                del context['references'][start:]
+
+        # Get order by
+        if 'sort' in query:
+            if not type(query['sort']) is list:
+                raise DataException('Parameter sort should be a list.')
+            elif len(query['sort']) > 0:
+                for i in range(0, len(query['sort'])):
+                    parsed_query['sort'].append(self._create_sort(context, parsed_query, query['sort'][i]))
+
+        # Build SQL command
+        fields = []
+        tables = []
+        wheres = []
+        values = ()
+        where_clause = ''
+        orderby_clause = ''
+
+        # Select clause fields
+        for alias in parsed_query['fields']:
+            field = parsed_query['fields'][alias]
+
+            if 'expression' in field:
+                fields.append('{field} as "{alias}"'.format(
+                    field = field['expression'][0],
+                    alias = field['alias']
+                ))
+                values += field['expression'][1:]
+            elif field['is_geom'] and field['srid'] != srid:
+                fields.append('ST_Transform({geom}, {srid}) as "{alias}"'.format(
+                    geom = field['fullname'],
+                    srid = srid,
+                    alias = field['alias']
+                ))
+            else:
+                fields.append('{field} as "{alias}"'.format(
+                    field = field['fullname'],
+                    alias = field['alias']
+                ))
+
+        if identity:
+            if len(parsed_query['resources']) != 1:
+                raise DataException('Row identity is only supported for queries of a single resource.')
+
+            fields.append(u'{table}.ctid as "{alias}"'.format(
+                table = context['aliases'][parsed_query['resources'].keys()[0]],
+                alias = QUERY_IDENTITY_COLUMN
+            ))
+
+        # From clause tables
+        from_clause, from_values, where_filters = self._create_from(context, parsed_query)
+        values += from_values
+
+        # Where clause
+        for filter_tuple in where_filters:
+            wheres.append(filter_tuple[0])
+            values += filter_tuple[1:]
+
+        # Partition filter parameter values are set per partition
+        partition_key = self._get_partition_key(context, parsed_query)
+        partition_index = None
+
+        if partition and not partition_key is None:
+            partition_filter = self._create_partition_filter(context, partition_key['resource'])
+
+            wheres.append(partition_filter[0])
+            partition_index = len(values)
+            values += partition_filter[1:]
+
+        if len(wheres) > 0:
+            where_clause = u'where ' + u' AND '.join(wheres)
+
+        # Literal geometries precede every other parameter
+        geometry_clause, geometry_values = self._create_geometry_table(context)
+        values = geometry_values + values
+
+        if not partition_index is None:
+            partition_key['index'] = len(geometry_values) + partition_index
+
+        # Select statement without ordering and paging. Count statements share it
+        select_body = u"select distinct {fields} from {tables} {where}".format(
+            fields = u','.join(fields),
+            tables = from_clause,
+            where = where_clause
+        )
+        select_sql = geometry_clause + select_body
+        select_values = values
+
+        # Exact counts are computed by the command itself so that they cost no additional round trip.
+        # The count of the rows matching the query is added to every row as a constant column, which
+        # leaves distinct rows unaffected. Partition commands are never counted
+        count_column = None
+        if count_mode == QUERY_COUNT_EXACT and partition_index is None:
+            count_column = QUERY_COUNT_COLUMN
+
+            body_values = values[len(geometry_values):]
+
+            select_sql = u'{geometries}_c as (select count(*) as "{column}" from (select distinct {fields} from {tables} {where}) as _q) select distinct {fields},(select "{column}" from _c) as "{column}" from {tables} {where}'.format(
+                geometries = geometry_clause.rstrip() + u', ' if len(geometry_clause) > 0 else u'with ',
+                column = count_column,
+                fields = u','.join(fields),
+                tables = from_clause,
+                where = where_clause
+            )
+            values = geometry_values + body_values + body_values
+
+        # Order by clause
+        if len(parsed_query['sort']) > 0:
+            orderby_clause = u'order by ' + u', '.join([f[0] for f in parsed_query['sort']])
+            for order_values in [f[1:] for f in parsed_query['sort']]:
+                values += order_values
+
+        # Build SQL. Limit and offset are bound as parameters so that the SQL text only depends on the
+        # shape of the query
+        sql = u"{select} {orderby} limit %s offset %s;".format(
+            select = select_sql,
+            orderby = orderby_clause
+        )
+        values += (limit, offset, )
+
+        return {
+            'sql' : sql,
+            'values' : values,
+            'select_sql' : geometry_clause + select_body,
+            'select_values' : select_values,
+            'count_column' : count_column,
+            'fields' : parsed_query['fields'],
+            'sort' : [(alias, desc) for alias, desc, field_type in context['sort_keys']],
+            'limit' : limit,
+            'offset' : offset,
+            'count' : count_mode,
+            'partition' : partition_key
+        }
+
+    # Returns the partition key of a query or None if the query can not be partitioned. Only queries
+    # of a single resource with a geometry column that is not sampled are partitioned. Partitions are
+    # merged by sorting their rows, hence every sort field must be an output field that is not sorted
+    # by collation. The geometry column must be an output field. Equal rows have equal geometries and
+    # belong to the same partition, hence the distinct rows of every partition are distinct rows of
+    # the query and partitions are merged without removing duplicates
+    def _get_partition_key(self, context, parsed_query):
+        if len(parsed_query['resources']) != 1 or not context['sample'] is None:
+            return None
+
+        resource_name = parsed_query['resources'].keys()[0]
+        geometry_column = context['resources'][resource_name]['geometry_column']
+        if geometry_column is None:
+            return None
+
+        if len([f for f in parsed_query['fields'].values() if f['is_geom'] and not 'expression' in f and f['name'] == geometry_column]) == 0:
+            return None
+
+        for alias, desc, field_type in context['sort_keys']:
+            if alias is None or field_type in COLLATED_TYPES or field_type == 'geometry':
+                return None
+
+        # Literal geometries compared to the geometry field bound the features of the query
+        envelope = None
+        for bounds in context['envelopes']:
+            if envelope is None:
+                envelope = bounds
+            else:
+                envelope = (max(envelope[0], bounds[0]), max(envelope[1], bounds[1]), min(envelope[2], bounds[2]), min(envelope[3], bounds[3]))
+
+        if not envelope is None and (envelope[0] > envelope[2] or envelope[1] > envelope[3]):
+            return None
+
+        return {
+            'resource' : resource_name,
+            'envelope' : envelope,
+            'sort' : [(alias, desc) for alias, desc, field_type in context['sort_keys']],
+            'index' : None
+        }
+
+    # A feature belongs to the partition that contains the lower left corner of its bounding box.
+    # Partitions are half open and features without geometry belong to the first partition. The
+    # bounding box test allows partitions to be scanned using the spatial index of the table. The
+    # parameters are xmin, ymin, xmax, ymax of the partition repeated for the bounding box and the
+    # corner tests and a flag that is set for the first partition
+    def _create_partition_filter(self, context, resource_name):
+        resource = context['resources'][resource_name]
+
+        column = u'{table}."{field}"'.format(table = context['aliases'][resource_name], field = resource['geometry_column'])
+
+        return (u'(({column} && ST_MakeEnvelope(%s, %s, %s, %s, {srid}) AND ST_XMin({column}) >= %s AND ST_XMin({column}) < %s AND ST_YMin({column}) >= %s AND ST_YMin({column}) < %s) OR ({column} is null AND %s))'.format(
+            column = column,
+            srid = resource['srid']
+        ), None, None, None, None, None, None, None, None, None)
+
+    # Returns the table sample clause of a query and its parameter values or None if the query is
+    # not sampled. Sample is either the percentage of the rows of every resource or a dictionary with
+    # the percentage, an optional method and an optional seed. Queries with the same seed return the
+    # same sample as long as the tables do not change. Filters are applied to the sampled rows
+    def _create_sample(self, query):
+        if not 'sample' in query or query['sample'] is None:
+            return None
+
+        sample = query['sample']
+        if isinstance(sample, numbers.Number):
+            sample = {
+                'percent' : sample
+            }
+        elif not type(sample) is dict:
+            raise DataException('Parameter sample must be a number or a dictionary.')
+
+        if not isinstance(sample.get('percent'), numbers.Number) or sample['percent'] <= 0 or sample['percent'] > 100:
+            raise DataException('Sample percent must be a number greater than 0 and less than or equal to 100.')
+
+        method = sample.get('method') or SAMPLE_METHOD_SYSTEM
+        if not method in SAMPLE_SUPPORT_QUERY:
+            raise DataException(u'Sample method {method} is not supported.'.format(method = method))
+
+        clause = u' tablesample {method} (%s)'.format(method = method.lower())
+        values = (float(sample['percent']), )
+
+        if not sample.get('seed') is None:
+            if not isinstance(sample['seed'], numbers.Number):
+                raise DataException('Sample seed must be a number.')
+
+            clause += u' repeatable (%s)'
+            values += (sample['seed'], )
+
+        return (clause, ) + values
+
+    def _create_sort(self, context, parsed_query, sort):
+        # Get sort field properties
+        sort_resource = None
+        sort_name = None
+        sort_desc = False
+        is_computed = False
+
+        if type(sort) is dict:
+            if 'name' in sort:
+                sort_name = sort['name']
+            else:
+                raise DataException('Sorting field name is missing.')
+            if 'resource' in sort:
+                sort_resource = sort['resource']
+            if 'desc' in sort and isinstance(sort['desc'], bool):
+                sort_desc = sort['desc']
+        elif isinstance(sort, basestring):
+            sort_name = sort
+        else:
+            raise DataException('Sorting field is malformed. Instance of string or dictionary is expected.')
+
+        # If this is not a computed field, check if a field name or an alias is specified.
+        # In the latter case, set the database field name
+        if sort_name in parsed_query['fields']:
+            if 'expression' in parsed_query['fields'][sort_name]:
+                is_computed = True
+            elif parsed_query['fields'][sort_name]['name'] != sort_name:
+               sort_name = parsed_query['fields'][sort_name]['name']
+
+        # Set resource if missing
+        if not is_computed and sort_resource is None:
+            resources = self._get_resources_by_field_name(context, sort_name)
+
+            if len(resources) == 0:
+                raise DataException(u'Sorting field {field} does not exist.'.format(
+                    field = sort_name
+                ))
+            elif len(resources) == 1:
+                sort_resource = resources[0]
+            else:
+                raise DataException(u'Sorting field {field} is ambiguous for resources {resources}.'.format(
+                    field = sort_name,
+                    resources = u','.join(resources)
+                ))
+
+        # Check if resource exists in metadata
+        if (not is_computed) and (not sort_resource in context['mapping'] or not context['mapping'][sort_resource] in context['resources']):
+            raise DataException(u'Resource {resource} for sorting field {field} does not exist.'.format(
+                resource = sort_resource,
+                field = sort_name
+            ))
+
+        if not is_computed:
+            symbol = context['symbols']['fields'].get((context['mapping'][sort_resource], sort_name))
+            if symbol is None:
+                raise DataException(u'Sorting field {field} does not exist in resource {resource}.'.format(
+                    field = sort_name,
+                    resource = sort_resource
+                ))
+
+        if is_computed:
+            context['sort_keys'].append((sort_name, sort_desc, None))
+
+            sort_params = ('{expr} {desc}'.format(
+                expr = parsed_query['fields'][sort_name]['expression'][0],
+                desc = 'desc' if sort_desc else ''
+            ), )
+            sort_params += parsed_query['fields'][sort_name]['expression'][1:]
+
+            return sort_params
+
+        self._add_reference(context, symbol['resource'], sort_name)
+
+        fullname = '{table}."{field}"'.format(
+            table = context['aliases'][symbol['resource']],
+            field = sort_name
+        )
+
+        # Output alias of the sort field, if it is selected
+        sort_alias = None
+        for alias in parsed_query['fields']:
+            if parsed_query['fields'][alias]['fullname'] == fullname and not 'expression' in parsed_query['fields'][alias]:
+                sort_alias = alias
+                break
+
+        context['sort_keys'].append((sort_alias, sort_desc, symbol['type']))
+
+        return ('{field} {desc}'.format(
+            field = fullname,
+            desc = 'desc' if sort_desc else ''
+        ), )
+
+    # Returns the from clause and its parameter values along with the filters left for the where
+    # clause. A single resource is selected directly from its table. For multiple resources, filters
+    # that reference a single resource are evaluated in a subquery of that resource that projects only
+    # the fields used by the rest of the query. Filters that reference several resources become the
+    # conditions of explicit joins. Resources are joined greedily, starting from the one with the most
+    # single table filters and always preferring a resource connected to the ones already joined.
+    # Unconnected resources are cross joined
+    def _create_from(self, context, parsed_query):
+        resources = parsed_query['resources'].keys()
+
+        # Every table is sampled before it is filtered or joined
+        sample_clause = u''
+        sample_values = ()
+        if not context['sample'] is None:
+            sample_clause = context['sample'][0]
+            sample_values = context['sample'][1:]
+
+        if len(resources) == 1:
+            resource = parsed_query['resources'][resources[0]]
+
+            return (
+                u'"{table}" as {alias}{sample}'.format(table = resource['table'], alias = resource['alias'], sample = sample_clause),
+                sample_values,
+                [filter_tuple for filter_tuple, references in parsed_query['filters']]
+            )
+
+        table_filters = dict([(r, []) for r in resources])
+        join_filters = []
+        where_filters = []
+
+        columns = dict([(r, []) for r in resources])
+
+        def add_columns(references):
+            for resource_name, field_name in references:
+                if not field_name in columns[resource_name]:
+                    columns[resource_name].append(field_name)
+
+        add_columns(context['references'])
+
+        for filter_tuple, references in parsed_query['filters']:
+            filter_resources = set([resource_name for resource_name, field_name in references])
+
+            if len(filter_resources) == 0:
+                where_filters.append(filter_tuple)
+            elif len(filter_resources) == 1:
+                table_filters[filter_resources.pop()].append(filter_tuple)
+            else:
+                join_filters.append((filter_tuple, filter_resources))
+                add_columns(references)
+
+        # Table subqueries
+        tables = {}
+        for resource_name in resources:
+            resource = parsed_query['resources'][resource_name]
+
+            projection = [u'{alias}."{field}"'.format(alias = resource['alias'], field = field) for field in columns[resource_name]]
+            if len(projection) == 0:
+                projection = [u'1 as "_"']
+
+            table_sql = u'select {fields} from "{table}" as {alias}{sample}'.format(
+                fields = u','.join(projection),
+                table = resource['table'],
+                alias = resource['alias'],
+                sample = sample_clause
+            )
+            table_values = sample_values
+
+            if len(table_filters[resource_name]) > 0:
+                table_sql += u' where ' + u' AND '.join([filter_tuple[0] for filter_tuple in table_filters[resource_name]])
+                for filter_tuple in table_filters[resource_name]:
+                    table_values += filter_tuple[1:]
+
+            tables[resource_name] = (u'({sql}) as {alias}'.format(sql = table_sql, alias = resource['alias']), table_values)
+
+        # Join order
+        def is_connected(resource_name, joined):
+            for filter_tuple, filter_resources in join_filters:
+                if resource_name in filter_resources and len(filter_resources & joined) > 0:
+                    return True
+            return False
+
+        def rank(resource_name):
+            return (-len(table_filters[resource_name]), resources.index(resource_name))
+
+        remaining = sorted(resources, key = rank)
+
+        current = remaining.pop(0)
+        joined = set([current])
+
+        from_clause = tables[current][0]
+        from_values = tables[current][1]
+
+        while len(remaining) > 0:
+            connected = [r for r in remaining if is_connected(r, joined)]
+
+            current = connected[0] if len(connected) > 0 else remaining[0]
+            remaining.remove(current)
+            joined.add(current)
+
+            conditions = [(filter_tuple, filter_resources) for filter_tuple, filter_resources in join_filters if filter_resources <= joined]
+            for condition in conditions:
+                join_filters.remove(condition)
+
+            if len(conditions) == 0:
+                from_clause += u' cross join ' + tables[current][0]
+                from_values += tables[current][1]
+            else:
+                from_clause += u' join {table} on {condition}'.format(
+                    table = tables[current][0],
+                    condition = u' AND '.join([filter_tuple[0] for filter_tuple, filter_resources in conditions])
+                )
+                from_values += tables[current][1]
+                for filter_tuple, filter_resources in conditions:
+                    from_values += filter_tuple[1:]
+
+        return (from_clause, from_values, where_filters)
+
+    # Returns a common table expression with the literal geometries of the query and its parameter
+    # values. Every distinct geometry is sent once as WKB and transformed at most once
+    def _create_geometry_table(self, context):
+        if len(context['geometries']) == 0:
+            return (u'', ())
+
+        sources = []
+        columns = []
+        values = ()
+
+        for wkb, geometry in context['geometries'].items():
+            # Rectangles are built from their bounds instead of being decoded
+            if geometry['envelope'] is None:
+                sources.append(u'ST_GeomFromWKB(%s, 3857) as s{index}'.format(index = geometry['index']))
+                values += (psycopg2.Binary(wkb), )
+            else:
+                sources.append(u'ST_MakeEnvelope(%s, %s, %s, %s, 3857) as s{index}'.format(index = geometry['index']))
+                values += geometry['envelope']
+
+            columns.append(u's{index}'.format(index = geometry['index']))
+            if geometry['transform']:
+                columns.append(u'ST_Transform(s{index}, {srid}) as g{index}'.format(index = geometry['index'], srid = CRS_DEFAULT_DATABASE))
+
+        return (u'with _g as (select {columns} from (select {sources}) as _s) '.format(
+            columns = u','.join(columns),
+            sources = u','.join(sources)
+        ), values)
+
+    def _create_filter(self, context, f):
+        if not type(f) is dict:
+            raise DataException('Filter must be a dictionary.')
+
+        if not 'operator' in f:
+            raise DataException('Parameter operator is missing from filter.')
+
+        if not f['operator'] in ALL_OPERATORS:
+            raise DataException('Operator {operator} is not supported.'.format(operator = f['operator']))
+
+        if not 'arguments' in f:
+            raise DataException('Parameter arguments is missing from filter.')
+
+        if not type(f['arguments']) is list or len(f['arguments']) == 0:
+            raise DataException('Parameter arguments must be a list with at least one member.')
+
+        f = self._prepare_arguments(context, f)
+
+        try:
+            if f['operator'] in COMPARE_OPERATORS:
+                index = COMPARE_OPERATORS.index(f['operator'])
+                return self._create_filter_compare(context, f, f['operator'], COMPARE_EXPRESSIONS[index])
+
+            if f['operator'] in SPATIAL_OPERATORS:
+                return self._create_filter_spatial(context, f, f['operator'])
+
+        except ValueError as ex:
+            message = 'Failed to parse argument value for operator {operator}.'.format(operator = f['operator'])
+
+            log.exception(message)
+
+            raise DataException(message)
+
+        return None
+
+    def _create_filter_compare(self, context, f, operator, expression):
+        if len(f['arguments']) != 2:
+            raise DataException('Operator {operator} expects two arguments.'.format(operator = operator))
+
+        arg1 = f['arguments'][0]
+        arg2 = f['arguments'][1]
+
+        symbol1 = self._resolve_field(context, arg1)
+        symbol2 = self._resolve_field(context, arg2)
+
+        arg1_is_field = not symbol1 is None
+        arg1_type = symbol1['type'] if arg1_is_field else None
+
+        arg2_is_field = not symbol2 is None
+        arg2_type = symbol2['type'] if arg2_is_field else None
+
+        if (arg1_is_field and symbol1['is_geom']) or (arg2_is_field and symbol2['is_geom']):
+            raise DataException('Operator {operator} does not support geometry types.'.format(operator = operator))
+
+        if arg1_is_field and arg2_is_field:
+            if operator == OP_LIKE:
+                raise DataException('Operator {operator} does not support two fields as arguments.'.format(operator = operator))
+
+            aliased_arg1 = self._get_field_expression(context, arg1)
+            aliased_arg2 = self._get_field_expression(context, arg2)
+
+            return ('(' + aliased_arg1 + ' ' + expression + ' ' + aliased_arg2 + ')',)
+        elif arg1_is_field and not arg2_is_field:
+            aliased_arg1 = self._get_field_expression(context, arg1)
+            convert_to = ''
+
+            if operator == OP_LIKE:
+                if arg1_type != 'varchar':
+                    raise DataException('Operator {operator} only supports text fields.'.format(operator = operator))
+
+                arg2 = u'%' + unicode(arg2) + u'%'
+            else:
+                convert_to = self._get_literal_cast(arg1_type, arg2)
+
+            return ('(' +aliased_arg1 + convert_to + ' ' + expression + ' %s)', arg2)
+        elif not arg1_is_field and arg2_is_field:
+            aliased_arg2 = self._get_field_expression(context, arg2)
+            convert_to = ''
+
+            if operator == OP_LIKE:
+                if arg2_type != 'varchar':
+                    raise DataException('Operator {operator} only supports text fields.'.format(operator = operator))
+
+                arg1 = u'%' + unicode(arg1) + u'%'
+            else:
+                convert_to = self._get_literal_cast(arg2_type, arg1)
+
+            return ('(' + aliased_arg2 + convert_to  + ' ' + expression + ' %s)', arg1)
+        else:
+            if operator == OP_LIKE:
+                raise DataException('Operator {operator} does not support two fields as literals.'.format(operator = operator))
+
+            return ('(%s ' + expression + ' %s)', arg1, arg2)
+
+    def _get_literal_cast(self, field_type, literal):
+        # Text fields compared to numbers are converted to the type of the number
+        if field_type == 'varchar' and isinstance(literal, numbers.Number):
+            if isinstance(literal, float):
+                return '::float'
+            if isinstance(literal, int):
+                return '::int'
+
+        return ''
+
+    def _create_filter_spatial(self, context, f, operator):
+        if operator == OP_AREA:
+            if len(f['arguments']) != 3:
+                raise DataException('Operator {operator} expects three arguments.'.format(operator = operator))
+            return self._create_filter_spatial_area(context, f, operator)
+        elif operator == OP_DISTANCE:
+            if len(f['arguments']) != 4:
+                raise DataException('Operator {operator} expects four arguments.'.format(operator = operator))
+            return self._create_filter_spatial_distance(context, f, operator)
+        elif operator == OP_CONTAINS:
+            if len(f['arguments']) != 2:
+                raise DataException('Operator {operator} expects two.'.format(operator = operator))
+            return self._create_filter_spatial_relation(context, f, operator, 'ST_Contains')
+        elif operator == OP_INTERSECTS:
+            if len(f['arguments']) != 2:
+                raise DataException('Operator {operator} expects two arguments.'.format(operator = operator))
+            return self._create_filter_spatial_relation(context, f, operator, 'ST_Intersects')
+
+    def _create_filter_spatial_area(self, context, f, operator):
+        arg1 = f['arguments'][0]
+        arg2 = f['arguments'][1]
+        arg3 = f['arguments'][2]
+
+        if arg2 in SPATIAL_COMPARE_OPERATORS:
+            arg2 = COMPARE_EXPRESSIONS[COMPARE_OPERATORS.index(arg2)]
+        else:
+            raise DataException('Expression {expression} for operator {operator} is not valid.'.format(expression = arg2, operator = operator))
+
+        if not self._is_field_geom(context, arg1) and not self._is_geom(arg1):
+            raise DataException('First argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = operator))
+
+        if not isinstance(arg3, numbers.Number):
+            raise DataException('Third argument for operator {operator} must be number.'.format(operator = operator))
+
+        # Areas of literal geometries are computed in the CRS they are expressed in
+        aliased_arg1 = self._get_geometry_argument(context, arg1, transform = False)
+
+        return ('(ST_Area(' + aliased_arg1[0] + ') ' + arg2 + ' %s)', ) + aliased_arg1[1:] + (arg3, )
+
+    def _create_filter_spatial_distance(self, context, f, operator):
+        arg1 = f['arguments'][0]
+        arg2 = f['arguments'][1]
+        arg3 = f['arguments'][2]
+        arg4 = f['arguments'][3]
+
+        if arg3 in SPATIAL_COMPARE_OPERATORS:
+            arg3 = COMPARE_EXPRESSIONS[COMPARE_OPERATORS.index(arg3)]
+        else:
+            raise DataException('Expression {expression} for operator {operator} is not valid.'.format(expression = arg3, operator = operator))
+
+        if not self._is_field_geom(context, arg1) and not self._is_geom(arg1):
+            raise DataException('First argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
+
+        if not self._is_field_geom(context, arg2) and not self._is_geom(arg2):
+            raise DataException('Second argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
+
+        if not isinstance(arg4, numbers.Number):
+            raise DataException('Third argument for operator {operator} must be number.'.format(operator = OP_DISTANCE))
+
+        aliased_arg1 = self._get_geometry_argument(context, arg1)
+        aliased_arg2 = self._get_geometry_argument(context, arg2)
+
+        return ('(ST_Distance(' + aliased_arg1[0] + ', ' + aliased_arg2[0] + ') ' + arg3 + ' %s)', ) + aliased_arg1[1:] + aliased_arg2[1:] + (arg4, )
+
+    def _create_filter_spatial_relation(self, context, f, operator, spatial_operator):
+        arg1 = f['arguments'][0]
+        arg2 = f['arguments'][1]
+
+        if not self._is_field_geom(context, arg1) and not self._is_geom(arg1):
+            raise DataException('First argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
+
+        if not self._is_field_geom(context, arg2) and not self._is_geom(arg2):
+            raise DataException('Second argument for operator {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
+
+        # Features must intersect the envelope of a literal geometry they are compared to
+        if self._is_geom(arg1) and self._is_field_geom(context, arg2):
+            context['envelopes'].append(arg1.bounds)
+        elif self._is_geom(arg2) and self._is_field_geom(context, arg1):
+            context['envelopes'].append(arg2.bounds)
+
+        aliased_arg1 = self._get_geometry_argument(context, arg1)
+        aliased_arg2 = self._get_geometry_argument(context, arg2)
+
+        return ('(' + spatial_operator +'(' + aliased_arg1[0] + ', ' + aliased_arg2[0] + ') = TRUE)', ) + aliased_arg1[1:] + aliased_arg2[1:]
+
+    def _create_computed_field(self, context, f):
+        if not type(f) is dict:
+            raise DataException('Field must be a dictionary.')
+
+        if not 'operator' in f:
+            raise DataException('Parameter operator is missing for computed field.')
+
+        if not f['operator'] in FIELD_OPERATORS:
+            raise DataException('Operator {operator} is not supported for computed fields.'.format(operator = f['operator']))
+
+        if not 'arguments' in f:
+            raise DataException('Parameter arguments is missing for computed field.')
+
+        if not type(f['arguments']) is list or len(f['arguments']) == 0:
+            raise DataException('Parameter arguments must be a list with at least one member.')
+
+        if not 'alias' in f:
+            raise DataException('Parameter alias is missing for computed field.')
+
+        f = self._prepare_arguments(context, f)
+
+        operator = f['operator']
+
+        if operator == OP_AREA:
+            if len(f['arguments']) !=1:
+                raise DataException('Operator {operator} expects one argument for computed fields.'.format(operator = operator))
+            return {
+                'alias' : f['alias'],
+                'expression' : self._create_computed_field_spatial_area(context, f, operator),
+                'is_geom': False
+            }
+        elif operator == OP_DISTANCE:
+            if len(f['arguments']) != 2:
+                raise DataException('Operator {operator} expects two arguments for computed fields.'.format(operator = operator))
+            return {
+                'alias' : f['alias'],
+                'expression' : self._create_computed_field_spatial_distance(context, f, operator),
+                'is_geom': False
+            }
+
+    def _create_computed_field_spatial_area(self, context, f, operator):
+        arg = f['arguments'][0]
+
+        if not self._is_field_geom(context, arg) and not self._is_geom(arg):
+            raise DataException('First argument for computed field {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = operator))
+
+        aliased_arg = self._get_geometry_argument(context, arg, transform = False)
+
+        return ('(ST_Area(' + aliased_arg[0] + '))', ) + aliased_arg[1:]
+
+    def _create_computed_field_spatial_distance(self, context, f, operator):
+        arg1 = f['arguments'][0]
+        arg2 = f['arguments'][1]
+
+        if not self._is_field_geom(context, arg1) and not self._is_geom(arg1):
+            raise DataException('First argument for computed field {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
+
+        if not self._is_field_geom(context, arg2) and not self._is_geom(arg2):
+            raise DataException('Second argument for computed field {operator} must be a geometry field or a GeoJSON encoded geometry.'.format(operator = OP_DISTANCE))
+
+        aliased_arg1 = self._get_geometry_argument(context, arg1)
+        aliased_arg2 = self._get_geometry_argument(context, arg2)
+
+        return ('(ST_Distance(' + aliased_arg1[0] + ', ' + aliased_arg2[0] + '))', ) + aliased_arg1[1:] + aliased_arg2[1:]
+
+    def _add_reference(self, context, resource_name, field_name):
+        context['references'].append((resource_name, field_name))
+
+    def _get_field_expression(self, context, f):
+        self._add_reference(context, context['mapping'][f['resource']], f['name'])
+
+        return '{table}."{field}"'.format(
+            table = context['aliases'][context['mapping'][f['resource']]],
+            field = f['name']
+        )
+
+    # Returns the SQL expression of a geometry field or a literal geometry followed by its parameter
+    # values. Geometry fields are always transformed to the default database CRS, unless their
+    # resource has a projection to it, which is indexed like the geometry field. Literal geometries
+    # are expressed in EPSG:3857 and are transformed only if transform is set. A literal geometry is
+    # a reference to the geometry table of the query and has no parameter values
+    def _get_geometry_argument(self, context, f, transform=True):
+        if self._is_field_geom(context, f):
+            if self._get_field_srid(context, f) == CRS_DEFAULT_DATABASE:
+                return (self._get_field_expression(context, f), )
+
+            projection = self._get_projection(context, context['mapping'][f['resource']], CRS_DEFAULT_DATABASE)
+            if not projection is None:
+                return (self._get_field_expression(context, {'resource' : f['resource'], 'name' : projection}), )
+
+            return ('ST_Transform({field}, {srid})'.format(
+                field = self._get_field_expression(context, f),
+                srid = CRS_DEFAULT_DATABASE
+            ), )
+
+        wkb = f.wkb
+        if not wkb in context['geometries']:
+            context['geometries'][wkb] = {
+                'index' : len(context['geometries']) + 1,
+                'transform' : False,
+                'envelope' : f.bounds if self._is_rectangle(f) else None
+            }
+
+        geometry = context['geometries'][wkb]
+
+        if transform:
+            geometry['transform'] = True
+
+            return ('(select g{index} from _g)'.format(index = geometry['index']), )
+
+        return ('(select s{index} from _g)'.format(index = geometry['index']), )
+
+    # Returns a copy of a filter or computed field with its literal geometries validated, repaired and
+    # simplified using the optional tolerance of the filter
+    def _prepare_arguments(self, context, f):
+        tolerance = None
+        if 'tolerance' in f and not f['tolerance'] is None:
+            if not isinstance(f['tolerance'], numbers.Number) or f['tolerance'] < 0:
+                raise DataException('Parameter tolerance must be a non negative number.')
+            tolerance = f['tolerance']
+
+        if not any([self._is_geom(arg) for arg in f['arguments']]):
+            return f
+
+        prepared = dict(f)
+        prepared['arguments'] = [self._prepare_geometry(context, arg, tolerance) if self._is_geom(arg) else arg for arg in f['arguments']]
+
+        return prepared
+
+    def _prepare_geometry(self, context, geometry, tolerance):
+        if geometry.is_empty:
+            raise DataException('Literal geometries must not be empty.')
+
+        # Invalid polygons, e.g. self intersecting ones, are repaired by buffering them by zero
+        if not geometry.is_valid:
+            reason = shapely.validation.explain_validity(geometry)
+
+            if geometry.geom_type in ['Polygon', 'MultiPolygon']:
+                geometry = geometry.buffer(0)
+
+            if geometry.is_empty or not geometry.is_valid:
+                raise DataException(u'Literal geometry is not valid: {reason}.'.format(reason = reason))
+
+        if not tolerance is None and tolerance > 0:
+            geometry = geometry.simplify(tolerance, preserve_topology = True)
+
+        vertices = self._count_vertices(geometry)
+        if vertices > self.max_geometry_vertices:
+            raise DataException(u'Literal geometry has {vertices} vertices. Only up to {max} vertices are allowed; set a larger simplification tolerance to reduce them.'.format(
+                vertices = vertices,
+                max = self.max_geometry_vertices
+            ))
+
+        return geometry
+
+    def _count_vertices(self, geometry):
+        if hasattr(geometry, 'geoms'):
+            return sum([self._count_vertices(g) for g in geometry.geoms])
+
+        if geometry.geom_type == 'Polygon':
+            return len(geometry.exterior.coords) + sum([len(interior.coords) for interior in geometry.interiors])
+
+        return len(geometry.coords)
+
+    # Axis aligned rectangles are equal to their envelope
+    def _is_rectangle(self, geometry):
+        if geometry.geom_type != 'Polygon' or len(geometry.interiors) > 0:
+            return False
+
+        envelope = shapely.geometry.box(*geometry.bounds)
+        if envelope.area == 0 or abs(geometry.area - envelope.area) > envelope.area * 1e-9:
+            return False
+
+        return geometry.equals(envelope)
+
+    # Returns the symbol table of the fields of the resources of a query. Fields maps every
+    # (resource name, field name) pair to the resource, name, type, geometry flag and srid of the
+    # field and names maps every field name to the resources that have it, in the order of the query
+    def _create_symbols(self, context, resource_names):
+        symbols = {
+            'fields' : {},
+            'names' : {}
+        }
+
+        for resource_name in resource_names:
+            resource = context['resources'][resource_name]
+
+            for field_name, field in resource['fields'].items():
+                is_geom = field_name == resource['geometry_column']
+
+                symbols['fields'][(resource_name, field_name)] = {
+                    'resource' : resource_name,
+                    'name' : field_name,
+                    'type' : field['type'],
+                    'is_geom' : is_geom,
+                    'srid' : resource['srid'] if is_geom else None
+                }
+
+                if field_name in symbols['names']:
+                    symbols['names'][field_name].append(resource_name)
+                else:
+                    symbols['names'][field_name] = [resource_name]
+
+        return symbols
+
+    # Returns the symbol of a field argument or None if the argument is not a field. The resource
+    # of a field without one is set
+    def _resolve_field(self, context, f):
+        if f is None:
+            return None
+
+        if not type(f) is dict:
+            return None
+
+        if not 'name' in f:
+            return None
+
+        mapping = context['mapping']
+
+        if 'resource' in f and (not f['resource'] in mapping or not mapping[f['resource']] in context['resources']):
+            raise DataException('Resource {resource} does not exist.'.format(resource = f['resource']))
+
+        # Set default resource of arguments if not already set
+        if not 'resource' in f:
+            f['resource'] = self._get_resource_by_field_name(context, f['name'])
+
+        symbol = context['symbols']['fields'].get((mapping[f['resource']], f['name']))
+        if symbol is None:
+            raise DataException('Field {field} does not belong to resource {resource}.'.format(field = f['name'], resource = f['resource']))
+
+        return symbol
+
+    def _is_field(self, context, f):
+        return not self._resolve_field(context, f) is None
+
+    def _get_field_type(self, context, f):
+        symbol = self._resolve_field(context, f)
+
+        return None if symbol is None else symbol['type']
+
+    def _is_field_geom(self, context, f):
+        symbol = self._resolve_field(context, f)
+
+        return False if symbol is None else symbol['is_geom']
+
+    def _get_field_srid(self, context, f):
+        symbol = self._resolve_field(context, f)
+
+        return None if symbol is None else symbol['srid']
+
+    # Returns the column that stores the geometries of a resource transformed to a CRS or None
+    def _get_projection(self, context, resource_name, srid):
+        if not self.geometry_projections:
+            return None
+
+        resource = context['resources'][resource_name]
+
+        projections = resource.get('projections')
+        if not projections or not srid in projections:
+            return None
+
+        return projections[srid]
+
+    def _is_geom(self, f):
+        return isinstance(f, shapely.geometry.base.BaseGeometry)
+
+    def _get_resources_by_field_name(self, context, field):
+        return context['symbols']['names'].get(field, [])
+
+    def _get_resource_by_field_name(self, context, field):
+        resources = self._get_resources_by_field_name(context, field)
+
+        if len(resources) == 0:
+            raise DataException(u'Field {field} does not exist.'.format(
+                field = field
+            ))
+        elif len(resources) > 1:
+            raise DataException(u'Field {field} is ambiguous for resources {resources}.'.format(
+                field = field,
+                resources = u','.join(resources)
+            ))
+
+        return resources[0]
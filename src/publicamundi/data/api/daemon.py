@@ -0,0 +1,99 @@
+import logging
+
+import json
+import os
+import SocketServer
+
+from .encoder import ShapelyGeoJsonEncoder
+from .decoder import ShapelyJsonDecoder
+from .exceptions import DataException
+from .scheduler import QueryScheduler
+from .base import QueryExecutor
+
+log = logging.getLogger(__name__)
+
+# Protocol of the query daemon. The client sends a single line with a JSON object that contains the
+# query and, optionally, the pretty flag. The server replies with a single line JSON header with the
+# status, the number of queue results and their continuation markers, followed by every queue result
+# encoded as a sequence of chunks. Every chunk is its length in bytes on a line of its own followed by
+# the bytes. A zero length chunk terminates a queue result.
+DAEMON_STATUS_OK = 'ok'
+DAEMON_STATUS_ERROR = 'error'
+
+DAEMON_CHUNK_SIZE = 65536
+
+class QueryRequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline(), cls=ShapelyJsonDecoder, encoding='utf-8')
+
+            result = self.server.executor.execute(self.server.config, request['query'], {})
+        except Exception as ex:
+            message = ex.message if isinstance(ex, DataException) else 'Request is malformed.'
+
+            log.exception(message)
+
+            self._write_header(DAEMON_STATUS_ERROR, message=message)
+            return
+
+        self._write_header(DAEMON_STATUS_OK, count=len(result['data']), continuation=result['continuation'])
+
+        if 'pretty' in request and request['pretty']:
+            encoder = ShapelyGeoJsonEncoder(encoding='utf-8', indent=4, separators=(',', ': '))
+        else:
+            encoder = ShapelyGeoJsonEncoder(encoding='utf-8')
+
+        for data in result['data']:
+            buffered = []
+            buffered_size = 0
+
+            for chunk in encoder.iterencode(data):
+                if isinstance(chunk, unicode):
+                    chunk = chunk.encode('utf-8')
+
+                buffered.append(chunk)
+                buffered_size += len(chunk)
+
+                if buffered_size >= DAEMON_CHUNK_SIZE:
+                    self._write_chunk(''.join(buffered))
+                    buffered = []
+                    buffered_size = 0
+
+            if buffered_size > 0:
+                self._write_chunk(''.join(buffered))
+            self._write_chunk('')
+
+    def _write_header(self, status, **kwargs):
+        header = dict(kwargs)
+        header['status'] = status
+
+        self.wfile.write(json.dumps(header) + '\n')
+
+    def _write_chunk(self, data):
+        self.wfile.write(str(len(data)) + '\n')
+        self.wfile.write(data)
+
+# Long running query server listening on a Unix socket. A single executor serves every request so
+# that connection pools and the catalog and schema caches stay warm
+class QueryServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path, config, executor=None):
+        self.config = config
+        self.executor = QueryExecutor(QueryScheduler(config)) if executor is None else executor
+
+        if os.path.exists(path):
+            os.remove(path)
+
+        SocketServer.UnixStreamServer.__init__(self, path, QueryRequestHandler)
+
+    def warm(self, describe=False):
+        return self.executor.warm(self.config, describe)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
@@ -0,0 +1,108 @@
+import logging
+
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+from .exceptions import QueryTimeoutException
+
+log = logging.getLogger(__name__)
+
+# Cancels the commands of registered DBAPI connections once their deadline passes. A single
+# background thread serves every deadline of the process and is started on first use
+class _Watchdog(object):
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.sequence = itertools.count()
+
+        # Heap of (expires, token)
+        self.expirations = []
+        # Token to DBAPI connection
+        self.connections = {}
+
+        self.thread = None
+
+    def register(self, expires, connection):
+        with self.condition:
+            token = next(self.sequence)
+
+            heapq.heappush(self.expirations, (expires, token))
+            self.connections[token] = connection
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+
+            self.condition.notify()
+
+        return token
+
+    # Cancels are issued while holding the condition, hence a connection is never cancelled after
+    # it was unregistered, e.g. once it is returned to the pool and used by another request
+    def unregister(self, token):
+        with self.condition:
+            self.connections.pop(token, None)
+
+    def _run(self):
+        with self.condition:
+            while True:
+                # Discard the expirations of unregistered connections
+                while len(self.expirations) > 0 and not self.expirations[0][1] in self.connections:
+                    heapq.heappop(self.expirations)
+
+                if len(self.expirations) == 0:
+                    self.condition.wait()
+                    continue
+
+                delay = self.expirations[0][0] - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+
+                token = heapq.heappop(self.expirations)[1]
+                connection = self.connections[token]
+
+                # Cancelling a connection without a running command has no effect
+                try:
+                    connection.cancel()
+                except Exception as ex:
+                    log.warning(u'Failed to cancel command: {error}'.format(error = ex))
+
+                self.connections.pop(token, None)
+
+_watchdog = _Watchdog()
+
+# Wall clock deadline of a request. Commands executed while a connection is watched are cancelled
+# by the database server as soon as the deadline passes
+class Deadline(object):
+
+    def __init__(self, timeout):
+        # Timeout in milliseconds
+        self.timeout = timeout
+        self.expires = time.time() + (timeout / 1000.0)
+
+    def remaining(self):
+        return max(int((self.expires - time.time()) * 1000), 0)
+
+    def expired(self):
+        return time.time() >= self.expires
+
+    def check(self):
+        if self.expired():
+            raise QueryTimeoutException(u'Execution timeout has expired. Current timeout value is {timeout} seconds.'.format(
+                timeout = (self.timeout / 1000.0)
+            ))
+
+    # Watches a DBAPI connection that supports cancel, e.g. a psycopg2 connection, until the block
+    # exits. Expiring the deadline never interrupts the watching thread itself
+    @contextlib.contextmanager
+    def watch(self, connection):
+        token = _watchdog.register(self.expires, connection)
+        try:
+            yield
+        finally:
+            _watchdog.unregister(token)
@@ -6,16 +6,22 @@ import geojson
 import shapely.geometry
 import shapely.geometry.base
 
+from .features import Feature, Record
+
 log = logging.getLogger(__name__)
 
 class ShapelyJsonEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, shapely.geometry.base.BaseGeometry):
             return shapely.geometry.mapping(obj)
+        if isinstance(obj, (Feature, Record)):
+            return obj.to_dict()
         return json.JSONEncoder.default(self, obj)
 
 class ShapelyGeoJsonEncoder(geojson.codec.GeoJSONEncoder):
     def default(self, obj):
         if isinstance(obj, shapely.geometry.base.BaseGeometry):
             return shapely.geometry.mapping(obj)
+        if isinstance(obj, (Feature, Record)):
+            return obj.to_dict()
         return json.GeoJSONEncoder.default(self, obj)
@@ -0,0 +1,28 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+class DataException(Exception):
+    def __init__(self, message, innerException=None):
+        self.message = message
+        self.innerException = innerException
+
+    def __str__(self):
+        return repr(self.message)
+
+# Execution did not complete before the timeout expired
+class QueryTimeoutException(DataException):
+    pass
+
+# The service can not execute queries at the moment, e.g. no data source replica is available or the
+# result size budget of the process is exhausted. The query may succeed if submitted again later
+class ServiceUnavailableException(DataException):
+    pass
+
+# The result of the query exceeds the size budget of a request
+class ResultTooLargeException(DataException):
+    pass
+
+# Execution failed because of an unexpected error of the service or the database
+class InternalException(DataException):
+    pass
@@ -0,0 +1,66 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+# Compact representations of result rows. Property names are shared by every row of a query result
+# and only the values are stored per row. Dictionaries are created while the result is encoded, one
+# row at a time
+
+class Feature(object):
+
+    __slots__ = ('id', 'geometry', 'names', 'values')
+
+    def __init__(self, id, geometry, names, values):
+        self.id = id
+        self.geometry = geometry
+        self.names = names
+        self.values = values
+
+    @property
+    def properties(self):
+        return dict(zip(self.names, self.values))
+
+    def __getitem__(self, key):
+        if key == 'type':
+            return 'Feature'
+        if key in Feature.__slots__ or key == 'properties':
+            return getattr(self, key)
+
+        raise KeyError(key)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        return {
+            'id' : self.id,
+            'properties' : dict(zip(self.names, self.values)),
+            'geometry' : self.geometry,
+            'type' : 'Feature'
+        }
+
+class Record(object):
+
+    __slots__ = ('names', 'values')
+
+    def __init__(self, names, values):
+        self.names = names
+        self.values = values
+
+    def __getitem__(self, key):
+        try:
+            return self.values[self.names.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.names
+
+    def keys(self):
+        return list(self.names)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        return dict(zip(self.names, self.values))
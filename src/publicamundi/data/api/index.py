@@ -0,0 +1,240 @@
+import logging
+
+from sqlalchemy.sql import text
+
+log = logging.getLogger(__name__)
+
+CONFIG_CATALOG_INDEX = 'catalog.index'
+
+# The catalog index is used whenever it exists in the catalog database, unless disabled
+DEFAULT_CATALOG_INDEX = True
+
+CATALOG_INDEX_TABLE = 'pm_catalog_index'
+
+# Vector storer resources of the CKAN catalog along with their WMS resources and packages. Every
+# extras value is parsed as JSON several times per revision, hence the cost of the query grows with
+# the revision history of the catalog
+CATALOG_RESOURCES_SQL = u"""
+    select  resource_db.resource_id as db_resource_id,
+            package_revision.title as package_title,
+            package_revision.notes as package_notes,
+            resource_db.resource_name as resource_name,
+            resource_wms.resource_id as wms_resource_id,
+            resource_db.geometry_type as geometry_type,
+            resource_wms.wms_server as wms_server,
+            resource_wms.wms_layer as wms_layer
+    from
+        (
+        select  id as resource_id,
+                json_extract_path_text((extras::json),'vectorstorer_resource') as vector_storer,
+                json_extract_path_text((extras::json),'geometry') as geometry_type,
+                json_extract_path_text((extras::json),'parent_resource_id') as resource_parent_id,
+                resource_group_id as group_id,
+                name as resource_name
+        from	resource_revision
+        where	format = 'data_table'
+                and current = True
+                and state = 'active'
+                and json_extract_path_text((extras::json),'vectorstorer_resource')  = 'True'
+        ) as resource_db
+        left outer join
+            (
+            select	id as resource_id,
+                    json_extract_path_text((extras::json),'vectorstorer_resource') as vector_storer,
+                    json_extract_path_text((extras::json),'geometry') as geometry_type,
+                    json_extract_path_text((extras::json),'parent_resource_id') as resource_parent_id,
+                    resource_group_id as group_id,
+                    json_extract_path_text((extras::json),'wms_server') as wms_server,
+                    json_extract_path_text((extras::json),'wms_layer') as wms_layer
+            from	resource_revision
+            where	format = 'wms'
+                    and current = True
+                    and state = 'active'
+                    and json_extract_path_text((extras::json),'vectorstorer_resource')  = 'True'
+            ) as resource_wms
+                on	resource_db.group_id = resource_wms.group_id
+                    and resource_db.resource_id = resource_wms.resource_parent_id
+        left outer join resource_group_revision
+                on	resource_group_revision.id = resource_db.group_id
+                    and resource_group_revision.state = 'active'
+                    and resource_group_revision.current = True
+        left outer join	package_revision
+                on	resource_group_revision.package_id = package_revision.id
+                    and package_revision.state = 'active'
+                    and package_revision.current = True
+"""
+
+# Latest revision timestamp of the resources, resource groups and packages of the catalog
+CATALOG_REVISION_SQL = u"""
+    select  max(revision_timestamp)
+    from    (
+            select max(revision_timestamp) as revision_timestamp from resource_revision
+            union all
+            select max(revision_timestamp) as revision_timestamp from resource_group_revision
+            union all
+            select max(revision_timestamp) as revision_timestamp from package_revision
+            ) as r;
+"""
+
+# Resources with a revision, or whose resource group or package has a revision, after a timestamp.
+# The parent resource of WMS resources is returned as well, since WMS resources are stored as part
+# of the table resources they render
+CATALOG_CHANGES_SQL = u"""
+    select  resource_revision.id as resource_id,
+            json_extract_path_text((resource_revision.extras::json),'parent_resource_id') as resource_parent_id,
+            resource_revision.revision_timestamp as revision_timestamp
+    from    resource_revision
+    where   resource_revision.revision_timestamp > %s
+            and resource_revision.format in ('data_table', 'wms')
+    union all
+    select  resource_revision.id as resource_id,
+            json_extract_path_text((resource_revision.extras::json),'parent_resource_id') as resource_parent_id,
+            resource_group_revision.revision_timestamp as revision_timestamp
+    from    resource_group_revision
+                inner join resource_revision
+                    on  resource_revision.resource_group_id = resource_group_revision.id
+                        and resource_revision.current = True
+                        and resource_revision.format in ('data_table', 'wms')
+    where   resource_group_revision.revision_timestamp > %s
+    union all
+    select  resource_revision.id as resource_id,
+            json_extract_path_text((resource_revision.extras::json),'parent_resource_id') as resource_parent_id,
+            package_revision.revision_timestamp as revision_timestamp
+    from    package_revision
+                inner join resource_group_revision
+                    on  resource_group_revision.package_id = package_revision.id
+                        and resource_group_revision.current = True
+                inner join resource_revision
+                    on  resource_revision.resource_group_id = resource_group_revision.id
+                        and resource_revision.current = True
+                        and resource_revision.format in ('data_table', 'wms')
+    where   package_revision.revision_timestamp > %s;
+"""
+
+# Catalog resources of specific table or WMS resource ids
+CATALOG_RESOURCES_BY_ID_SQL = u"""
+    select  *
+    from    ({resources}) as r
+    where   r.db_resource_id in %s or r.wms_resource_id in %s;
+""".format(resources = CATALOG_RESOURCES_SQL)
+
+# Lookup table of the vector storer resources of the CKAN catalog, i.e. the result of the catalog
+# resources query. The table is created in the catalog database and is not updated by CKAN. It is
+# maintained explicitly, either by refreshing it as a whole or by updating the rows of specific
+# resources. Readers are never blocked, since every change is applied by a single transaction.
+# Every row records when it was written in UTC, the time zone of CKAN revision timestamps
+class CatalogIndex(object):
+
+    def __init__(self, table=CATALOG_INDEX_TABLE):
+        self.table = table
+
+    def exists(self, connection):
+        sql = text(u"""
+            select  count(*)
+            from    pg_class
+            where   relname = :table and relkind = 'r' and pg_table_is_visible(oid);
+        """)
+
+        return connection.execute(sql, table = self.table).scalar() > 0
+
+    def create(self, connection):
+        transaction = connection.begin()
+        try:
+            connection.execute(u"""
+                create table "{table}" (
+                    db_resource_id text not null,
+                    package_title text,
+                    package_notes text,
+                    resource_name text,
+                    wms_resource_id text,
+                    geometry_type text,
+                    wms_server text,
+                    wms_layer text,
+                    updated_at timestamp not null default (now() at time zone 'utc')
+                );
+                create index "{table}_db_resource_id_idx" on "{table}" (db_resource_id);
+                create index "{table}_wms_resource_id_idx" on "{table}" (wms_resource_id);
+            """.format(table = self.table))
+
+            count = self._insert(connection)
+
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+
+        log.info(u'Catalog index {table} is created with {count} resources.'.format(table = self.table, count = count))
+
+        return count
+
+    def drop(self, connection):
+        connection.execute(u'drop table if exists "{table}";'.format(table = self.table))
+
+    # Replaces the content of the index with the current catalog resources
+    def refresh(self, connection):
+        transaction = connection.begin()
+        try:
+            connection.execute(u'delete from "{table}";'.format(table = self.table))
+            count = self._insert(connection)
+
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+
+        log.info(u'Catalog index {table} is refreshed with {count} resources.'.format(table = self.table, count = count))
+
+        return count
+
+    # Replaces the rows of the resources with the given table or WMS resource ids. Resources that
+    # are no longer vector storer resources are removed
+    def update(self, connection, ids):
+        ids = tuple(ids)
+        if len(ids) == 0:
+            return 0
+
+        transaction = connection.begin()
+        try:
+            connection.execute(u'delete from "{table}" where db_resource_id in %s or wms_resource_id in %s;'.format(table = self.table), (ids, ids))
+            count = self._insert(connection, ids)
+
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+
+        log.info(u'Catalog index {table} is updated with {count} of {total} resources.'.format(table = self.table, count = count, total = len(ids)))
+
+        return count
+
+    def get_resources_sql(self):
+        return u"""
+            select  db_resource_id, package_title, package_notes, resource_name, wms_resource_id, geometry_type, wms_server, wms_layer
+            from    "{table}";
+        """.format(table = self.table)
+
+    # Returns the time of the oldest row, or None if the index is empty. The index reflects every
+    # catalog revision committed before that time
+    def get_revision(self, connection):
+        return connection.execute(u'select min(updated_at) from "{table}";'.format(table = self.table)).scalar()
+
+    # Returns the table resource id of a table or WMS resource id, or None if the resource does not
+    # exist in the index
+    def get_table_resource(self, connection, id):
+        sql = u'select db_resource_id from "{table}" where db_resource_id = %s or wms_resource_id = %s limit 1;'.format(table = self.table)
+
+        return connection.execute(sql, (id, id)).scalar()
+
+    def _insert(self, connection, ids=None):
+        sql = u"""
+            insert into "{table}" (db_resource_id, package_title, package_notes, resource_name, wms_resource_id, geometry_type, wms_server, wms_layer)
+            select  db_resource_id, package_title, package_notes, resource_name, wms_resource_id, geometry_type, wms_server, wms_layer
+            from    ({resources}) as r
+        """.format(table = self.table, resources = CATALOG_RESOURCES_SQL)
+
+        if ids is None:
+            return connection.execute(sql + u';').rowcount
+
+        sql += u' where db_resource_id in %s or wms_resource_id in %s;'
+
+        return connection.execute(sql, (ids, ids)).rowcount
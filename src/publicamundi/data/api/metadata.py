@@ -0,0 +1,98 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+def _create_metadata(cls, values):
+    return cls(**values)
+
+# Metadata objects are immutable and shared by every request that accesses them. Values can be read
+# either as attributes or by name like the dictionaries they replace
+class _Metadata(object):
+
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            object.__setattr__(self, name, kwargs.pop(name))
+
+        if len(kwargs) > 0:
+            raise TypeError('Unexpected attributes: ' + ', '.join(kwargs.keys()))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Metadata objects are immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('Metadata objects are immutable.')
+
+    # Attribute lookup is implemented in C, which keeps item access as fast as with dictionaries
+    __getitem__ = object.__getattribute__
+
+    def __contains__(self, name):
+        return name in self.__slots__
+
+    def __repr__(self):
+        return '{type}({values})'.format(
+            type = type(self).__name__,
+            values = ', '.join(['{name}={value!r}'.format(name = name, value = getattr(self, name)) for name in self.__slots__])
+        )
+
+    def __reduce__(self):
+        return (_create_metadata, (type(self), dict([(name, getattr(self, name)) for name in self.__slots__])))
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def replace(self, **kwargs):
+        values = dict([(name, getattr(self, name)) for name in self.__slots__])
+        values.update(kwargs)
+
+        return type(self)(**values)
+
+    def to_dict(self):
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
+
+class Field(_Metadata):
+
+    __slots__ = ('name', 'type')
+
+    def __init__(self, name, type):
+        _Metadata.__init__(self, name = name, type = type)
+
+# A catalog resource. Resources returned by the catalog have no srid, geometry column, fields and
+# projections until they are combined with the description of their table. Projections map srids to
+# the columns that store the geometries of the geometry column transformed to them
+class Resource(_Metadata):
+
+    __slots__ = (
+        'id',
+        'table',
+        'resource_name',
+        'package_title',
+        'package_notes',
+        'wms',
+        'wms_server',
+        'wms_layer',
+        'geometry_type',
+        'srid',
+        'geometry_column',
+        'fields',
+        'projections'
+    )
+
+    # Returns a new resource with the srid, geometry column, fields and projections of a resource
+    # description
+    def describe(self, description):
+        return self.replace(
+            srid = description['srid'],
+            geometry_column = description['geometry_column'],
+            fields = description['fields'],
+            projections = description.get('projections')
+        )
+
+    def to_dict(self):
+        result = _Metadata.to_dict(self)
+
+        if not self.fields is None:
+            result['fields'] = dict([(name, self.fields[name].to_dict()) for name in self.fields])
+
+        return result
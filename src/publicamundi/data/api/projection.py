@@ -0,0 +1,153 @@
+import logging
+
+from sqlalchemy.sql import text
+
+from .exceptions import DataException
+
+log = logging.getLogger(__name__)
+
+# Maximum length of PostgreSQL identifiers
+MAX_IDENTIFIER_LENGTH = 63
+
+# Projections are created for the default output CRS and WGS84 unless specific ones are requested.
+# EPSG:900913 is an alias of EPSG:3857 that may not exist in spatial_ref_sys
+DEFAULT_PROJECTION_SRIDS = [3857, 4326]
+
+# Returns the name of the column that stores the geometries of a geometry column transformed to a
+# CRS. Columns starting with an underscore are never exposed as resource fields
+def get_projection_column(column, srid):
+    return u'_{column}_{srid}'.format(column = column, srid = srid)
+
+# Returns True if a spatial reference system exists in spatial_ref_sys
+def has_spatial_reference_system(connection, srid):
+    sql = text(u'select count(*) from spatial_ref_sys where srid = :srid;')
+
+    return connection.execute(sql, srid = srid).scalar() > 0
+
+# Maintains pre-projected geometry columns of resource tables. A projection column stores the
+# geometries of the geometry column of a table transformed to another CRS. It is kept up to date by
+# a trigger and has its own spatial index, hence queries whose output CRS or filter CRS matches a
+# projection read geometries without transforming them per row. Projections are detected when
+# resources are described
+class GeometryProjection(object):
+
+    def __init__(self, table):
+        self.table = table
+
+    # Returns the geometry column of the table and its srid
+    def get_geometry_column(self, connection):
+        sql = text(u"""
+            select  f_geometry_column as "column", srid
+            from    geometry_columns
+            where   f_table_name = :table;
+        """)
+
+        columns = [r for r in connection.execute(sql, table = self.table) if not r['column'].startswith('_')]
+        if len(columns) != 1:
+            raise DataException(u'Table {table} must have exactly one geometry column.'.format(table = self.table))
+
+        return columns[0]['column'], columns[0]['srid']
+
+    # Returns the srids of the existing projections
+    def get_srids(self, connection):
+        column, srid = self.get_geometry_column(connection)
+
+        sql = text(u"""
+            select  f_geometry_column as "column", srid
+            from    geometry_columns
+            where   f_table_name = :table;
+        """)
+
+        return sorted([r['srid'] for r in connection.execute(sql, table = self.table) if r['column'] == get_projection_column(column, r['srid'])])
+
+    def _get_names(self, column, srid):
+        projection_column = get_projection_column(column, srid)
+        function = u'{table}{column}'.format(table = self.table, column = projection_column)
+
+        if len(function) > MAX_IDENTIFIER_LENGTH:
+            raise DataException(u'Projection function name {name} is longer than {length} characters.'.format(name = function, length = MAX_IDENTIFIER_LENGTH))
+
+        return projection_column, function
+
+    # Adds a projection column, fills it, and creates its trigger and spatial index. Returns the
+    # number of rows. Adding the column takes an access exclusive lock, hence the table can be
+    # neither read nor written until every row is transformed and the index is built
+    def create(self, connection, srid):
+        column, table_srid = self.get_geometry_column(connection)
+        if srid == table_srid:
+            raise DataException(u'Geometries of table {table} are already stored in EPSG:{srid}.'.format(table = self.table, srid = srid))
+        if not has_spatial_reference_system(connection, srid):
+            raise DataException(u'Spatial reference system EPSG:{srid} does not exist in spatial_ref_sys.'.format(srid = srid))
+
+        projection_column, function = self._get_names(column, srid)
+
+        transaction = connection.begin()
+        try:
+            connection.execute(u"""
+                alter table "{table}" add column "{projection}" geometry(Geometry, {srid});
+                create function "{function}"() returns trigger as $$
+                begin
+                    NEW."{projection}" := ST_Transform(NEW."{column}", {srid});
+                    return NEW;
+                end;
+                $$ language plpgsql;
+                create trigger "{function}" before insert or update of "{column}" on "{table}"
+                    for each row execute procedure "{function}"();
+            """.format(table = self.table, column = column, projection = projection_column, function = function, srid = srid))
+
+            count = connection.execute(u'update "{table}" set "{projection}" = ST_Transform("{column}", {srid});'.format(
+                table = self.table,
+                column = column,
+                projection = projection_column,
+                srid = srid
+            )).rowcount
+
+            connection.execute(u'create index on "{table}" using gist ("{projection}");'.format(table = self.table, projection = projection_column))
+
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+
+        connection.execute(u'analyze "{table}";'.format(table = self.table))
+
+        log.info(u'Projection {projection} of table {table} is created for {count} rows.'.format(table = self.table, projection = projection_column, count = count))
+
+        return count
+
+    # Transforms the geometries of every row again, e.g. after the trigger was disabled. Every row is
+    # updated by a single command, hence writers of the table are blocked until it completes
+    def refresh(self, connection, srid):
+        column, table_srid = self.get_geometry_column(connection)
+        projection_column, function = self._get_names(column, srid)
+
+        count = connection.execute(u'update "{table}" set "{projection}" = ST_Transform("{column}", {srid});'.format(
+            table = self.table,
+            column = column,
+            projection = projection_column,
+            srid = srid
+        )).rowcount
+
+        log.info(u'Projection {projection} of table {table} is refreshed for {count} rows.'.format(table = self.table, projection = projection_column, count = count))
+
+        return count
+
+    # Drops a projection column along with its trigger and index
+    def drop(self, connection, srid):
+        column, table_srid = self.get_geometry_column(connection)
+        projection_column, function = self._get_names(column, srid)
+
+        transaction = connection.begin()
+        try:
+            connection.execute(u"""
+                drop trigger if exists "{function}" on "{table}";
+                drop function if exists "{function}"();
+                alter table "{table}" drop column if exists "{projection}";
+            """.format(table = self.table, projection = projection_column, function = function))
+
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+
+        log.info(u'Projection {projection} of table {table} is dropped.'.format(table = self.table, projection = projection_column))
@@ -0,0 +1,233 @@
+import logging
+
+import itertools
+import threading
+import time
+
+from .exceptions import DataException
+
+log = logging.getLogger(__name__)
+
+CONFIG_ROUTING_POLICY = 'routing.policy'
+CONFIG_ROUTING_EJECT_FAILURES = 'routing.eject.failures'
+CONFIG_ROUTING_EJECT_TIME = 'routing.eject.time'
+CONFIG_ROUTING_HEALTH_INTERVAL = 'routing.health.interval'
+
+# Replica selection policies
+ROUTING_POLICY_ROUND_ROBIN = 'round_robin'
+ROUTING_POLICY_LEAST_OUTSTANDING = 'least_outstanding'
+
+ROUTING_POLICIES = [ROUTING_POLICY_ROUND_ROBIN, ROUTING_POLICY_LEAST_OUTSTANDING]
+
+DEFAULT_ROUTING_POLICY = ROUTING_POLICY_LEAST_OUTSTANDING
+# Number of consecutive failures that eject a replica
+DEFAULT_ROUTING_EJECT_FAILURES = 3
+# Minimum time in milliseconds a replica stays ejected
+DEFAULT_ROUTING_EJECT_TIME = 30000
+# Interval in milliseconds between health checks of ejected replicas
+DEFAULT_ROUTING_HEALTH_INTERVAL = 5000
+
+# Parses the replicas of a data source. A data source is either a connection string, a list of
+# connection strings or a list of dictionaries with a url and an optional weight. A string is a
+# single connection string unless it spans several lines, in which case every non empty line is a
+# connection string. Connection strings may be followed by ;weight=N. Returns a tuple of (url,
+# weight) tuples
+def parse_replicas(value):
+    if isinstance(value, basestring):
+        value = [v.strip() for v in value.splitlines() if len(v.strip()) > 0]
+    elif isinstance(value, dict):
+        value = [value]
+
+    if not type(value) in [list, tuple] or len(value) == 0:
+        raise DataException('At least one data source connection string is required.')
+
+    replicas = []
+    for v in value:
+        weight = 1
+
+        if isinstance(v, basestring):
+            url = v
+            if ';weight=' in v:
+                url, weight = v.rsplit(';weight=', 1)
+        elif isinstance(v, dict) and 'url' in v:
+            url = v['url']
+            weight = v.get('weight', 1)
+        elif type(v) in [list, tuple] and len(v) == 2:
+            url, weight = v
+        else:
+            raise DataException(u'Data source {source} is not supported.'.format(source = v))
+
+        try:
+            weight = int(weight)
+        except (TypeError, ValueError):
+            weight = 0
+        if weight <= 0:
+            raise DataException(u'Weight of data source {url} must be a positive integer.'.format(url = url))
+
+        replicas.append((url, weight))
+
+    return tuple(replicas)
+
+class Replica(object):
+
+    def __init__(self, url, weight, engine):
+        self.url = url
+        self.weight = weight
+        self.engine = engine
+
+        # Number of requests currently using the replica
+        self.outstanding = 0
+        # Current weight of the smooth weighted round robin selection
+        self.current = 0
+
+        self.failures = 0
+        # Time until which the replica is not selected while healthy replicas exist
+        self.ejected_until = None
+
+    def is_ejected(self):
+        return not self.ejected_until is None
+
+    def __repr__(self):
+        return u'Replica({url}, weight={weight})'.format(url = self.url, weight = self.weight)
+
+# Distributes read requests to the replicas of a data source. Replicas that fail a number of
+# consecutive times are ejected and reinstated after a minimum time, as soon as a health check
+# succeeds. Health checks are executed by a background thread only while replicas are ejected. If
+# every replica is ejected, requests are still routed to ejected replicas instead of failing
+class ReplicaRouter(object):
+
+    def __init__(self, replicas, engine_factory, config={}):
+        self.policy = config[CONFIG_ROUTING_POLICY] if CONFIG_ROUTING_POLICY in config else DEFAULT_ROUTING_POLICY
+        self.eject_failures = config[CONFIG_ROUTING_EJECT_FAILURES] if CONFIG_ROUTING_EJECT_FAILURES in config else DEFAULT_ROUTING_EJECT_FAILURES
+        self.eject_time = config[CONFIG_ROUTING_EJECT_TIME] if CONFIG_ROUTING_EJECT_TIME in config else DEFAULT_ROUTING_EJECT_TIME
+        self.health_interval = config[CONFIG_ROUTING_HEALTH_INTERVAL] if CONFIG_ROUTING_HEALTH_INTERVAL in config else DEFAULT_ROUTING_HEALTH_INTERVAL
+
+        if not self.policy in ROUTING_POLICIES:
+            raise DataException(u'Routing policy {policy} is not supported.'.format(policy = self.policy))
+
+        self.replicas = [Replica(url, weight, engine_factory(url)) for url, weight in parse_replicas(replicas)]
+
+        self.lock = threading.Lock()
+        # Rotates the first candidate so that ties of the least outstanding policy are spread
+        self.sequence = itertools.count()
+        self.checking = False
+
+    # Selects a replica not in exclude and increments its outstanding requests. Returns None if
+    # every replica is excluded. The replica must be released
+    def acquire(self, exclude=()):
+        with self.lock:
+            candidates = [r for r in self.replicas if not r in exclude]
+            if len(candidates) == 0:
+                return None
+
+            healthy = [r for r in candidates if not r.is_ejected()]
+            if len(healthy) > 0:
+                candidates = healthy
+            else:
+                # Prefer the replica that was ejected first, since it is the most likely to recover
+                candidates = [min(candidates, key=lambda r: r.ejected_until)]
+
+            if self.policy == ROUTING_POLICY_ROUND_ROBIN or len(candidates) == 1:
+                replica = self._select_weighted(candidates)
+            else:
+                offset = next(self.sequence) % len(candidates)
+                candidates = candidates[offset:] + candidates[:offset]
+
+                replica = min(candidates, key=lambda r: (r.outstanding + 1.0) / r.weight)
+
+            replica.outstanding += 1
+
+            return replica
+
+    # Releases a replica. A failed request counts towards the ejection of the replica and a
+    # successful one resets its failures
+    def release(self, replica, failed=False):
+        with self.lock:
+            replica.outstanding -= 1
+
+            if not failed:
+                replica.failures = 0
+                return
+
+            replica.failures += 1
+            if replica.failures < self.eject_failures or replica.is_ejected():
+                return
+
+            replica.ejected_until = time.time() + (self.eject_time / 1000.0)
+
+            log.warning(u'Replica {url} is ejected after {failures} consecutive failures.'.format(
+                url = replica.url,
+                failures = replica.failures
+            ))
+
+            if not self.checking:
+                self.checking = True
+
+                thread = threading.Thread(target=self._check)
+                thread.daemon = True
+                thread.start()
+
+    # Smooth weighted round robin. Every replica is selected in proportion to its weight and
+    # selections of the same replica are interleaved with the selections of the others
+    def _select_weighted(self, candidates):
+        total = 0
+        for r in candidates:
+            r.current += r.weight
+            total += r.weight
+
+        replica = max(candidates, key=lambda r: r.current)
+        replica.current -= total
+
+        return replica
+
+    def _check(self):
+        while True:
+            time.sleep(self.health_interval / 1000.0)
+
+            with self.lock:
+                replicas = [r for r in self.replicas if r.is_ejected() and r.ejected_until <= time.time()]
+                if len([r for r in self.replicas if r.is_ejected()]) == 0:
+                    self.checking = False
+                    return
+
+            for replica in replicas:
+                healthy = self._is_healthy(replica)
+
+                with self.lock:
+                    if healthy:
+                        replica.failures = 0
+                        replica.ejected_until = None
+                    else:
+                        replica.ejected_until = time.time() + (self.eject_time / 1000.0)
+
+                if healthy:
+                    log.info(u'Replica {url} is reinstated.'.format(url = replica.url))
+
+    def _is_healthy(self, replica):
+        connection = None
+
+        try:
+            connection = replica.engine.connect()
+            connection.execute(u'select 1;').scalar()
+
+            return True
+        except Exception as ex:
+            log.debug(u'Health check of replica {url} failed: {error}'.format(url = replica.url, error = ex))
+
+            return False
+        finally:
+            if not connection is None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+    def health(self):
+        with self.lock:
+            return [{
+                'url' : r.url,
+                'weight' : r.weight,
+                'outstanding' : r.outstanding,
+                'failures' : r.failures,
+                'ejected' : r.is_ejected()
+            } for r in self.replicas]
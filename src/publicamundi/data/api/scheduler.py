@@ -0,0 +1,177 @@
+import logging
+
+import bisect
+import itertools
+import threading
+import time
+
+from .exceptions import DataException, ServiceUnavailableException
+from .compiler import *
+
+log = logging.getLogger(__name__)
+
+CONFIG_SCHEDULER_MAX_CONCURRENCY = 'scheduler.max.concurrency'
+CONFIG_SCHEDULER_MAX_CLIENT_CONCURRENCY = 'scheduler.max.client.concurrency'
+CONFIG_SCHEDULER_MAX_HEAVY_CONCURRENCY = 'scheduler.max.heavy.concurrency'
+CONFIG_SCHEDULER_MAX_QUEUE = 'scheduler.max.queue'
+CONFIG_SCHEDULER_QUEUE_TIMEOUT = 'scheduler.queue.timeout'
+
+DEFAULT_SCHEDULER_MAX_CONCURRENCY = 8
+DEFAULT_SCHEDULER_MAX_CLIENT_CONCURRENCY = 2
+# Defaults to half of the global limit so that heavy queries never occupy every slot
+DEFAULT_SCHEDULER_MAX_HEAVY_CONCURRENCY = None
+DEFAULT_SCHEDULER_MAX_QUEUE = 64
+# Maximum time in milliseconds a query may wait for a slot
+DEFAULT_SCHEDULER_QUEUE_TIMEOUT = 10000
+
+# Priority classes. Lower values are scheduled first
+PRIORITY_LIGHT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HEAVY = 2
+
+# Query is rejected by the scheduler because the service is saturated
+class QueryRejectedException(ServiceUnavailableException):
+    pass
+
+class _Ticket(object):
+
+    def __init__(self, client, priority):
+        self.client = client
+        self.priority = priority
+        self.granted = False
+
+# Admission control in front of query execution. At most max_concurrency queries execute at the
+# same time and every client is limited to max_client_concurrency of them. Queries that cannot
+# execute immediately wait in a bounded queue ordered by priority class and arrival. A query is
+# rejected if the queue is full or no slot is granted before the queue timeout expires. Queries
+# without a client are only subject to the global limits.
+class QueryScheduler(object):
+
+    def __init__(self, config={}):
+        self.max_concurrency = config[CONFIG_SCHEDULER_MAX_CONCURRENCY] if CONFIG_SCHEDULER_MAX_CONCURRENCY in config else DEFAULT_SCHEDULER_MAX_CONCURRENCY
+        self.max_client_concurrency = config[CONFIG_SCHEDULER_MAX_CLIENT_CONCURRENCY] if CONFIG_SCHEDULER_MAX_CLIENT_CONCURRENCY in config else DEFAULT_SCHEDULER_MAX_CLIENT_CONCURRENCY
+        self.max_heavy_concurrency = config[CONFIG_SCHEDULER_MAX_HEAVY_CONCURRENCY] if CONFIG_SCHEDULER_MAX_HEAVY_CONCURRENCY in config else DEFAULT_SCHEDULER_MAX_HEAVY_CONCURRENCY
+        self.max_queue = config[CONFIG_SCHEDULER_MAX_QUEUE] if CONFIG_SCHEDULER_MAX_QUEUE in config else DEFAULT_SCHEDULER_MAX_QUEUE
+        self.queue_timeout = config[CONFIG_SCHEDULER_QUEUE_TIMEOUT] if CONFIG_SCHEDULER_QUEUE_TIMEOUT in config else DEFAULT_SCHEDULER_QUEUE_TIMEOUT
+
+        if self.max_heavy_concurrency is None:
+            self.max_heavy_concurrency = max(self.max_concurrency / 2, 1)
+
+        self.condition = threading.Condition()
+        self.sequence = itertools.count()
+
+        # Sorted list of (priority, sequence, ticket)
+        self.waiting = []
+
+        self.running = 0
+        self.running_heavy = 0
+        # Client to number of running queries
+        self.running_clients = {}
+
+    # Derives the priority class of a query from its queue. Queries that access a single resource
+    # per queue item are light. Spatial joins, i.e. spatial filters between fields, and queue items
+    # that access more than two resources make a query heavy
+    def classify(self, query):
+        priority = PRIORITY_LIGHT
+
+        queue = query['queue'] if type(query) is dict and 'queue' in query and type(query['queue']) is list else []
+
+        for q in queue:
+            if not type(q) is dict:
+                continue
+
+            resources = q['resources'] if 'resources' in q and type(q['resources']) is list else []
+            if len(resources) > 2:
+                return PRIORITY_HEAVY
+            if len(resources) > 1:
+                priority = PRIORITY_NORMAL
+
+            filters = q['filters'] if 'filters' in q and type(q['filters']) is list else []
+            for f in filters:
+                if not type(f) is dict or not f.get('operator') in SPATIAL_OPERATORS:
+                    continue
+                if not type(f.get('arguments')) is list:
+                    continue
+
+                fields = [a for a in f['arguments'] if type(a) is dict and 'name' in a]
+                if len(fields) > 1:
+                    return PRIORITY_HEAVY
+
+        return priority
+
+    # Blocks until the query may execute and returns a ticket that must be released
+    def acquire(self, client, query):
+        ticket = _Ticket(client, self.classify(query))
+        entry = (ticket.priority, next(self.sequence), ticket)
+
+        deadline = time.time() + (self.queue_timeout / 1000.0)
+
+        with self.condition:
+            if len(self.waiting) >= self.max_queue:
+                raise QueryRejectedException('Too many queued queries.')
+
+            bisect.insort(self.waiting, entry)
+            self._grant()
+
+            while not ticket.granted:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.waiting.remove(entry)
+
+                    if self.queue_timeout <= 0:
+                        raise QueryRejectedException('Every query slot is in use.')
+
+                    log.warning(u'Query of client {client} timed out after waiting {timeout} milliseconds.'.format(
+                        client = client,
+                        timeout = self.queue_timeout
+                    ))
+
+                    raise QueryRejectedException(u'Query waited more than {timeout} seconds for execution.'.format(
+                        timeout = self.queue_timeout / 1000.0
+                    ))
+
+                self.condition.wait(remaining)
+
+        return ticket
+
+    def release(self, ticket):
+        with self.condition:
+            self.running -= 1
+            if ticket.priority == PRIORITY_HEAVY:
+                self.running_heavy -= 1
+            if not ticket.client is None:
+                self.running_clients[ticket.client] -= 1
+                if self.running_clients[ticket.client] == 0:
+                    del self.running_clients[ticket.client]
+
+            self._grant()
+
+    # Grants slots to waiting queries in priority order. A query that is blocked by its client or
+    # class limit does not block queries behind it. Must be called holding the condition
+    def _grant(self):
+        granted = False
+
+        index = 0
+        while index < len(self.waiting) and self.running < self.max_concurrency:
+            ticket = self.waiting[index][2]
+
+            if not ticket.client is None and self.running_clients.get(ticket.client, 0) >= self.max_client_concurrency:
+                index += 1
+                continue
+            if ticket.priority == PRIORITY_HEAVY and self.running_heavy >= self.max_heavy_concurrency:
+                index += 1
+                continue
+
+            del self.waiting[index]
+
+            ticket.granted = True
+            self.running += 1
+            if ticket.priority == PRIORITY_HEAVY:
+                self.running_heavy += 1
+            if not ticket.client is None:
+                self.running_clients[ticket.client] = self.running_clients.get(ticket.client, 0) + 1
+
+            granted = True
+
+        if granted:
+            self.condition.notify_all()
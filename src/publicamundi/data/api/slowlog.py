@@ -0,0 +1,70 @@
+import logging
+
+import datetime
+import json
+import random
+
+import psycopg2.extensions
+
+log = logging.getLogger(__name__)
+
+CONFIG_SLOWLOG_THRESHOLD = 'slowlog.threshold'
+CONFIG_SLOWLOG_EXPLAIN_RATE = 'slowlog.explain.rate'
+CONFIG_SLOWLOG_SINK = 'slowlog.sink'
+
+# Queue items executing for at least the threshold in milliseconds are recorded. Slow queries are
+# recorded only if a positive threshold is set
+DEFAULT_SLOWLOG_THRESHOLD = 0
+# Fraction of the recorded queries whose plan is captured. Capturing a plan executes the query again
+DEFAULT_SLOWLOG_EXPLAIN_RATE = 0.0
+# Records are written to the slow query logger unless a callable that accepts a record is set
+DEFAULT_SLOWLOG_SINK = None
+
+# Every record is written as a single JSON document, so that the logger can be routed to its own
+# rotating file
+SLOWLOG_LOGGER = 'publicamundi.data.api.slowlog'
+
+SLOWLOG_MAX_VALUE_LENGTH = 64
+
+_slowlog = logging.getLogger(SLOWLOG_LOGGER)
+
+# Returns the parameter values of a command with binary values and long strings abbreviated
+def summarize_values(values):
+    summary = []
+
+    for value in values:
+        if isinstance(value, psycopg2.extensions.Binary):
+            value = u'<{size} bytes>'.format(size = len(value.adapted))
+        elif isinstance(value, basestring) and len(value) > SLOWLOG_MAX_VALUE_LENGTH:
+            value = value[:SLOWLOG_MAX_VALUE_LENGTH] + u'...'
+        elif not value is None and not isinstance(value, (bool, int, long, float)):
+            value = unicode(value)
+
+        summary.append(value)
+
+    return summary
+
+class SlowQueryLog(object):
+
+    def __init__(self, config={}):
+        self.threshold = config[CONFIG_SLOWLOG_THRESHOLD] if CONFIG_SLOWLOG_THRESHOLD in config else DEFAULT_SLOWLOG_THRESHOLD
+        self.explain_rate = config[CONFIG_SLOWLOG_EXPLAIN_RATE] if CONFIG_SLOWLOG_EXPLAIN_RATE in config else DEFAULT_SLOWLOG_EXPLAIN_RATE
+        self.sink = config[CONFIG_SLOWLOG_SINK] if CONFIG_SLOWLOG_SINK in config else DEFAULT_SLOWLOG_SINK
+
+    def is_slow(self, elapsed_time):
+        return self.threshold > 0 and elapsed_time * 1000 >= self.threshold
+
+    def should_explain(self):
+        return self.explain_rate > 0 and random.random() < self.explain_rate
+
+    def record(self, record):
+        record['timestamp'] = datetime.datetime.utcnow().isoformat() + 'Z'
+
+        if not self.sink is None:
+            try:
+                self.sink(record)
+            except Exception as ex:
+                log.warning(u'Slow query sink has failed: {error}'.format(error = ex))
+            return
+
+        _slowlog.warning(json.dumps(record, default=unicode))
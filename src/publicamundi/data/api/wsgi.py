@@ -0,0 +1,266 @@
+import logging
+
+import json
+import Queue
+import threading
+import zlib
+
+from .encoder import ShapelyGeoJsonEncoder
+from .decoder import ShapelyJsonDecoder
+from .exceptions import DataException, QueryTimeoutException, ServiceUnavailableException, ResultTooLargeException, InternalException
+from .compiler import QUERY_FORMAT_GEOJSON
+from .scheduler import QueryScheduler, QueryRejectedException, CONFIG_SCHEDULER_QUEUE_TIMEOUT
+from .base import QueryExecutor
+
+log = logging.getLogger(__name__)
+
+CONFIG_WSGI_CHUNK_SIZE = 'wsgi.chunk.size'
+CONFIG_WSGI_COMPRESSION_LEVEL = 'wsgi.compression.level'
+CONFIG_WSGI_BUFFERED_CHUNKS = 'wsgi.buffered.chunks'
+
+DEFAULT_WSGI_CHUNK_SIZE = 65536
+DEFAULT_WSGI_COMPRESSION_LEVEL = 6
+# Number of encoded chunks buffered between the query and the server. A query whose client does not
+# keep up waits, holding its cursor, until the server has sent a chunk
+DEFAULT_WSGI_BUFFERED_CHUNKS = 4
+# Queries are not queued by the front end unless a queue timeout is set, so that a saturated service
+# answers 503 immediately and clients retry after backing off
+DEFAULT_WSGI_QUEUE_TIMEOUT = 0
+
+# Raised in the thread of a query once the server has closed the response, e.g. because the client
+# has disconnected, so that the query is aborted
+class _ResponseClosedException(DataException):
+    pass
+
+# Returns True if an Accept-Encoding header accepts gzip. Codings with a zero quality value are not
+# acceptable
+def _accepts_gzip(header):
+    qualities = {}
+
+    for coding in (header or '').split(','):
+        parameters = [p.strip().lower() for p in coding.split(';')]
+        if len(parameters[0]) == 0:
+            continue
+
+        quality = 1.0
+        for parameter in parameters[1:]:
+            if parameter.startswith('q='):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.0
+
+        qualities[parameters[0]] = quality
+
+    for coding in ['gzip', 'x-gzip', '*']:
+        if coding in qualities:
+            return qualities[coding] > 0
+
+    return False
+
+# Encodes the rows passed by the executor to JSON chunks that are sent by the server. Chunks are
+# handed over through a bounded queue as ('data', chunk), ('end', None) or ('error', exception)
+class _ResultWriter(object):
+
+    def __init__(self, chunk_size, buffered_chunks):
+        self.chunk_size = chunk_size
+        self.messages = Queue.Queue(max(buffered_chunks, 1))
+        self.encoder = ShapelyGeoJsonEncoder(encoding='utf-8')
+
+        self.buffered = []
+        self.buffered_size = 0
+
+        self.items = 0
+        self.rows = 0
+        self.output_format = None
+
+        self.closed = False
+
+    def begin(self, output_format, crs):
+        self._write(u'{"data": [' if self.items == 0 else u', ')
+
+        if output_format == QUERY_FORMAT_GEOJSON:
+            self._write(u'{"type": "FeatureCollection", "crs": ')
+            self._write(json.dumps({ 'type': 'name', 'properties': { 'name': 'urn:ogc:def:crs:EPSG::' + str(crs) } }))
+            self._write(u', "features": [')
+        else:
+            self._write(u'[')
+
+        self.items += 1
+        self.rows = 0
+        self.output_format = output_format
+
+    def write(self, row):
+        if self.rows > 0:
+            self._write(u', ')
+        self.rows += 1
+
+        for chunk in self.encoder.iterencode(row):
+            self._write(chunk)
+
+    def end(self):
+        self._write(u']}' if self.output_format == QUERY_FORMAT_GEOJSON else u']')
+
+    # Writes every member of the result other than its data and sends the remaining chunks
+    def finish(self, result):
+        if self.items == 0:
+            self._write(u'{"data": [')
+
+        members = dict([(name, value) for name, value in result.items() if name != 'data'])
+
+        self._write(u']' if len(members) == 0 else u'], ')
+        self._write(self.encoder.encode(members)[1:])
+
+        if self.buffered_size > 0:
+            self._put(('data', ''.join(self.buffered)))
+        self._put(('end', None))
+
+    def fail(self, ex):
+        try:
+            self._put(('error', ex))
+        except _ResponseClosedException:
+            pass
+
+    def _write(self, chunk):
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+
+        self.buffered.append(chunk)
+        self.buffered_size += len(chunk)
+
+        if self.buffered_size >= self.chunk_size:
+            data = ''.join(self.buffered)
+            self.buffered = []
+            self.buffered_size = 0
+
+            self._put(('data', data))
+
+    def _put(self, message):
+        while True:
+            if self.closed:
+                raise _ResponseClosedException('Response is closed.')
+
+            try:
+                self.messages.put(message, True, 1)
+                return
+            except Queue.Full:
+                pass
+
+# Response body that sends the chunks of a writer, optionally compressed. Closing the response aborts
+# the query
+class _StreamedResponse(object):
+
+    def __init__(self, writer, message, compression_level):
+        self.writer = writer
+        self.message = message
+        self.compressor = None if compression_level is None else zlib.compressobj(compression_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def __iter__(self):
+        message = self.message
+
+        while True:
+            kind, value = message
+
+            if kind == 'error':
+                # The status is already sent, hence the response is truncated
+                log.error(u'Query has failed after its response has started: {error}'.format(error = value))
+                return
+
+            if kind == 'end':
+                if not self.compressor is None:
+                    yield self.compressor.flush()
+                return
+
+            if not self.compressor is None:
+                value = self.compressor.compress(value)
+            if len(value) > 0:
+                yield value
+
+            message = self.writer.messages.get()
+
+    def close(self):
+        self.writer.closed = True
+
+# WSGI application that executes the query posted as the request body and streams the encoded result.
+# The query is executed by a thread of its own that reads rows from a server side cursor, encodes
+# them and hands the encoded chunks to the server, hence neither the decoded nor the encoded result
+# is held in memory. The status is sent along with the first chunk, hence errors raised before it
+# are answered with an error status and later ones truncate the response.
+# Queries are admitted by a QueryScheduler using the remote address as the client. Queries rejected
+# by the scheduler are answered with 503. Unlike the scheduler, the queue timeout of the front end
+# defaults to zero, hence queries that can not execute immediately are rejected
+class QueryApplication(object):
+
+    def __init__(self, config, executor=None):
+        self.config = config
+        if executor is None:
+            scheduler_config = dict(config)
+            if not CONFIG_SCHEDULER_QUEUE_TIMEOUT in scheduler_config:
+                scheduler_config[CONFIG_SCHEDULER_QUEUE_TIMEOUT] = DEFAULT_WSGI_QUEUE_TIMEOUT
+
+            executor = QueryExecutor(QueryScheduler(scheduler_config))
+
+        self.executor = executor
+
+        self.chunk_size = config[CONFIG_WSGI_CHUNK_SIZE] if CONFIG_WSGI_CHUNK_SIZE in config else DEFAULT_WSGI_CHUNK_SIZE
+        self.compression_level = config[CONFIG_WSGI_COMPRESSION_LEVEL] if CONFIG_WSGI_COMPRESSION_LEVEL in config else DEFAULT_WSGI_COMPRESSION_LEVEL
+        self.buffered_chunks = config[CONFIG_WSGI_BUFFERED_CHUNKS] if CONFIG_WSGI_BUFFERED_CHUNKS in config else DEFAULT_WSGI_BUFFERED_CHUNKS
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return self._error(start_response, '405 Method Not Allowed', 'Queries must be submitted using POST.', [('Allow', 'POST')])
+
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            query = json.loads(environ['wsgi.input'].read(length), cls=ShapelyJsonDecoder, encoding='utf-8')
+        except ValueError:
+            return self._error(start_response, '400 Bad Request', 'Query is not a valid JSON document.')
+
+        writer = _ResultWriter(self.chunk_size, self.buffered_chunks)
+
+        thread = threading.Thread(target=self._execute, args=(writer, query, environ.get('REMOTE_ADDR')))
+        thread.daemon = True
+        thread.start()
+
+        message = writer.messages.get()
+        if message[0] == 'error':
+            return self._exception(start_response, message[1])
+
+        headers = [('Content-Type', 'application/json; charset=utf-8')]
+
+        compress = _accepts_gzip(environ.get('HTTP_ACCEPT_ENCODING'))
+        if compress:
+            headers.append(('Content-Encoding', 'gzip'))
+        headers.append(('Vary', 'Accept-Encoding'))
+
+        start_response('200 OK', headers)
+
+        return _StreamedResponse(writer, message, self.compression_level if compress else None)
+
+    def _execute(self, writer, query, client):
+        try:
+            result = self.executor.execute(self.config, query, {}, client, writer)
+
+            writer.finish(result)
+        except Exception as ex:
+            writer.fail(ex)
+
+    def _exception(self, start_response, ex):
+        if isinstance(ex, QueryTimeoutException):
+            return self._error(start_response, '504 Gateway Timeout', ex.message)
+        if isinstance(ex, ServiceUnavailableException):
+            return self._error(start_response, '503 Service Unavailable', ex.message, [('Retry-After', '1')])
+        if isinstance(ex, ResultTooLargeException):
+            return self._error(start_response, '413 Request Entity Too Large', ex.message)
+        if isinstance(ex, InternalException) or not isinstance(ex, DataException):
+            return self._error(start_response, '500 Internal Server Error', ex.message if isinstance(ex, DataException) else 'Unhandled exception has occured.')
+
+        # Remaining errors are raised by validating the query
+        return self._error(start_response, '400 Bad Request', ex.message)
+
+    def _error(self, start_response, status, message, headers=[]):
+        body = json.dumps({ 'message' : message })
+
+        start_response(status, [('Content-Type', 'application/json; charset=utf-8'), ('Content-Length', str(len(body)))] + headers)
+
+        return [body]
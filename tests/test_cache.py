@@ -0,0 +1,101 @@
+import time
+import unittest
+
+from publicamundi.data.api import *
+
+class TileGridTestCase(unittest.TestCase):
+
+    def test_zoom_of_world(self):
+        self.assertEqual(get_tile_zoom((-TILE_ORIGIN, -TILE_ORIGIN, TILE_ORIGIN, TILE_ORIGIN)), 0)
+
+    def test_zoom_is_bounded(self):
+        self.assertEqual(get_tile_zoom((0, 0, 0, 0)), TILE_MAX_ZOOM)
+        self.assertEqual(get_tile_zoom((0, 0, 1e-6, 1e-6)), TILE_MAX_ZOOM)
+        self.assertEqual(get_tile_zoom((-4 * TILE_ORIGIN, -TILE_ORIGIN, 4 * TILE_ORIGIN, TILE_ORIGIN)), 0)
+
+    def test_tiles_are_not_larger_than_bounds(self):
+        bounds = (2687295.03, 4368610.00, 2914771.63, 4520261.07)
+
+        zoom = get_tile_zoom(bounds)
+        tiles = get_tiles(bounds, zoom)
+
+        size = 2 * TILE_ORIGIN / (2 ** zoom)
+        self.assertLessEqual(size, bounds[2] - bounds[0])
+        self.assertGreater(size * 2, bounds[2] - bounds[0])
+
+        # At most three tiles per axis
+        self.assertLessEqual(len(set([x for (x, y), tile_bounds in tiles])), 3)
+        self.assertLessEqual(len(set([y for (x, y), tile_bounds in tiles])), 3)
+
+    def test_tiles_cover_bounds(self):
+        bounds = (2687295.03, 4368610.00, 2914771.63, 4520261.07)
+
+        tiles = get_tiles(bounds, get_tile_zoom(bounds))
+
+        self.assertLessEqual(min([b[0] for i, b in tiles]), bounds[0])
+        self.assertLessEqual(min([b[1] for i, b in tiles]), bounds[1])
+        self.assertGreaterEqual(max([b[2] for i, b in tiles]), bounds[2])
+        self.assertGreaterEqual(max([b[3] for i, b in tiles]), bounds[3])
+
+        # Tiles are adjacent and do not overlap
+        for index, tile_bounds in tiles:
+            self.assertAlmostEqual(tile_bounds[2] - tile_bounds[0], tile_bounds[3] - tile_bounds[1])
+        self.assertEqual(len(tiles), len(set([index for index, tile_bounds in tiles])))
+
+    def test_tiles_of_world(self):
+        tiles = get_tiles((-TILE_ORIGIN, -TILE_ORIGIN, TILE_ORIGIN, TILE_ORIGIN), 1)
+
+        self.assertEqual([index for index, tile_bounds in tiles], [(0, 0), (1, 0), (0, 1), (1, 1)])
+        self.assertEqual(tiles[0][1], (-TILE_ORIGIN, -TILE_ORIGIN, 0, 0))
+
+    def test_tiles_outside_of_world_are_clamped(self):
+        tiles = get_tiles((2 * TILE_ORIGIN, 2 * TILE_ORIGIN, 3 * TILE_ORIGIN, 3 * TILE_ORIGIN), 2)
+
+        self.assertEqual([index for index, tile_bounds in tiles], [(3, 3)])
+
+class TileCacheTestCase(unittest.TestCase):
+
+    def test_get_and_set(self):
+        cache = TileCache()
+
+        self.assertIsNone(cache.get(60, 'a'))
+
+        cache.set(10, 'a', [1])
+
+        self.assertEqual(cache.get(60, 'a'), [1])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_least_recently_used_are_evicted(self):
+        cache = TileCache()
+
+        cache.set(2, 'a', 1)
+        cache.set(2, 'b', 2)
+        cache.get(60, 'a')
+        cache.set(2, 'c', 3)
+
+        self.assertEqual(cache.get(60, 'a'), 1)
+        self.assertIsNone(cache.get(60, 'b'))
+        self.assertEqual(cache.get(60, 'c'), 3)
+
+    def test_entries_expire(self):
+        cache = TileCache()
+
+        cache.set(10, 'a', 1)
+        time.sleep(0.02)
+
+        self.assertIsNone(cache.get(0.01, 'a'))
+        # Expired entries are removed
+        self.assertEqual(len(cache.entries), 0)
+
+    def test_clear(self):
+        cache = TileCache()
+
+        cache.set(10, 'a', 1)
+        cache.get(60, 'a')
+        cache.clear()
+
+        self.assertIsNone(cache.get(60, 'a'))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+if __name__ == '__main__':
+    unittest.main()
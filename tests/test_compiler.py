@@ -0,0 +1,198 @@
+import unittest
+
+import shapely.geometry
+
+from publicamundi.data.api import *
+
+def create_resource(name, fields, srid=CRS_DEFAULT_DATABASE, projections=None):
+    return Resource(
+        id = name,
+        table = name,
+        resource_name = name,
+        package_title = None,
+        package_notes = None,
+        wms = None,
+        wms_server = None,
+        wms_layer = None,
+        geometry_type = None,
+        srid = srid,
+        geometry_column = 'the_geom',
+        fields = dict([(f, Field(f, t)) for f, t in fields + [('the_geom', 'geometry')]]),
+        projections = projections
+    )
+
+class QueryCompilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.compiler = QueryCompiler()
+        self.resources = {
+            'cities' : create_resource('cities', [('name', 'varchar'), ('pop', 'int4'), ('region_id', 'int4')]),
+            'regions' : create_resource('regions', [('region', 'varchar'), ('code', 'int4')], 4326),
+            'projected' : create_resource('projected', [('name', 'varchar')], projections = { CRS_DEFAULT_OUTPUT : 'the_geom_3857' })
+        }
+        self.polygon = shapely.geometry.box(2687295.03, 4368610.00, 2914771.63, 4520261.07)
+
+    def compile(self, query, output_format=QUERY_FORMAT_JSON, **kwargs):
+        return self.compiler.compile(query, self.resources, CRS_DEFAULT_OUTPUT, output_format, **kwargs)
+
+    def test_query_is_not_modified(self):
+        query = {
+            'resources' : [{ 'name' : 'cities', 'alias' : 'c' }],
+            'fields' : ['name', { 'name' : 'pop' }],
+            'filters' : [{ 'operator' : OP_GT, 'arguments' : [{ 'name' : 'pop' }, 100] }],
+            'sort' : ['pop']
+        }
+        copy = {
+            'resources' : [{ 'name' : 'cities', 'alias' : 'c' }],
+            'fields' : ['name', { 'name' : 'pop' }],
+            'filters' : [{ 'operator' : OP_GT, 'arguments' : [{ 'name' : 'pop' }, 100] }],
+            'sort' : ['pop']
+        }
+
+        compiled_query = self.compile(query)
+
+        self.assertEqual(query, copy)
+        self.assertEqual(compiled_query['fields'].keys(), ['name', 'pop'])
+
+    def test_all_fields_are_selected_by_default(self):
+        compiled_query = self.compile({ 'resources' : ['cities'] })
+
+        self.assertEqual(sorted(compiled_query['fields'].keys()), ['name', 'pop', 'region_id', 'the_geom'])
+
+    def test_limit_and_offset_are_parameters(self):
+        first = self.compile({ 'resources' : ['cities'], 'fields' : ['name'], 'limit' : 5, 'offset' : 10 })
+        second = self.compile({ 'resources' : ['cities'], 'fields' : ['name'], 'limit' : 50, 'offset' : 0 })
+
+        self.assertEqual(first['sql'], second['sql'])
+        self.assertEqual(first['values'][-2:], (5, 10))
+        self.assertEqual(second['values'][-2:], (50, 0))
+
+    def test_limit_is_bounded(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['name'], 'limit' : MAX_RESULT_ROWS + 1 })
+
+        self.assertEqual(compiled_query['limit'], MAX_RESULT_ROWS)
+
+    def test_sort(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['name', 'pop'], 'sort' : [{ 'name' : 'pop', 'desc' : True }] })
+
+        self.assertIn(u'order by t1."pop" desc', compiled_query['sql'])
+        self.assertEqual(compiled_query['sort'], [('pop', True)])
+
+    def test_sort_by_field_not_selected(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['name'], 'sort' : ['pop'] })
+
+        self.assertEqual(compiled_query['sort'], [(None, False)])
+
+    def test_join_pushes_down_single_table_filters(self):
+        compiled_query = self.compile({
+            'resources' : ['cities', 'regions'],
+            'fields' : ['name', 'region'],
+            'filters' : [
+                { 'operator' : OP_EQ, 'arguments' : [{ 'resource' : 'cities', 'name' : 'region_id' }, { 'resource' : 'regions', 'name' : 'code' }] },
+                { 'operator' : OP_GT, 'arguments' : [{ 'name' : 'pop' }, 100] }
+            ]
+        })
+
+        self.assertIn(u' join ', compiled_query['sql'])
+        self.assertIn(u'on (t1."region_id" = t2."code")', compiled_query['sql'])
+        self.assertIn(u'(t1."pop" > %s)', compiled_query['sql'].split(u' join ')[0])
+
+    def test_unknown_resource(self):
+        self.assertRaises(DataException, self.compile, { 'resources' : ['missing'] })
+
+    def test_unknown_field(self):
+        self.assertRaises(DataException, self.compile, { 'resources' : ['cities'], 'fields' : ['missing'] })
+
+    def test_ambiguous_field(self):
+        self.assertRaises(DataException, self.compile, { 'resources' : ['cities', 'regions'], 'fields' : ['the_geom'] })
+
+    def test_geojson_requires_one_geometry(self):
+        self.assertRaises(DataException, self.compile, { 'resources' : ['cities'], 'fields' : ['name'] }, QUERY_FORMAT_GEOJSON)
+
+    def test_literal_geometry_is_bound_once(self):
+        compiled_query = self.compile({
+            'resources' : ['cities'],
+            'fields' : ['name', 'the_geom'],
+            'filters' : [
+                { 'operator' : OP_INTERSECTS, 'arguments' : [{ 'name' : 'the_geom' }, self.polygon] },
+                { 'operator' : OP_CONTAINS, 'arguments' : [self.polygon, { 'name' : 'the_geom' }] }
+            ]
+        })
+
+        self.assertTrue(compiled_query['sql'].startswith(u'with _g as '))
+        self.assertEqual(compiled_query['sql'].count(u'ST_MakeEnvelope'), 1)
+        self.assertEqual(compiled_query['values'][:4], self.polygon.bounds)
+
+    def test_exact_count(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['name'], 'count' : QUERY_COUNT_EXACT })
+
+        self.assertEqual(compiled_query['count_column'], QUERY_COUNT_COLUMN)
+        self.assertIn(u'as "{column}"'.format(column = QUERY_COUNT_COLUMN), compiled_query['sql'])
+
+    def test_unsupported_count(self):
+        self.assertRaises(DataException, self.compile, { 'resources' : ['cities'], 'count' : 'all' })
+
+    def test_sample(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['name'], 'sample' : 10 })
+
+        self.assertIn(u'tablesample system (%s)', compiled_query['sql'])
+        self.assertEqual(compiled_query['values'][0], 10)
+
+    def test_invalid_sample(self):
+        self.assertRaises(DataException, self.compile, { 'resources' : ['cities'], 'sample' : 0 })
+        self.assertRaises(DataException, self.compile, { 'resources' : ['cities'], 'sample' : { 'percent' : 10, 'method' : 'RANDOM' } })
+
+    def test_projection_is_read(self):
+        compiled_query = self.compile({ 'resources' : ['projected'], 'fields' : ['name', 'the_geom'] })
+
+        self.assertIn(u't1."the_geom_3857" as "the_geom"', compiled_query['sql'])
+        self.assertNotIn(u'ST_Transform', compiled_query['sql'])
+
+    def test_geometry_is_transformed(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['name', 'the_geom'] })
+
+        self.assertIn(u'ST_Transform(t1."the_geom", 3857) as "the_geom"', compiled_query['sql'])
+
+    def test_partition_key(self):
+        compiled_query = self.compile({
+            'resources' : ['cities'],
+            'fields' : ['pop', 'the_geom'],
+            'filters' : [{ 'operator' : OP_INTERSECTS, 'arguments' : [{ 'name' : 'the_geom' }, self.polygon] }],
+            'sort' : ['pop']
+        })
+
+        partition = compiled_query['partition']
+
+        self.assertEqual(partition['resource'], 'cities')
+        self.assertEqual(partition['sort'], [('pop', False)])
+        self.assertIsNone(partition['index'])
+
+    def test_partition_parameters(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['pop', 'the_geom'] }, partition = True)
+
+        self.assertIsNotNone(compiled_query['partition']['index'])
+        self.assertIn(u'ST_MakeEnvelope', compiled_query['sql'])
+
+    def test_partition_requires_geometry_output(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['pop'] })
+
+        self.assertIsNone(compiled_query['partition'])
+
+    def test_partition_requires_uncollated_sort(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['name', 'the_geom'], 'sort' : ['name'] })
+
+        self.assertIsNone(compiled_query['partition'])
+
+    def test_partition_requires_single_resource(self):
+        compiled_query = self.compile({ 'resources' : ['cities', 'regions'], 'fields' : ['name', { 'resource' : 'cities', 'name' : 'the_geom' }] })
+
+        self.assertIsNone(compiled_query['partition'])
+
+    def test_identity(self):
+        compiled_query = self.compile({ 'resources' : ['cities'], 'fields' : ['name'] }, identity = True)
+
+        self.assertIn(u't1.ctid as "{column}"'.format(column = QUERY_IDENTITY_COLUMN), compiled_query['sql'])
+        self.assertRaises(DataException, self.compile, { 'resources' : ['cities', 'regions'], 'fields' : ['name'] }, identity = True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+import time
+import unittest
+
+from publicamundi.data.api import *
+
+class _Connection(object):
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+class DeadlineTestCase(unittest.TestCase):
+
+    def test_remaining(self):
+        deadline = Deadline(10000)
+
+        self.assertGreater(deadline.remaining(), 9000)
+        self.assertLessEqual(deadline.remaining(), 10000)
+        self.assertFalse(deadline.expired())
+
+        deadline.check()
+
+    def test_expired(self):
+        deadline = Deadline(0)
+
+        self.assertEqual(deadline.remaining(), 0)
+        self.assertTrue(deadline.expired())
+        self.assertRaises(QueryTimeoutException, deadline.check)
+
+    def test_watched_connection_is_cancelled(self):
+        connection = _Connection()
+
+        with Deadline(20).watch(connection):
+            self.assertTrue(connection.cancelled.wait(5))
+
+    def test_unwatched_connection_is_not_cancelled(self):
+        connection = _Connection()
+
+        with Deadline(50).watch(connection):
+            pass
+
+        time.sleep(0.1)
+        self.assertFalse(connection.cancelled.is_set())
+
+    def test_deadlines_are_served_in_order(self):
+        late = _Connection()
+        early = _Connection()
+
+        with Deadline(10000).watch(late):
+            with Deadline(20).watch(early):
+                self.assertTrue(early.cancelled.wait(5))
+                self.assertFalse(late.cancelled.is_set())
+
+if __name__ == '__main__':
+    unittest.main()
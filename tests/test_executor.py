@@ -0,0 +1,181 @@
+import json
+import unittest
+
+import shapely.geometry
+import shapely.wkb
+
+from publicamundi.data.api import *
+from publicamundi.data.api.base import _ByteBudget
+
+def create_fields(*fields):
+    return dict([(name, { 'is_geom' : is_geom }) for name, is_geom in fields])
+
+def to_hex(geometry):
+    return shapely.wkb.dumps(geometry, hex=True)
+
+class DecodeRowsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = QueryExecutor()
+        self.point = shapely.geometry.Point(1, 2)
+
+    def test_geojson(self):
+        columns = ['name', 'the_geom', 'pop']
+        fields = create_fields(('name', False), ('pop', False), ('the_geom', True))
+
+        features = self.executor.decode_rows([('a', to_hex(self.point), 1), ('b', None, 2)], columns, fields, QUERY_FORMAT_GEOJSON)
+
+        self.assertEqual([f.to_dict() for f in features], [{
+            'id' : 1,
+            'type' : 'Feature',
+            'properties' : { 'name' : 'a', 'pop' : 1 },
+            'geometry' : self.point
+        }, {
+            'id' : 2,
+            'type' : 'Feature',
+            'properties' : { 'name' : 'b', 'pop' : 2 },
+            'geometry' : None
+        }])
+        self.assertEqual(features[0]['properties'], { 'name' : 'a', 'pop' : 1 })
+        self.assertEqual(features[0]['type'], 'Feature')
+
+    def test_json(self):
+        columns = ['the_geom', 'name', QUERY_COUNT_COLUMN]
+        fields = create_fields(('name', False), ('the_geom', True))
+
+        records = self.executor.decode_rows([(to_hex(self.point), 'a', 10), (None, None, 10)], columns, fields, QUERY_FORMAT_JSON)
+
+        self.assertEqual([r.to_dict() for r in records], [{ 'name' : 'a', 'the_geom' : self.point }, { 'name' : None, 'the_geom' : None }])
+        self.assertEqual(records[0]['name'], 'a')
+        self.assertNotIn(QUERY_COUNT_COLUMN, records[0])
+        self.assertRaises(KeyError, lambda: records[0][QUERY_COUNT_COLUMN])
+
+    def test_single_field(self):
+        records = self.executor.decode_rows([('a', ), ('b', )], ['name'], create_fields(('name', False)), QUERY_FORMAT_JSON)
+
+        self.assertEqual([r.to_dict() for r in records], [{ 'name' : 'a' }, { 'name' : 'b' }])
+
+    def test_encoding(self):
+        columns = ['name', 'the_geom']
+        fields = create_fields(('name', False), ('the_geom', True))
+
+        features = self.executor.decode_rows([('a', to_hex(self.point))], columns, fields, QUERY_FORMAT_GEOJSON)
+
+        self.assertEqual(
+            json.loads(json.dumps(features, cls=ShapelyGeoJsonEncoder)),
+            [{ 'id' : 1, 'type' : 'Feature', 'properties' : { 'name' : 'a' }, 'geometry' : { 'type' : 'Point', 'coordinates' : [1.0, 2.0] } }]
+        )
+
+    def test_deadline(self):
+        rows = [('a', )] * 10
+
+        self.assertRaises(QueryTimeoutException, self.executor.decode_rows, rows, ['name'], create_fields(('name', False)), QUERY_FORMAT_JSON, None, Deadline(0))
+
+class MergeRowsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = QueryExecutor()
+        self.columns = ['name', 'pop', 'area']
+
+    def merge(self, rows, sort, offset=0, limit=MAX_RESULT_ROWS):
+        result = self.executor._merge_rows(list(rows), self.columns, sort, offset, limit)
+
+        self.assertEqual(result.keys(), self.columns)
+
+        return result.rows
+
+    def test_sort(self):
+        rows = [('a', 3, 1.0), ('b', 1, 2.0), ('c', 2, 3.0)]
+
+        self.assertEqual(self.merge(rows, [('pop', False)]), [('b', 1, 2.0), ('c', 2, 3.0), ('a', 3, 1.0)])
+        self.assertEqual(self.merge(rows, [('pop', True)]), [('a', 3, 1.0), ('c', 2, 3.0), ('b', 1, 2.0)])
+
+    def test_sort_by_several_fields(self):
+        rows = [('a', 1, 2.0), ('b', 2, 1.0), ('c', 1, 1.0), ('d', 2, 2.0)]
+
+        self.assertEqual([r[0] for r in self.merge(rows, [('pop', False), ('area', True)])], ['a', 'c', 'd', 'b'])
+
+    def test_nulls_are_last(self):
+        rows = [('a', None, 1.0), ('b', 1, 1.0), ('c', 2, 1.0)]
+
+        self.assertEqual([r[0] for r in self.merge(rows, [('pop', False)])], ['b', 'c', 'a'])
+        self.assertEqual([r[0] for r in self.merge(rows, [('pop', True)])], ['a', 'c', 'b'])
+
+    def test_paging(self):
+        rows = [(str(i), i, 0.0) for i in range(10)]
+
+        self.assertEqual([r[1] for r in self.merge(reversed(rows), [('pop', False)], 3, 4)], [3, 4, 5, 6])
+        self.assertEqual(self.merge(rows, [('pop', False)], 20, 4), [])
+
+    def test_rows_are_not_deduplicated(self):
+        rows = [('a', 1, 1.0), ('a', 1, 1.0)]
+
+        self.assertEqual(self.merge(rows, []), rows)
+
+class ByteBudgetTestCase(unittest.TestCase):
+
+    def test_unlimited(self):
+        budget = _ByteBudget(0)
+
+        self.assertFalse(budget.is_enforced())
+        self.assertTrue(budget.consume(10 ** 9))
+
+    def test_limit(self):
+        budget = _ByteBudget(100)
+
+        self.assertTrue(budget.consume(60))
+        self.assertFalse(budget.consume(60))
+        self.assertTrue(budget.exceeded)
+        self.assertFalse(budget.parent_exceeded)
+        # Sizes that do not fit are not consumed
+        self.assertEqual(budget.used, 60)
+
+    def test_parent(self):
+        parent = _ByteBudget(100)
+        first = _ByteBudget(0, parent)
+        second = _ByteBudget(0, parent)
+
+        self.assertTrue(first.is_enforced())
+        self.assertTrue(first.consume(80))
+        self.assertFalse(second.consume(40))
+        self.assertTrue(second.parent_exceeded)
+
+        first.release()
+
+        self.assertEqual(parent.used, 0)
+        self.assertTrue(second.consume(40))
+
+class LimitRowsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = QueryExecutor()
+        self.columns = ['name', 'the_geom', QUERY_COUNT_COLUMN]
+        self.fields = create_fields(('name', False), ('the_geom', True))
+        self.rows = []
+        for index in range(100):
+            line = shapely.geometry.LineString([(2000000 + index * 10.123456789, 4000000 + k * 7.987654321) for k in range(20)])
+            self.rows.append((u'feature {index}'.format(index = index), to_hex(line), 100))
+
+    def test_estimate_is_not_less_than_encoded_size(self):
+        for output_format in [QUERY_FORMAT_GEOJSON, QUERY_FORMAT_JSON]:
+            budget = _ByteBudget(10 ** 9)
+
+            items = self.executor.decode_rows(self.rows, self.columns, self.fields, output_format, budget)
+            size = len(json.dumps(items, cls=ShapelyGeoJsonEncoder))
+
+            self.assertEqual(len(items), len(self.rows))
+            self.assertGreaterEqual(budget.used, size)
+            self.assertLess(budget.used, size * 1.25)
+
+    def test_decoding_stops_at_budget(self):
+        budget = _ByteBudget(5000)
+
+        items = self.executor.decode_rows(self.rows, self.columns, self.fields, QUERY_FORMAT_GEOJSON, budget)
+
+        self.assertTrue(budget.exceeded)
+        self.assertGreater(len(items), 0)
+        self.assertLess(len(items), len(self.rows))
+        self.assertLessEqual(len(json.dumps(items, cls=ShapelyGeoJsonEncoder)), 5000)
+
+if __name__ == '__main__':
+    unittest.main()
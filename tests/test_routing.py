@@ -0,0 +1,120 @@
+import unittest
+
+from publicamundi.data.api import *
+
+class ParseReplicasTestCase(unittest.TestCase):
+
+    def test_single_connection_string(self):
+        self.assertEqual(parse_replicas('postgresql://host/db'), (('postgresql://host/db', 1), ))
+
+    def test_connection_string_per_line(self):
+        replicas = parse_replicas('\n  postgresql://host1/db\n\n  postgresql://host2/db;weight=3\n')
+
+        self.assertEqual(replicas, (('postgresql://host1/db', 1), ('postgresql://host2/db', 3)))
+
+    def test_list(self):
+        replicas = parse_replicas([
+            'postgresql://host1/db',
+            { 'url' : 'postgresql://host2/db', 'weight' : 2 },
+            ('postgresql://host3/db', 4)
+        ])
+
+        self.assertEqual(replicas, (('postgresql://host1/db', 1), ('postgresql://host2/db', 2), ('postgresql://host3/db', 4)))
+
+    def test_dictionary(self):
+        self.assertEqual(parse_replicas({ 'url' : 'postgresql://host/db' }), (('postgresql://host/db', 1), ))
+
+    def test_empty(self):
+        self.assertRaises(DataException, parse_replicas, '')
+        self.assertRaises(DataException, parse_replicas, [])
+        self.assertRaises(DataException, parse_replicas, None)
+
+    def test_invalid_weight(self):
+        self.assertRaises(DataException, parse_replicas, 'postgresql://host/db;weight=0')
+        self.assertRaises(DataException, parse_replicas, 'postgresql://host/db;weight=many')
+        self.assertRaises(DataException, parse_replicas, [{ 'url' : 'postgresql://host/db', 'weight' : -1 }])
+
+    def test_unsupported_source(self):
+        self.assertRaises(DataException, parse_replicas, [1])
+
+class ReplicaRouterTestCase(unittest.TestCase):
+
+    def create_router(self, replicas, **config):
+        config.setdefault(CONFIG_ROUTING_HEALTH_INTERVAL, 3600000)
+
+        return ReplicaRouter(replicas, lambda url: url, config)
+
+    def test_unsupported_policy(self):
+        self.assertRaises(DataException, self.create_router, 'postgresql://host/db', **{ CONFIG_ROUTING_POLICY : 'random' })
+
+    def test_weighted_round_robin(self):
+        router = self.create_router(['a;weight=2', 'b'], **{ CONFIG_ROUTING_POLICY : ROUTING_POLICY_ROUND_ROBIN })
+
+        selected = []
+        for i in range(6):
+            replica = router.acquire()
+            selected.append(replica.url)
+            router.release(replica)
+
+        self.assertEqual(selected.count('a'), 4)
+        self.assertEqual(selected.count('b'), 2)
+        # Selections of the same replica are interleaved
+        self.assertNotEqual(selected[:2], ['a', 'a'])
+
+    def test_least_outstanding(self):
+        router = self.create_router(['a', 'b'])
+
+        first = router.acquire()
+        second = router.acquire()
+
+        self.assertNotEqual(first.url, second.url)
+
+        router.release(first)
+        third = router.acquire()
+
+        self.assertEqual(third.url, first.url)
+
+    def test_exclude(self):
+        router = self.create_router(['a', 'b'])
+
+        replica = router.acquire()
+        other = router.acquire([replica])
+
+        self.assertNotEqual(replica.url, other.url)
+        self.assertIsNone(router.acquire([replica, other]))
+
+    def test_ejection(self):
+        router = self.create_router(['a', 'b'], **{ CONFIG_ROUTING_EJECT_FAILURES : 2 })
+
+        a = [r for r in router.replicas if r.url == 'a'][0]
+
+        for i in range(2):
+            a.outstanding += 1
+            router.release(a, True)
+
+        self.assertTrue(a.is_ejected())
+
+        # Ejected replicas are selected only if every other replica is excluded
+        for i in range(4):
+            replica = router.acquire()
+            self.assertEqual(replica.url, 'b')
+            router.release(replica)
+
+        replica = router.acquire([router.replicas[1]])
+        self.assertEqual(replica.url, 'a')
+
+    def test_success_resets_failures(self):
+        router = self.create_router(['a'], **{ CONFIG_ROUTING_EJECT_FAILURES : 2 })
+
+        replica = router.acquire()
+        router.release(replica, True)
+        replica = router.acquire()
+        router.release(replica)
+        replica = router.acquire()
+        router.release(replica, True)
+
+        self.assertFalse(replica.is_ejected())
+        self.assertEqual(router.health()[0]['failures'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
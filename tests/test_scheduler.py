@@ -0,0 +1,154 @@
+import threading
+import time
+import unittest
+
+from publicamundi.data.api import *
+
+LIGHT_QUERY = { 'queue' : [{ 'resources' : ['a'] }] }
+NORMAL_QUERY = { 'queue' : [{ 'resources' : ['a', 'b'] }] }
+HEAVY_QUERY = { 'queue' : [{ 'resources' : ['a', 'b', 'c'] }] }
+
+class _Scheduler(QueryScheduler):
+
+    # Waits until a number of queries are queued
+    def wait_queued(self, count):
+        for i in range(1000):
+            with self.condition:
+                if len(self.waiting) >= count:
+                    return
+            time.sleep(0.005)
+
+        raise AssertionError('Queries are not queued.')
+
+class QuerySchedulerTestCase(unittest.TestCase):
+
+    def create_scheduler(self, **config):
+        config.setdefault(CONFIG_SCHEDULER_QUEUE_TIMEOUT, 0)
+
+        return _Scheduler(config)
+
+    def test_classify(self):
+        scheduler = self.create_scheduler()
+
+        self.assertEqual(scheduler.classify(LIGHT_QUERY), PRIORITY_LIGHT)
+        self.assertEqual(scheduler.classify(NORMAL_QUERY), PRIORITY_NORMAL)
+        self.assertEqual(scheduler.classify(HEAVY_QUERY), PRIORITY_HEAVY)
+        self.assertEqual(scheduler.classify({ 'queue' : [{
+            'resources' : ['a', 'b'],
+            'filters' : [{ 'operator' : OP_INTERSECTS, 'arguments' : [{ 'resource' : 'a', 'name' : 'g' }, { 'resource' : 'b', 'name' : 'g' }] }]
+        }] }), PRIORITY_HEAVY)
+        self.assertEqual(scheduler.classify('malformed'), PRIORITY_LIGHT)
+
+    def test_global_limit(self):
+        scheduler = self.create_scheduler(**{ CONFIG_SCHEDULER_MAX_CONCURRENCY : 2 })
+
+        first = scheduler.acquire('a', LIGHT_QUERY)
+        scheduler.acquire('b', LIGHT_QUERY)
+
+        self.assertRaises(QueryRejectedException, scheduler.acquire, 'c', LIGHT_QUERY)
+
+        scheduler.release(first)
+        scheduler.acquire('c', LIGHT_QUERY)
+
+    def test_client_limit(self):
+        scheduler = self.create_scheduler(**{ CONFIG_SCHEDULER_MAX_CLIENT_CONCURRENCY : 1 })
+
+        scheduler.acquire('a', LIGHT_QUERY)
+
+        self.assertRaises(QueryRejectedException, scheduler.acquire, 'a', LIGHT_QUERY)
+
+        scheduler.acquire('b', LIGHT_QUERY)
+        # Queries without a client are only subject to the global limits
+        scheduler.acquire(None, LIGHT_QUERY)
+        scheduler.acquire(None, LIGHT_QUERY)
+
+    def test_heavy_limit(self):
+        scheduler = self.create_scheduler(**{ CONFIG_SCHEDULER_MAX_CONCURRENCY : 4 })
+
+        scheduler.acquire('a', HEAVY_QUERY)
+        scheduler.acquire('b', HEAVY_QUERY)
+
+        self.assertRaises(QueryRejectedException, scheduler.acquire, 'c', HEAVY_QUERY)
+
+        scheduler.acquire('c', LIGHT_QUERY)
+
+    def test_queue_limit(self):
+        scheduler = self.create_scheduler(**{
+            CONFIG_SCHEDULER_MAX_CONCURRENCY : 1,
+            CONFIG_SCHEDULER_MAX_QUEUE : 1,
+            CONFIG_SCHEDULER_QUEUE_TIMEOUT : 10000
+        })
+
+        ticket = scheduler.acquire('a', LIGHT_QUERY)
+
+        thread = threading.Thread(target=lambda: scheduler.release(scheduler.acquire('b', LIGHT_QUERY)))
+        thread.start()
+        scheduler.wait_queued(1)
+
+        self.assertRaises(QueryRejectedException, scheduler.acquire, 'c', LIGHT_QUERY)
+
+        scheduler.release(ticket)
+        thread.join()
+
+    def test_queue_timeout(self):
+        scheduler = self.create_scheduler(**{ CONFIG_SCHEDULER_MAX_CONCURRENCY : 1, CONFIG_SCHEDULER_QUEUE_TIMEOUT : 50 })
+
+        scheduler.acquire('a', LIGHT_QUERY)
+
+        start = time.time()
+        self.assertRaises(QueryRejectedException, scheduler.acquire, 'b', LIGHT_QUERY)
+        self.assertGreaterEqual(time.time() - start, 0.04)
+        self.assertEqual(len(scheduler.waiting), 0)
+
+    def test_priority_order(self):
+        scheduler = self.create_scheduler(**{ CONFIG_SCHEDULER_MAX_CONCURRENCY : 1, CONFIG_SCHEDULER_QUEUE_TIMEOUT : 10000 })
+
+        ticket = scheduler.acquire('a', LIGHT_QUERY)
+
+        granted = []
+        lock = threading.Lock()
+
+        def execute(client, query):
+            t = scheduler.acquire(client, query)
+            with lock:
+                granted.append(client)
+            scheduler.release(t)
+
+        threads = []
+        for index, (client, query) in enumerate([('heavy', HEAVY_QUERY), ('normal', NORMAL_QUERY), ('light', LIGHT_QUERY)]):
+            thread = threading.Thread(target=execute, args=(client, query))
+            thread.start()
+            threads.append(thread)
+            scheduler.wait_queued(index + 1)
+
+        scheduler.release(ticket)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(granted, ['light', 'normal', 'heavy'])
+
+    def test_blocked_client_does_not_block_others(self):
+        scheduler = self.create_scheduler(**{
+            CONFIG_SCHEDULER_MAX_CONCURRENCY : 2,
+            CONFIG_SCHEDULER_MAX_CLIENT_CONCURRENCY : 1,
+            CONFIG_SCHEDULER_QUEUE_TIMEOUT : 10000
+        })
+
+        first = scheduler.acquire('a', LIGHT_QUERY)
+
+        thread = threading.Thread(target=lambda: scheduler.release(scheduler.acquire('a', LIGHT_QUERY)))
+        thread.start()
+        scheduler.wait_queued(1)
+
+        # The queued query of client a is blocked by its client limit only
+        second = scheduler.acquire('b', NORMAL_QUERY)
+
+        scheduler.release(second)
+        scheduler.release(first)
+        thread.join()
+
+        self.assertEqual(scheduler.running, 0)
+        self.assertEqual(scheduler.running_clients, {})
+
+if __name__ == '__main__':
+    unittest.main()
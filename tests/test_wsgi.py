@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import json
+import StringIO
+import threading
+import unittest
+import zlib
+
+from publicamundi.data.api import *
+from publicamundi.data.api.wsgi import _accepts_gzip
+
+# Executor that writes rows of a single property to the writer of the request, or fails
+class _Executor(object):
+
+    def __init__(self, rows=3, items=2, output_format=QUERY_FORMAT_JSON, error=None):
+        self.rows = rows
+        self.items = items
+        self.output_format = output_format
+        self.error = error
+        self.aborted = threading.Event()
+
+    def execute(self, config, query, metadata, client, writer):
+        if not self.error is None:
+            raise self.error
+
+        try:
+            for index in range(self.items):
+                writer.begin(self.output_format, CRS_DEFAULT_OUTPUT)
+                for row in range(self.rows):
+                    writer.write({ 'index' : row, 'name' : u'όνομα' })
+                writer.end()
+        except DataException:
+            self.aborted.set()
+            raise
+
+        return {
+            'data' : [],
+            'count' : [None] * self.items,
+            'continuation' : [None] * self.items,
+            'crs' : CRS_DEFAULT_OUTPUT,
+            'metadata' : {},
+            'format' : self.output_format
+        }
+
+class QueryApplicationTestCase(unittest.TestCase):
+
+    def call(self, executor, accept_encoding=None, method='POST', body='{}', chunk_size=64):
+        application = QueryApplication({ CONFIG_WSGI_CHUNK_SIZE : chunk_size }, executor)
+
+        environ = {
+            'REQUEST_METHOD' : method,
+            'CONTENT_LENGTH' : str(len(body)),
+            'wsgi.input' : StringIO.StringIO(body)
+        }
+        if not accept_encoding is None:
+            environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        response['body'] = application(environ, start_response)
+
+        return response
+
+    def read(self, response):
+        body = ''.join(response['body'])
+        if response['headers'].get('Content-Encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+        return json.loads(body)
+
+    def test_json(self):
+        response = self.call(_Executor(rows = 50))
+
+        self.assertEqual(response['status'], '200 OK')
+
+        result = self.read(response)
+
+        self.assertEqual(len(result['data']), 2)
+        self.assertEqual(result['data'][1][49], { 'index' : 49, 'name' : u'όνομα' })
+        self.assertEqual(result['count'], [None, None])
+
+    def test_geojson(self):
+        result = self.read(self.call(_Executor(output_format = QUERY_FORMAT_GEOJSON)))
+
+        collection = result['data'][0]
+
+        self.assertEqual(collection['type'], 'FeatureCollection')
+        self.assertEqual(collection['crs']['properties']['name'], 'urn:ogc:def:crs:EPSG::3857')
+        self.assertEqual(len(collection['features']), 3)
+
+    def test_empty(self):
+        self.assertEqual(self.read(self.call(_Executor(rows = 0)))['data'], [[], []])
+        self.assertEqual(self.read(self.call(_Executor(items = 0)))['data'], [])
+
+    def test_gzip(self):
+        response = self.call(_Executor(rows = 100), 'deflate, gzip')
+
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(len(self.read(response)['data'][0]), 100)
+
+    def test_gzip_not_acceptable(self):
+        response = self.call(_Executor(), 'gzip;q=0, deflate')
+
+        self.assertNotIn('Content-Encoding', response['headers'])
+        self.assertEqual(response['headers']['Vary'], 'Accept-Encoding')
+
+    def test_errors(self):
+        for error, status in [
+            (QueryTimeoutException('Timeout.'), '504 Gateway Timeout'),
+            (QueryRejectedException('Rejected.'), '503 Service Unavailable'),
+            (ResultTooLargeException('Too large.'), '413 Request Entity Too Large'),
+            (InternalException('Internal.', None), '500 Internal Server Error'),
+            (ValueError('Unhandled.'), '500 Internal Server Error'),
+            (DataException('Invalid.'), '400 Bad Request')
+        ]:
+            response = self.call(_Executor(error = error))
+
+            self.assertEqual(response['status'], status)
+            self.assertIn('message', self.read(response))
+
+        response = self.call(_Executor(error = QueryRejectedException('Rejected.')))
+        self.assertEqual(response['headers']['Retry-After'], '1')
+
+    def test_invalid_request(self):
+        self.assertEqual(self.call(_Executor(), method = 'GET')['status'], '405 Method Not Allowed')
+        self.assertEqual(self.call(_Executor(), body = '{')['status'], '400 Bad Request')
+
+    def test_closing_response_aborts_query(self):
+        executor = _Executor(rows = 100000)
+
+        response = self.call(executor, chunk_size = 1024)
+
+        next(iter(response['body']))
+        response['body'].close()
+
+        self.assertTrue(executor.aborted.wait(10))
+
+class AcceptEncodingTestCase(unittest.TestCase):
+
+    def test_accepts_gzip(self):
+        self.assertTrue(_accepts_gzip('gzip'))
+        self.assertTrue(_accepts_gzip('deflate, gzip;q=0.5'))
+        self.assertTrue(_accepts_gzip('GZIP; Q=1'))
+        self.assertTrue(_accepts_gzip('x-gzip'))
+        self.assertTrue(_accepts_gzip('*'))
+
+    def test_rejects_gzip(self):
+        self.assertFalse(_accepts_gzip(None))
+        self.assertFalse(_accepts_gzip(''))
+        self.assertFalse(_accepts_gzip('identity'))
+        self.assertFalse(_accepts_gzip('gzip;q=0'))
+        self.assertFalse(_accepts_gzip('gzip;q=0.000'))
+        self.assertFalse(_accepts_gzip('*, gzip;q=0'))
+        self.assertFalse(_accepts_gzip('gzip;q=invalid'))
+
+if __name__ == '__main__':
+    unittest.main()